@@ -0,0 +1,256 @@
+"""
+Synthetic Facebook Ads Library corpus generator.
+
+Produces deterministic raw ad records covering every shape that
+normalize_ad_record accepts, so benchmarks and manual runs have realistic
+input at any size:
+
+    python benchmarks/corpus.py data/bench/100k.ndjson --count 100000
+"""
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+import argparse
+import gzip
+import random
+import sys
+import time
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from utils.helpers import json_dumps  # noqa: E402
+
+DEFAULT_IMAGE_HOST = "https://scontent.example.invalid"
+
+_PAGES = 2000
+_IMAGES = 50000
+_PLATFORMS = ["facebook", "instagram", "messenger", "audience_network"]
+_CTAS = ["Shop now", "Learn more", "Sign up", "Send WhatsApp message", "Book now", "Get offer"]
+_CATEGORIES = ["UNKNOWN", "POLITICAL", "HOUSING", "EMPLOYMENT", "CREDIT"]
+_COUNTRIES = ["US", "PK", "GB", "DE", "IN", "BR"]
+_WORDS = (
+    "salon discount offer today limited grand opening free delivery new "
+    "collection summer sale premium quality book appointment now best price"
+).split()
+
+_EPOCH_START = 1672531200  # 2023-01-01
+
+class CorpusGenerator:
+    """
+    Deterministic source of raw ad records.
+
+    The same ``seed`` always yields the same records. ``shapes`` restricts
+    generation to some of SHAPES, ``malformed_rate`` mixes in non-dict
+    entries and records without an id, and image URLs point at
+    ``image_host`` (e.g. the local stand-in server) with a per-record CDN
+    signature so the media store's URL normalization is exercised.
+    """
+
+    def __init__(
+        self,
+        seed: int = 0,
+        shapes: Optional[Sequence[str]] = None,
+        malformed_rate: float = 0.0,
+        image_host: str = DEFAULT_IMAGE_HOST,
+    ) -> None:
+        self.seed = seed
+        self.malformed_rate = malformed_rate
+        self.image_host = image_host.rstrip("/")
+        names = list(shapes or SHAPES)
+        unknown = [name for name in names if name not in SHAPES]
+        if unknown:
+            raise ValueError(f"Unknown corpus shapes {unknown}; expected any of {list(SHAPES)}.")
+        self._builders: List[Callable[["CorpusGenerator", random.Random, int], Any]] = [
+            SHAPES[name] for name in names
+        ]
+
+    def __iter__(self) -> Iterator[Any]:
+        return self.generate()
+
+    def generate(self, count: Optional[int] = None, start: int = 0) -> Iterator[Any]:
+        index = start
+        while count is None or index < start + count:
+            yield self.record(index)
+            index += 1
+
+    def record(self, index: int) -> Any:
+        rng = random.Random(self.seed * 1_000_003 + index)
+        if self.malformed_rate and rng.random() < self.malformed_rate:
+            return _malformed(rng, index)
+        builder = self._builders[index % len(self._builders)]
+        return builder(self, rng, index)
+
+    # Shared field values
+
+    def page(self, rng: random.Random) -> Dict[str, Any]:
+        page_id = rng.randrange(_PAGES)
+        return {
+            "id": str(100000000000000 + page_id),
+            "name": f"Page {page_id}",
+            "url": f"https://www.facebook.com/page{page_id}/",
+            "like_count": rng.randrange(0, 500000),
+        }
+
+    def text(self, rng: random.Random) -> str:
+        return " ".join(rng.choice(_WORDS) for _ in range(rng.randrange(8, 40)))
+
+    def image_urls(self, rng: random.Random, index: int) -> List[str]:
+        return [
+            f"{self.image_host}/img/{rng.randrange(_IMAGES)}.jpg?oh={index:x}{n}&oe=6700AA"
+            for n in range(rng.randrange(0, 4))
+        ]
+
+    def start_time(self, rng: random.Random) -> int:
+        return _EPOCH_START + rng.randrange(0, 700) * 86400
+
+def _ad_id(index: int) -> str:
+    return str(3800000000000000 + index)
+
+def _ads_library(gen: CorpusGenerator, rng: random.Random, index: int) -> Dict[str, Any]:
+    # Shape of the public Ads Library search results (flat page fields).
+    page = gen.page(rng)
+    start = gen.start_time(rng)
+    return {
+        "ad_archive_id": _ad_id(index),
+        "page_id": page["id"],
+        "page_name": page["name"],
+        "publisher_platform": [p.upper() for p in rng.sample(_PLATFORMS, rng.randrange(1, 4))],
+        "snapshot": {
+            "body": {"text": gen.text(rng)},
+            "cta_text": rng.choice(_CTAS),
+            "images": [{"original_image_url": url} for url in gen.image_urls(rng, index)],
+        },
+        "page_profile_uri": page["url"],
+        "page_like_count": page["like_count"],
+        "start_date": start,
+        "end_date": start + rng.randrange(1, 60) * 86400,
+        "categories": [rng.choice(_CATEGORIES)],
+    }
+
+def _graph_api(gen: CorpusGenerator, rng: random.Random, index: int) -> Dict[str, Any]:
+    # Graph API ads_archive: string body, ISO dates, reached countries.
+    page = gen.page(rng)
+    start = gen.start_time(rng)
+    return {
+        "id": _ad_id(index),
+        "page_id": page["id"],
+        "page_name": page["name"],
+        "ad_delivery_start_time": _iso(start),
+        "ad_delivery_stop_time": _iso(start + 86400 * rng.randrange(1, 30)),
+        "publisher_platforms": rng.sample(_PLATFORMS, rng.randrange(1, 3)),
+        "ad_reached_countries": rng.sample(_COUNTRIES, rng.randrange(1, 3)),
+        "snapshot": {
+            "body": gen.text(rng),
+            "cta": {"title": rng.choice(_CTAS)},
+            "images": [{"url": url} for url in gen.image_urls(rng, index)],
+        },
+    }
+
+def _proxy_nested_page(gen: CorpusGenerator, rng: random.Random, index: int) -> Dict[str, Any]:
+    # Proxy backends: nested page object, placement, creatives instead of images.
+    page = gen.page(rng)
+    return {
+        "id": _ad_id(index),
+        "page": page,
+        "placement": {"platforms": rng.sample(_PLATFORMS, rng.randrange(1, 3))},
+        "ad_delivery_start_time": gen.start_time(rng),
+        "ad_text": gen.text(rng),
+        "cta": {"title": rng.choice(_CTAS)},
+        "creatives": [
+            {rng.choice(["image_url", "thumbnail_url", "media_url"]): url}
+            for url in gen.image_urls(rng, index)
+        ],
+        "categories": rng.choice(_CATEGORIES),
+    }
+
+def _legacy(gen: CorpusGenerator, rng: random.Random, index: int) -> Dict[str, Any]:
+    # Older exports: alternate id keys, message bodies, string platform.
+    page = gen.page(rng)
+    return {
+        rng.choice(["adid", "ad_id"]): _ad_id(index),
+        "page": {"id": page["id"], "name": page["name"], "link": page["url"], "fan_count": page["like_count"]},
+        "publisher_platform": rng.choice(_PLATFORMS),
+        "placement": {"publisher_platform": rng.choice(_PLATFORMS)},
+        "start_date": _iso(gen.start_time(rng)),
+        "snapshot": {
+            "body": {"message": gen.text(rng)},
+            "cta": rng.choice(_CTAS),
+            "images": [{"original_image_url": url} for url in gen.image_urls(rng, index)],
+        },
+        "message": gen.text(rng),
+    }
+
+def _malformed(rng: random.Random, index: int) -> Any:
+    choice = rng.randrange(3)
+    if choice == 0:
+        return None
+    if choice == 1:
+        return f"not an ad {index}"
+    return {"snapshot": {"body": "no id"}, "page": "not a dict"}
+
+def _iso(epoch: int) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S+0000", time.gmtime(epoch))
+
+SHAPES: Dict[str, Callable[[CorpusGenerator, random.Random, int], Any]] = {
+    "ads_library": _ads_library,
+    "graph_api": _graph_api,
+    "proxy_nested_page": _proxy_nested_page,
+    "legacy": _legacy,
+}
+
+def write_corpus(path: Path, records: Iterator[Any]) -> int:
+    """
+    Write records to ``path`` as NDJSON (.ndjson/.jsonl) or a JSON array
+    (anything else), gzip-compressed when the name ends in .gz. Returns the
+    number of records written.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    name = path.name.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    ndjson = name.endswith((".ndjson", ".jsonl"))
+    opener = gzip.open if path.name.lower().endswith(".gz") else open
+
+    count = 0
+    with opener(path, "wb") as f:
+        if not ndjson:
+            f.write(b"[")
+        for record in records:
+            if not ndjson:
+                f.write(b",\n" if count else b"\n")
+            f.write(json_dumps(record))
+            if ndjson:
+                f.write(b"\n")
+            count += 1
+        if not ndjson:
+            f.write(b"\n]\n")
+    return count
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate a synthetic raw ads corpus.")
+    parser.add_argument("output", help="Output path (.json, .ndjson or .jsonl, optionally .gz).")
+    parser.add_argument("--count", type=int, default=1000, help="Number of records.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--shapes",
+        default=",".join(SHAPES),
+        help=f"Comma-separated raw shapes to mix (default: all of {', '.join(SHAPES)}).",
+    )
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--image-host", default=DEFAULT_IMAGE_HOST)
+    args = parser.parse_args(argv)
+
+    generator = CorpusGenerator(
+        seed=args.seed,
+        shapes=[s for s in args.shapes.split(",") if s],
+        malformed_rate=args.malformed_rate,
+        image_host=args.image_host,
+    )
+    count = write_corpus(Path(args.output), generator.generate(args.count))
+    print(f"Wrote {count} records to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+Local stand-in for a Facebook Ads Library compatible backend and its image
+CDN, for benchmarks and offline testing of live mode:
+
+    python benchmarks/fake_api.py --port 8765 --ads-per-query 1000
+
+GET /ads?q=&country=&limit=&after=   pages of synthetic raw ads with
+                                     ``paging.cursors.after``/``next``
+GET /img/<n>.jpg                     deterministic image bytes with an ETag,
+                                     honouring If-None-Match
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlencode, urlsplit
+import argparse
+import hashlib
+import sys
+import threading
+import time
+import zlib
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from corpus import CorpusGenerator  # noqa: E402
+from utils.helpers import json_dumps  # noqa: E402
+
+class FakeAdsApi:
+    """
+    Threaded HTTP server serving a deterministic corpus.
+
+    Every (q, country) query has ``ads_per_query`` records drawn from its
+    own slice of the corpus; ``latency`` seconds are added to every ads
+    page and a quarter of that to every image. Use as a context manager to
+    run it on a background thread for the duration of a benchmark.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        ads_per_query: int = 1000,
+        latency: float = 0.0,
+        image_size: int = 32 * 1024,
+        seed: int = 0,
+    ) -> None:
+        self.ads_per_query = ads_per_query
+        self.latency = latency
+        self.image_size = image_size
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self.host, self.port = self._server.server_address[:2]
+        self.generator = CorpusGenerator(seed=seed, image_host=self.base_url)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.base_url}/ads"
+
+    def _handler_class(self) -> type:
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                with api._lock:
+                    api.requests += 1
+                url = urlsplit(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                if url.path == "/ads":
+                    api._serve_ads(self, params)
+                elif url.path.startswith("/img/"):
+                    api._serve_image(self, url.path)
+                else:
+                    self._send(404, b"not found", "text/plain")
+
+            def _send(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def _serve_ads(self, handler: Any, params: Dict[str, str]) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        query, country = params.get("q", ""), params.get("country", "")
+        limit = max(1, min(int(params.get("limit", 25)), 500))
+        after = int(params.get("after", 0))
+        end = min(after + limit, self.ads_per_query)
+
+        # Each query reads its own, stable slice of the corpus.
+        offset = (zlib.crc32(f"{query}|{country}".encode("utf-8")) % 1000) * 1_000_000
+        payload: Dict[str, Any] = {"data": list(self.generator.generate(max(0, end - after), offset + after))}
+        if end < self.ads_per_query:
+            next_params = dict(params, limit=limit, after=end)
+            payload["paging"] = {
+                "cursors": {"after": str(end)},
+                "next": f"{self.api_url}?{urlencode(next_params)}",
+            }
+        handler._send(200, json_dumps(payload), "application/json")
+
+    def _serve_image(self, handler: Any, path: str) -> None:
+        etag = '"' + hashlib.sha1(path.encode("utf-8")).hexdigest() + '"'
+        if handler.headers.get("If-None-Match") == etag:
+            handler._send(304, b"", "image/jpeg", {"ETag": etag})
+            return
+        if self.latency:
+            time.sleep(self.latency / 4)
+        seed = hashlib.sha256(path.encode("utf-8")).digest()
+        body = (seed * (self.image_size // len(seed) + 1))[: self.image_size]
+        handler._send(200, body, "image/jpeg", {"ETag": etag})
+
+    def start(self) -> "FakeAdsApi":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ads-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "FakeAdsApi":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Serve a fake Ads Library API and image host.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ads-per-query", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every ads page.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    api = FakeAdsApi(args.host, args.port, args.ads_per_query, args.latency, seed=args.seed)
+    print(f"Serving fake ads API at {api.api_url}")
+    try:
+        api._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api._server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
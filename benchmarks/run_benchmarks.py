@@ -0,0 +1,330 @@
+"""
+Repeatable performance benchmarks for the scraper pipeline.
+
+    python benchmarks/run_benchmarks.py --sizes 1000,100000
+    python benchmarks/run_benchmarks.py --sizes 1000000 --only offline
+    python benchmarks/run_benchmarks.py --baseline benchmarks/results/main.json
+
+Each benchmark is run ``--repeat`` times on a synthetic corpus and the best
+wall time is kept. Results (with throughput and, for end-to-end runs, the
+peak RSS of the scraper process) are written as JSON to ``--output``. With
+``--baseline`` every result is compared with the matching result of an
+earlier run and the exit status is 1 if anything got slower than
+``--threshold``.
+"""
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import argparse
+import datetime
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(BENCH_DIR))
+
+from corpus import CorpusGenerator, write_corpus  # noqa: E402
+from fake_api import FakeAdsApi  # noqa: E402
+from utils.helpers import (  # noqa: E402
+    RecordWriter,
+    json_backend,
+    json_dumps,
+    load_json_file,
+    save_json_file,
+    setup_logging,
+)
+from utils.json_stream import iter_json_records  # noqa: E402
+from extractors.ad_parser import normalize_ad_record, parse_ads  # noqa: E402
+from extractors.field_schema import SchemaNormalizer, load_field_mapping  # noqa: E402
+from extractors.media_handler import download_media_assets  # noqa: E402
+
+DEFAULT_SIZES = "1000,100000"
+GROUPS = ("normalize", "json", "offline", "live", "media")
+
+# Network-bound benchmarks are capped so a 1M run stays practical.
+LIVE_MAX_RECORDS = 100_000
+MEDIA_MAX_ADS = 2_000
+
+# Timings below this are dominated by noise and never flagged.
+MIN_COMPARABLE_SECONDS = 0.05
+
+class Bench:
+    """
+    Collects timings and writes the results document.
+    """
+
+    def __init__(self, repeat: int, workdir: Path) -> None:
+        self.repeat = max(1, repeat)
+        self.workdir = workdir
+        self.results: List[Dict[str, Any]] = []
+
+    def measure(
+        self,
+        name: str,
+        size: int,
+        func: Callable[[], Optional[Dict[str, Any]]],
+        setup: Optional[Callable[[], None]] = None,
+        repeat: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        runs = []
+        extra: Dict[str, Any] = {}
+        for _ in range(repeat or self.repeat):
+            if setup is not None:
+                setup()
+            started = time.perf_counter()
+            extra = func() or {}
+            runs.append(time.perf_counter() - started)
+        best = min(runs)
+        result = {
+            "name": name,
+            "size": size,
+            "seconds": round(best, 6),
+            "runs": [round(r, 6) for r in runs],
+            "records_per_second": round(size / best, 1) if best > 0 else None,
+        }
+        result.update(extra)
+        self.results.append(result)
+        print(f"{name:<32} {size:>9,} records  {best:9.3f}s  {result['records_per_second'] or 0:>12,.0f} rec/s")
+        return result
+
+def _corpus(size: int) -> List[Any]:
+    return list(CorpusGenerator(seed=size, malformed_rate=0.001).generate(size))
+
+def bench_normalize(bench: Bench, size: int, raw: List[Any]) -> None:
+    schema = load_field_mapping(ROOT / "src" / "config" / "field_mapping.json")
+    bench.measure("normalize.generic", size, lambda: _count(parse_ads(raw)))
+    bench.measure(
+        "normalize.field_mapping", size, lambda: _count(parse_ads(raw, normalize=SchemaNormalizer(schema)))
+    )
+    dicts = [r for r in raw if isinstance(r, dict)]
+    bench.measure("normalize.record", size, lambda: {"ads": sum(1 for r in dicts if normalize_ad_record(r))})
+
+def _count(ads: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"ads": len(ads)}
+
+def bench_json(bench: Bench, size: int, raw: List[Any]) -> None:
+    ads = parse_ads(raw)
+    pretty = bench.workdir / f"ads-{size}.json"
+    compact = bench.workdir / f"ads-{size}.compact.json"
+    lines = bench.workdir / f"ads-{size}.ndjson"
+
+    def write_ndjson() -> None:
+        with RecordWriter(lines, fmt="ndjson") as writer:
+            for ad in ads:
+                writer.write(ad)
+
+    bench.measure("json.save_pretty", size, lambda: save_json_file(pretty, ads) or _size_of(pretty))
+    bench.measure("json.save_compact", size, lambda: save_json_file(compact, ads, pretty=False) or _size_of(compact))
+    bench.measure("json.write_ndjson", size, lambda: write_ndjson() or _size_of(lines))
+    bench.measure("json.load", size, lambda: {"ads": len(load_json_file(pretty))})
+    bench.measure("json.stream_array", size, lambda: {"ads": sum(1 for _ in iter_json_records(pretty))})
+    bench.measure("json.stream_ndjson", size, lambda: {"ads": sum(1 for _ in iter_json_records(lines))})
+
+def _size_of(path: Path) -> Dict[str, Any]:
+    return {"bytes": path.stat().st_size}
+
+# Runs main.py in-process and reports the child's own peak RSS on exit.
+# ru_maxrss cannot be used from the parent: on Linux it carries over the
+# parent's memory high-water mark across fork and exec.
+_SCRAPER_WRAPPER = """
+import atexit, runpy, sys
+
+def _report_peak_rss():
+    try:
+        with open("/proc/self/status") as f:
+            kib = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        import resource
+        kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            kib //= 1024
+    sys.stderr.write("\\n%s %d\\n" % ("PEAK_RSS_KIB", kib))
+
+atexit.register(_report_peak_rss)
+sys.argv = ["main.py"] + sys.argv[1:]
+runpy.run_path("main.py", run_name="__main__")
+"""
+
+def _run_scraper(args: List[str]) -> Dict[str, Any]:
+    """
+    Run src/main.py in a child process and report its peak RSS.
+    """
+    process = subprocess.run(
+        [sys.executable, "-c", _SCRAPER_WRAPPER, *args],
+        cwd=str(ROOT / "src"),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    stderr = process.stderr.decode("utf-8", "replace")
+    if process.returncode != 0:
+        raise RuntimeError(f"main.py {' '.join(args)} failed:\n{stderr[-2000:]}")
+    peak = [line.split()[1] for line in stderr.splitlines() if line.startswith("PEAK_RSS_KIB ")]
+    return {"peak_rss_mb": round(int(peak[-1]) / 1024, 1)} if peak else {}
+
+def _write_config(path: Path, settings: Dict[str, Any]) -> Path:
+    base = {"field_mapping_path": str(ROOT / "src" / "config" / "field_mapping.json")}
+    path.write_bytes(json_dumps(dict(base, **settings), pretty=True))
+    return path
+
+def bench_offline(bench: Bench, size: int, corpus_path: Path) -> None:
+    config = _write_config(bench.workdir / "offline.json", {"max_items": size})
+    out = bench.workdir / f"offline-{size}"
+    common = ["--config", str(config), "--offline-input", str(corpus_path)]
+    bench.measure("offline.batch_json", size, lambda: _run_scraper(common + ["--output", f"{out}.json"]))
+    bench.measure(
+        "offline.stream_ndjson", size, lambda: _run_scraper(common + ["--stream", "--output", f"{out}.ndjson"])
+    )
+
+def bench_live(bench: Bench, size: int) -> None:
+    size = min(size, LIVE_MAX_RECORDS)
+    terms, countries = ["salon", "barber"], ["US", "PK"]
+    per_query = -(-size // (len(terms) * len(countries)))
+    state = bench.workdir / "live-state"
+    with FakeAdsApi(ads_per_query=per_query) as api:
+        config = _write_config(
+            bench.workdir / "live.json",
+            {
+                "live_mode": True,
+                "api_url": api.api_url,
+                "search_terms": terms,
+                "countries": countries,
+                "max_items": per_query,
+                "page_size": 100,
+                "requests_per_second": 0,
+                "http_cache_dir": str(state / "http"),
+            },
+        )
+        output = bench.workdir / f"live-{size}.ndjson"
+        bench.measure(
+            "live.stream_ndjson",
+            per_query * len(terms) * len(countries),
+            lambda: _run_scraper(["--config", str(config), "--stream", "--output", str(output)]),
+        )
+
+def bench_media(bench: Bench, size: int) -> None:
+    size = min(size, MEDIA_MAX_ADS)
+    with FakeAdsApi() as api:
+        raw = list(CorpusGenerator(seed=size, shapes=["ads_library"], image_host=api.base_url).generate(size))
+        ads = parse_ads(raw)
+        images = sum(len(ad["snapshot"]["images"]) for ad in ads)
+        media_dir = bench.workdir / f"media-{size}"
+
+        def reset() -> None:
+            shutil.rmtree(media_dir, ignore_errors=True)
+
+        def download() -> Dict[str, Any]:
+            stats = download_media_assets(ads, media_dir, workers=16)
+            return {"images": images, "downloaded": stats.downloaded, "failed": stats.failed}
+
+        bench.measure("media.download_cold", size, download, setup=reset)
+        bench.measure("media.download_warm", size, download)
+
+def compare(results: List[Dict[str, Any]], baseline_path: Path, threshold: float) -> int:
+    baseline = {
+        (r["name"], r["size"]): r for r in load_json_file(baseline_path).get("results", [])
+    }
+    regressions = 0
+    print(f"\nCompared with {baseline_path} (threshold {threshold:.0%}):")
+    for result in results:
+        before = baseline.get((result["name"], result["size"]))
+        if before is None or not before.get("seconds"):
+            continue
+        ratio = result["seconds"] / before["seconds"]
+        flag = ""
+        if max(result["seconds"], before["seconds"]) < MIN_COMPARABLE_SECONDS:
+            flag = "  (too short to compare)"
+        elif ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{result['name']:<32} {result['size']:>9,}  {before['seconds']:9.3f}s -> {result['seconds']:9.3f}s  x{ratio:.2f}{flag}")
+    return 1 if regressions else 0
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT), capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _sizes(text: str) -> Iterator[int]:
+    for part in text.split(","):
+        part = part.strip().lower().replace("_", "")
+        if not part:
+            continue
+        multiplier = 1
+        if part.endswith("k"):
+            multiplier, part = 1000, part[:-1]
+        elif part.endswith("m"):
+            multiplier, part = 1_000_000, part[:-1]
+        yield int(float(part) * multiplier)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run scraper performance benchmarks.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated corpus sizes, e.g. 1k,100k,1m.")
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"Comma-separated groups from {', '.join(GROUPS)}.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark; the best time is kept.")
+    parser.add_argument("--output", default=str(BENCH_DIR / "results" / "latest.json"))
+    parser.add_argument("--baseline", default=None, help="Earlier results file to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown before flagging (0.2 = 20%%).")
+    parser.add_argument("--workdir", default=None, help="Scratch directory (default: a temporary directory).")
+    args = parser.parse_args(argv)
+    # Malformed corpus records are skipped with a warning on every run.
+    setup_logging(logging.ERROR)
+
+    groups = [g for g in args.only.split(",") if g]
+    unknown = [g for g in groups if g not in GROUPS]
+    if unknown:
+        parser.error(f"unknown benchmark groups {unknown}")
+
+    with tempfile.TemporaryDirectory(prefix="ads-bench-") as tmp:
+        workdir = Path(args.workdir or tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        bench = Bench(args.repeat, workdir)
+
+        for size in _sizes(args.sizes):
+            print(f"\n== {size:,} records ==")
+            raw = _corpus(size) if {"normalize", "json"} & set(groups) else []
+            if "normalize" in groups:
+                bench_normalize(bench, size, raw)
+            if "json" in groups:
+                bench_json(bench, size, raw)
+            del raw
+            if "offline" in groups:
+                corpus_path = workdir / f"corpus-{size}.ndjson"
+                write_corpus(corpus_path, CorpusGenerator(seed=size, malformed_rate=0.001).generate(size))
+                bench_offline(bench, size, corpus_path)
+            if "live" in groups:
+                bench_live(bench, size)
+            if "media" in groups:
+                bench_media(bench, size)
+
+    document = {
+        "meta": {
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "json_backend": json_backend(),
+            "repeat": args.repeat,
+        },
+        "results": bench.results,
+    }
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    save_json_file(output, document)
+    print(f"\nWrote {len(bench.results)} results to {output}")
+
+    if args.baseline:
+        return compare(bench.results, Path(args.baseline), args.threshold)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+from pathlib import Path
+from typing import Any, Dict
+import argparse
+import collections
+import logging
+import sqlite3
+import sys
+import time
+
+from extractors.ad_archive import AdArchive, ArchiveQuery
+from utils.helpers import json_dumps
+from utils.json_stream import iter_json_records
+
+LOGGER = logging.getLogger(__name__)
+
+def _open_archive(settings: Dict[str, Any], args: argparse.Namespace) -> AdArchive:
+    path = Path(args.archive_path) if args.archive_path else Path(settings["archive_path"])
+    return AdArchive(path)
+
+def query_archive(args: argparse.Namespace, settings: Dict[str, Any]) -> int:
+    """
+    Print the archived ads matching the command-line filters to stdout, one
+    JSON document per line, or just their number with ``--count``.
+    """
+    query = ArchiveQuery(
+        page_id=args.page_id,
+        platform=args.platform,
+        category=args.category,
+        cta_text=args.cta,
+        text=args.text,
+        start_after=args.start_after,
+        start_before=args.start_before,
+        end_after=args.end_after,
+        end_before=args.end_before,
+        active=args.active,
+    )
+    started = time.perf_counter()
+    archive = _open_archive(settings, args)
+    out = sys.stdout.buffer
+    try:
+        if args.count:
+            count = archive.count(query)
+            out.write(f"{count}\n".encode("ascii"))
+        else:
+            count = 0
+            for count, ad in enumerate(
+                archive.search(query, limit=args.limit or None, offset=args.offset), start=1
+            ):
+                out.write(json_dumps(ad))
+                out.write(b"\n")
+        out.flush()
+    except sqlite3.OperationalError as err:
+        LOGGER.error("Archive query failed: %s", err)
+        return 1
+    finally:
+        archive.close()
+    LOGGER.info("%d ads matched in %.1f ms.", count, (time.perf_counter() - started) * 1000)
+    return 0
+
+def ingest_files(args: argparse.Namespace, settings: Dict[str, Any]) -> int:
+    """
+    Add the ads in earlier JSON/NDJSON outputs to the archive.
+    """
+    status = 0
+    with _open_archive(settings, args) as archive:
+        for name in args.files:
+            path = Path(name)
+            try:
+                collections.deque(archive.ingest(iter_json_records(path)), maxlen=0)
+            except (OSError, ValueError) as err:
+                LOGGER.error("Could not ingest %s: %s", path, err)
+                status = 1
+        LOGGER.info("Archive %s: %s", archive.path, archive.stats())
+    return status
@@ -0,0 +1,129 @@
+from pathlib import Path
+from typing import Any, Dict
+import argparse
+import logging
+import signal
+
+from extractors.pipeline import run_pipeline, write_metrics
+from utils.helpers import json_dumps, load_json_file
+from utils.http_client import ApiClient
+from utils.metrics import Metrics, use_metrics, write_text_atomic
+from utils.scheduler import JobScheduler, ScheduledJob
+from utils.settings import finalize_settings, job_path, read_raw_settings
+from utils.validators import validate_jobs
+
+LOGGER = logging.getLogger(__name__)
+
+def build_job_settings(
+    raw: Dict[str, Any],
+    job: Dict[str, Any],
+    project_root: Path,
+) -> Dict[str, Any]:
+    """
+    Settings for one daemon job: the config file overlaid with the job's
+    overrides. Jobs that do not name their own output, state, run report or
+    Prometheus textfile paths get the shared ones with the job name
+    inserted, so concurrent jobs never write to the same file.
+    """
+    overrides = job["settings"]
+    if "output_format" not in overrides and ("output_path" in overrides or "output" in overrides):
+        # Let a job's output extension pick its format, as --output does.
+        raw = {k: v for k, v in raw.items() if k != "output_format"}
+    settings = finalize_settings(dict(raw, **overrides), project_root)
+    name = job["name"]
+    if "output_path" not in overrides and "output" not in overrides:
+        settings["output_path"] = job_path(settings["output_path"], name)
+    if "state_path" not in overrides:
+        settings["state_path"] = job_path(settings["state_path"], name)
+    if settings["metrics_report"] and "metrics_report" not in overrides:
+        settings["metrics_report"] = job_path(settings["metrics_report"], name)
+    if settings["prometheus_textfile"] and "prometheus_textfile" not in overrides:
+        settings["prometheus_textfile"] = job_path(settings["prometheus_textfile"], name)
+    return settings
+
+def serve(args: argparse.Namespace, project_root: Path) -> int:
+    """
+    Run the scrape jobs from a jobs file on their schedules until SIGTERM
+    or SIGINT (or, with ``--once``, until each has run once).
+
+    The process stays warm between runs: live requests from every job share
+    one ApiClient, so keep-alive connections, the HTTP cache, rate limits
+    and circuit breakers carry over, and compiled field mappings are
+    reused. Connection and retry settings come from the config file; jobs
+    override what to scrape and where to write it. Each run of a job gets
+    its own metrics, written to the job's run report and Prometheus
+    textfile (labelled with the job name) when it finishes; job status is
+    written to the status file on every change.
+    """
+    jobs_path = Path(args.jobs) if args.jobs else project_root / "src" / "config" / "jobs.example.json"
+    try:
+        config = validate_jobs(load_json_file(jobs_path))
+    except (OSError, ValueError) as err:
+        LOGGER.error("Could not load jobs file %s: %s", jobs_path, err)
+        return 1
+    if not config["jobs"]:
+        LOGGER.error("No valid jobs in %s.", jobs_path)
+        return 1
+    LOGGER.info("Loaded %d job(s) from %s", len(config["jobs"]), jobs_path)
+
+    raw = read_raw_settings(args.config, project_root)
+    base = finalize_settings(raw, project_root)
+    max_jobs = max(1, args.max_concurrent_jobs or config["max_concurrent_jobs"])
+    status_path = Path(args.status_file or config["status_path"])
+    if not status_path.is_absolute():
+        status_path = project_root / status_path
+
+    jobs = [
+        ScheduledJob(
+            name=job["name"],
+            interval=job["interval_seconds"],
+            payload=build_job_settings(raw, job, project_root),
+            priority=job["priority"],
+            jitter=job["jitter"],
+        )
+        for job in config["jobs"]
+    ]
+    pool_size = max(job.payload["max_concurrency"] for job in jobs) * max_jobs
+    client = ApiClient.from_settings(base, pool_size=pool_size)
+
+    def run_job(job: ScheduledJob) -> int:
+        status = 1
+        # Jobs run concurrently, so each records into its own registry.
+        with use_metrics(Metrics()) as metrics:
+            try:
+                status = run_pipeline(job.payload, client)
+            finally:
+                write_metrics(job.payload, metrics, status, job=job.name)
+        return status
+
+    def publish_status(scheduler: JobScheduler) -> None:
+        write_text_atomic(status_path, json_dumps(scheduler.snapshot(), pretty=True).decode("utf-8"))
+
+    scheduler = JobScheduler(
+        jobs,
+        run_job,
+        max_concurrent=max_jobs,
+        on_change=publish_status,
+        max_runs=1 if args.once else None,
+        initial_splay=0.0 if args.once else None,
+    )
+
+    def handle_signal(signum: int, frame: Any) -> None:
+        LOGGER.info("Received %s; finishing running jobs before exiting.", signal.Signals(signum).name)
+        scheduler.stop()
+
+    previous = {sig: signal.signal(sig, handle_signal) for sig in (signal.SIGTERM, signal.SIGINT)}
+    try:
+        publish_status(scheduler)
+        scheduler.run()
+        publish_status(scheduler)
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+        client.close()
+
+    failed = [name for name, status in scheduler.status.items() if status.last_status]
+    if args.once and failed:
+        LOGGER.error("Jobs failed: %s", ", ".join(failed))
+        return 1
+    return 0
@@ -0,0 +1,175 @@
+from pathlib import Path
+from typing import Any, Dict, List
+import argparse
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+
+from extractors.live_fetcher import build_queries, date_windows
+from extractors.pipeline import run_pipeline, write_metrics
+from utils.columnar import path_segment
+from utils.http_client import ApiClient
+from utils.metrics import reset_metrics
+from utils.settings import job_path
+from utils.work_queue import Shard, WorkQueue
+
+LOGGER = logging.getLogger(__name__)
+
+def plan_shards(settings: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Split the query space into shards: one per search term, country and
+    date window (``shard_window_days`` days of ``date_min``..``date_max``).
+    """
+    windows = date_windows(settings["date_min"], settings["date_max"], settings["shard_window_days"])
+    shards = []
+    for term, country in build_queries(settings["search_terms"], settings["countries"]):
+        for date_min, date_max in windows:
+            payload = {
+                "search_term": term,
+                "country": country,
+                "date_min": date_min or "",
+                "date_max": date_max or "",
+            }
+            key = "|".join((term, country, date_min or "", date_max or ""))
+            shards.append({"key": key, "payload": payload})
+    return shards
+
+def _open_queue(settings: Dict[str, Any], args: argparse.Namespace) -> WorkQueue:
+    path = Path(args.queue) if args.queue else Path(settings["queue_path"])
+    return WorkQueue(path, max_attempts=settings["shard_max_attempts"])
+
+def coordinate(args: argparse.Namespace, settings: Dict[str, Any]) -> int:
+    """
+    Queue one shard per search term x country x date window. Shards already
+    queued are left alone, so re-running the coordinator after widening the
+    configuration only adds the new ones.
+    """
+    if args.window_days is not None:
+        settings["shard_window_days"] = max(0, int(args.window_days))
+    queue = _open_queue(settings, args)
+    try:
+        if args.retry_failed:
+            LOGGER.info("Requeued %d failed shards.", queue.retry_failed())
+        if not args.status:
+            shards = plan_shards(settings)
+            added = queue.enqueue(shards)
+            LOGGER.info(
+                "Planned %d shards; queued %d new ones in %s.", len(shards), added, queue.path
+            )
+        LOGGER.info("Queue %s: %s", queue.path, queue.summary())
+    finally:
+        queue.close()
+    return 0
+
+def shard_output_path(output_path: str, shard: Shard) -> Path:
+    """
+    Where a worker writes ``shard``: Hive-style partition directories under
+    the configured output path without its extension, e.g.
+    ``data/output/country=PK/search_term=salon/part-00007.json``. The path
+    only depends on the shard, so a retried shard overwrites its own
+    partial output.
+    """
+    base = Path(output_path)
+    root = base.with_suffix("") if base.suffix else base
+    payload = shard.payload
+    parts = [
+        f"country={path_segment(payload['country'])}",
+        f"search_term={path_segment(payload['search_term'])}",
+    ]
+    if payload["date_min"] or payload["date_max"]:
+        parts.append(f"date={path_segment(payload['date_min'])}_{path_segment(payload['date_max'])}")
+    return root.joinpath(*parts, f"part-{shard.shard_id:05d}{base.suffix}")
+
+def shard_settings(settings: Dict[str, Any], shard: Shard) -> Dict[str, Any]:
+    payload = shard.payload
+    settings = dict(
+        settings,
+        search_terms=[payload["search_term"]],
+        countries=[payload["country"]],
+        date_min=payload["date_min"],
+        date_max=payload["date_max"],
+        # The shard already is one partition.
+        partition_by=[],
+    )
+    settings["output_path"] = str(shard_output_path(settings["output_path"], shard))
+    settings["state_path"] = job_path(settings["state_path"], f"shard-{shard.shard_id:05d}")
+    if settings["metrics_report"]:
+        settings["metrics_report"] = job_path(settings["metrics_report"], f"{os.getpid()}")
+    return settings
+
+def work(args: argparse.Namespace, settings: Dict[str, Any]) -> int:
+    """
+    Lease shards from the queue and run each through fetch -> normalize ->
+    write until the queue is drained (or forever with ``--wait``). Start
+    one worker process per core or node to scale out; they coordinate only
+    through the queue. Leases are renewed while a shard runs, so a crashed
+    worker's shard is picked up by another one once its lease expires.
+    SIGTERM and SIGINT finish the current shard, then exit.
+    """
+    if not settings["live_mode"] or not settings["api_url"]:
+        LOGGER.error("Workers fetch from the live API; enable live_mode and set api_url.")
+        return 1
+
+    owner = args.worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    lease_seconds = settings["lease_seconds"]
+    queue = _open_queue(settings, args)
+    client = ApiClient.from_settings(settings)
+    stop = threading.Event()
+
+    def handle_signal(signum: int, frame: Any) -> None:
+        LOGGER.info("Received %s; exiting after the current shard.", signal.Signals(signum).name)
+        stop.set()
+
+    previous = {sig: signal.signal(sig, handle_signal) for sig in (signal.SIGTERM, signal.SIGINT)}
+    LOGGER.info("Worker %s leasing shards from %s", owner, queue.path)
+    done = failed = 0
+    try:
+        while not stop.is_set():
+            if args.max_shards is not None and done + failed >= args.max_shards:
+                break
+            shard = queue.lease(owner, lease_seconds)
+            if shard is None:
+                if not args.wait and not queue.outstanding():
+                    break
+                # Other workers hold the rest; wait in case a lease expires.
+                stop.wait(max(0.1, args.poll_interval))
+                continue
+
+            LOGGER.info("Leased shard %s (attempt %d).", shard.key, shard.attempts)
+            run_settings = shard_settings(settings, shard)
+            started = time.monotonic()
+            metrics = reset_metrics()
+            status = 1
+            try:
+                with queue.hold(shard, owner, lease_seconds):
+                    status = run_pipeline(run_settings, client, offline_fallback=False)
+            finally:
+                write_metrics(run_settings, metrics, status)
+            if status == 0:
+                result = {
+                    "output_path": run_settings["output_path"],
+                    "worker": owner,
+                    "seconds": round(time.monotonic() - started, 3),
+                }
+                # A shard whose lease was lost is finished by its new owner.
+                if queue.complete(shard, owner, result):
+                    done += 1
+            else:
+                queue.fail(shard, owner, f"run exited with status {status} on {owner}")
+                failed += 1
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+        client.close()
+        LOGGER.info(
+            "Worker %s finished %d shards (%d failed). Queue: %s",
+            owner,
+            done + failed,
+            failed,
+            queue.summary(),
+        )
+        queue.close()
+    return 1 if failed else 0
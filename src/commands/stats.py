@@ -0,0 +1,47 @@
+from pathlib import Path
+import argparse
+import logging
+import sys
+import time
+
+from extractors.ad_columns import AdColumns, filter_ads, summarize
+from utils.helpers import json_dumps
+from utils.json_stream import iter_json_records
+
+LOGGER = logging.getLogger(__name__)
+
+def summarize_files(args: argparse.Namespace) -> int:
+    """
+    Load the ads of the given files into columns and print their summary
+    (counts per platform and category, date range, page-like statistics,
+    top pages) after the command-line filters.
+    """
+    started = time.perf_counter()
+    try:
+        columns = AdColumns()
+    except RuntimeError as err:
+        LOGGER.error("%s", err)
+        return 1
+    status = 0
+    for name in args.files:
+        path = Path(name)
+        try:
+            columns.extend(iter_json_records(path))
+        except (OSError, ValueError) as err:
+            LOGGER.error("Could not read %s: %s", path, err)
+            status = 1
+    table = filter_ads(
+        columns.finish(),
+        start_after=args.start_after,
+        start_before=args.start_before,
+        end_after=args.end_after,
+        end_before=args.end_before,
+        platform=args.platform,
+        category=args.category,
+    )
+    out = sys.stdout.buffer
+    out.write(json_dumps(summarize(table, top=args.top), pretty=True))
+    out.write(b"\n")
+    out.flush()
+    LOGGER.info("Summarized %d ads in %.2fs.", table.num_rows, time.perf_counter() - started)
+    return status
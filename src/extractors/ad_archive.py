@@ -0,0 +1,285 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import datetime
+import logging
+import sqlite3
+import time
+
+from extractors.ad_record import expand_ad
+from extractors.state_store import DELTA_FIELD
+from utils.columnar import partition_date
+from utils.helpers import json_dumps, json_loads
+from utils.metrics import pipeline_stage
+
+LOGGER = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ads (
+    id INTEGER PRIMARY KEY,
+    ad_archive_id TEXT NOT NULL UNIQUE,
+    page_id TEXT,
+    page_name TEXT,
+    cta_text TEXT COLLATE NOCASE,
+    start_date TEXT,
+    end_date TEXT,
+    status TEXT NOT NULL DEFAULT 'active',
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    record BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ads_page ON ads (page_id);
+CREATE INDEX IF NOT EXISTS ads_cta ON ads (cta_text);
+CREATE INDEX IF NOT EXISTS ads_start ON ads (start_date);
+CREATE INDEX IF NOT EXISTS ads_end ON ads (end_date);
+CREATE TABLE IF NOT EXISTS ad_platforms (
+    platform TEXT NOT NULL COLLATE NOCASE,
+    ad INTEGER NOT NULL,
+    PRIMARY KEY (platform, ad)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ad_platforms_ad ON ad_platforms (ad);
+CREATE TABLE IF NOT EXISTS ad_categories (
+    category TEXT NOT NULL COLLATE NOCASE,
+    ad INTEGER NOT NULL,
+    PRIMARY KEY (category, ad)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ad_categories_ad ON ad_categories (ad);
+CREATE VIRTUAL TABLE IF NOT EXISTS ads_fts USING fts5 (body, tokenize = 'unicode61 remove_diacritics 2');
+"""
+
+def _str_or_none(value: Any) -> Optional[str]:
+    if value is None or value == "":
+        return None
+    return value if isinstance(value, str) else str(value)
+
+def _str_list(value: Any) -> List[str]:
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value if v is not None and v != ""]
+    if value is None or value == "":
+        return []
+    return [str(value)]
+
+@dataclass
+class ArchiveQuery:
+    """
+    Filters for AdArchive.search(); every one that is set must match.
+
+    ``platform``, ``category`` and ``cta_text`` match case-insensitively,
+    ``text`` is an FTS5 query over the ad body (words, "phrases", prefix*,
+    AND/OR/NOT), date bounds are inclusive ``YYYY-MM-DD`` strings and
+    ``active`` keeps ads not reported ended whose end date, if any, is not
+    in the past.
+    """
+
+    page_id: Optional[str] = None
+    platform: Optional[str] = None
+    category: Optional[str] = None
+    cta_text: Optional[str] = None
+    text: Optional[str] = None
+    start_after: Optional[str] = None
+    start_before: Optional[str] = None
+    end_after: Optional[str] = None
+    end_before: Optional[str] = None
+    active: bool = False
+    today: str = field(default_factory=lambda: datetime.date.today().isoformat())
+
+    def where(self) -> Tuple[str, List[Any]]:
+        clauses: List[str] = []
+        params: List[Any] = []
+        if self.page_id:
+            clauses.append("a.page_id = ?")
+            params.append(str(self.page_id))
+        if self.platform:
+            clauses.append("EXISTS (SELECT 1 FROM ad_platforms p WHERE p.platform = ? AND p.ad = a.id)")
+            params.append(self.platform)
+        if self.category:
+            clauses.append("EXISTS (SELECT 1 FROM ad_categories c WHERE c.category = ? AND c.ad = a.id)")
+            params.append(self.category)
+        if self.cta_text:
+            clauses.append("a.cta_text = ?")
+            params.append(self.cta_text)
+        if self.text:
+            clauses.append("a.id IN (SELECT rowid FROM ads_fts WHERE ads_fts MATCH ?)")
+            params.append(self.text)
+        for column, op, value in (
+            ("start_date", ">=", self.start_after),
+            ("start_date", "<=", self.start_before),
+            ("end_date", ">=", self.end_after),
+            ("end_date", "<=", self.end_before),
+        ):
+            if value:
+                clauses.append(f"a.{column} {op} ?")
+                params.append(value)
+        if self.active:
+            clauses.append("a.status = 'active' AND (a.end_date IS NULL OR a.end_date >= ?)")
+            params.append(self.today)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+class AdArchive:
+    """
+    Persistent SQLite archive of every normalized ad seen across runs, for
+    answering questions about them without rescanning run outputs.
+
+    Ads are upserted by ``ad_archive_id``: the latest version of the record
+    is kept along with when it was first and last seen. Page, CTA and
+    start/end dates (as ``YYYY-MM-DD``) are indexed columns, platforms and
+    categories live in indexed side tables and the body text is in an FTS5
+    index. ``ended`` delta stubs from incremental runs mark their ad ended.
+    Writes are committed in batches of ``batch_size`` ads so several runs
+    can feed the same archive concurrently.
+    """
+
+    def __init__(self, path: Path, batch_size: int = 1000) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = max(1, int(batch_size))
+        self._conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _upsert(self, ad: Dict[str, Any], now: float) -> None:
+        conn = self._conn
+        ad_archive_id = _str_or_none(ad.get("ad_archive_id"))
+        if ad_archive_id is None:
+            return
+        if ad.get(DELTA_FIELD) == "ended":
+            conn.execute(
+                "UPDATE ads SET status = 'ended', last_seen = ? WHERE ad_archive_id = ?",
+                (now, ad_archive_id),
+            )
+            return
+
+        record = dict(ad)
+        record.pop(DELTA_FIELD, None)
+        payload = json_dumps(record)
+        row = conn.execute(
+            "SELECT id, record FROM ads WHERE ad_archive_id = ?", (ad_archive_id,)
+        ).fetchone()
+        if row is not None and row[1] == payload:
+            conn.execute(
+                "UPDATE ads SET status = 'active', last_seen = ? WHERE id = ?", (now, row[0])
+            )
+            return
+
+        snapshot = record.get("snapshot")
+        snapshot = snapshot if isinstance(snapshot, dict) else {}
+        body = snapshot.get("body")
+        text = body.get("text") if isinstance(body, dict) else body
+        columns = (
+            _str_or_none(record.get("page_id")),
+            _str_or_none(record.get("page_name")),
+            _str_or_none(snapshot.get("cta_text")),
+            partition_date(record.get("start_date")),
+            partition_date(record.get("end_date")),
+            now,
+            payload,
+        )
+        if row is None:
+            cursor = conn.execute(
+                "INSERT INTO ads (ad_archive_id, page_id, page_name, cta_text, start_date, "
+                "end_date, first_seen, last_seen, record) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (ad_archive_id,) + columns[:5] + (now,) + columns[5:],
+            )
+            ad_id = cursor.lastrowid
+        else:
+            ad_id = row[0]
+            conn.execute(
+                "UPDATE ads SET page_id = ?, page_name = ?, cta_text = ?, start_date = ?, "
+                "end_date = ?, status = 'active', last_seen = ?, record = ? WHERE id = ?",
+                columns + (ad_id,),
+            )
+            conn.execute("DELETE FROM ad_platforms WHERE ad = ?", (ad_id,))
+            conn.execute("DELETE FROM ad_categories WHERE ad = ?", (ad_id,))
+            conn.execute("DELETE FROM ads_fts WHERE rowid = ?", (ad_id,))
+
+        conn.executemany(
+            "INSERT OR IGNORE INTO ad_platforms (platform, ad) VALUES (?, ?)",
+            [(platform, ad_id) for platform in _str_list(record.get("publisher_platform"))],
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO ad_categories (category, ad) VALUES (?, ?)",
+            [(category, ad_id) for category in _str_list(record.get("categories"))],
+        )
+        if text:
+            conn.execute("INSERT INTO ads_fts (rowid, body) VALUES (?, ?)", (ad_id, str(text)))
+
+    def _write_batch(self, ads: Sequence[Dict[str, Any]]) -> None:
+        conn = self._conn
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for ad in ads:
+                self._upsert(ad, now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @pipeline_stage("archive")
+    def ingest(self, ads: Iterable[Any]) -> Iterator[Any]:
+        """
+        Pass ads through unchanged, archiving them on the way. Compact
+        AdRecords are expanded for archiving; anything that is not an ad
+        with an id is ignored.
+        """
+        batch: List[Dict[str, Any]] = []
+        count = 0
+        try:
+            for ad in ads:
+                record = expand_ad(ad)
+                if isinstance(record, dict):
+                    batch.append(record)
+                    if len(batch) >= self.batch_size:
+                        self._write_batch(batch)
+                        count += len(batch)
+                        batch = []
+                yield ad
+        finally:
+            # Whatever was handed out before a failure is still archived.
+            if batch:
+                self._write_batch(batch)
+                count += len(batch)
+            LOGGER.info("Archived %d ads in %s.", count, self.path)
+
+    def search(
+        self,
+        query: ArchiveQuery,
+        limit: Optional[int] = 100,
+        offset: int = 0,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Matching ads, most recently started first.
+        """
+        where, params = query.where()
+        sql = (
+            "SELECT a.record FROM ads a" + where
+            + " ORDER BY a.start_date IS NULL, a.start_date DESC, a.ad_archive_id"
+        )
+        if limit is not None or offset:
+            # SQLite only takes OFFSET after a LIMIT; -1 means no limit.
+            sql += " LIMIT ? OFFSET ?"
+            params = params + [-1 if limit is None else int(limit), max(0, int(offset))]
+        for (record,) in self._conn.execute(sql, params):
+            yield json_loads(record)
+
+    def count(self, query: ArchiveQuery) -> int:
+        where, params = query.where()
+        return int(self._conn.execute("SELECT COUNT(*) FROM ads a" + where, params).fetchone()[0])
+
+    def stats(self) -> Dict[str, int]:
+        conn = self._conn
+        ads, active = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(status = 'active'), 0) FROM ads"
+        ).fetchone()
+        pages = conn.execute("SELECT COUNT(DISTINCT page_id) FROM ads").fetchone()[0]
+        return {"ads": int(ads), "active": int(active), "pages": int(pages)}
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "AdArchive":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
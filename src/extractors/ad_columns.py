@@ -0,0 +1,308 @@
+from array import array
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+import functools
+import logging
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    pc = None
+
+from extractors.ad_parser import extract_ad_archive_id, extract_categories, extract_publisher_platforms
+from extractors.ad_record import AdRecord
+from utils.columnar import as_int64, epoch_seconds, require_pyarrow
+from utils.metrics import pipeline_stage
+
+LOGGER = logging.getLogger(__name__)
+
+def _as_str(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    return value if isinstance(value, str) else str(value)
+
+class _IntColumn:
+    """
+    Nullable int64 values in a flat C array plus a byte-per-row validity
+    mask, turned into one Arrow array without touching Python objects.
+    """
+
+    def __init__(self) -> None:
+        self.values = array("q")
+        self.valid = bytearray()
+
+    def append(self, value: Optional[int]) -> None:
+        if value is None:
+            self.values.append(0)
+            self.valid.append(0)
+        else:
+            self.values.append(value)
+            self.valid.append(1)
+
+    def finish(self, type_: Any) -> Any:
+        count = len(self.values)
+        values = pa.Array.from_buffers(pa.int64(), count, [None, pa.py_buffer(self.values)])
+        if count and self.valid.count(0):
+            mask = pa.Array.from_buffers(pa.uint8(), count, [None, pa.py_buffer(self.valid)])
+            values = pc.if_else(pc.not_equal(mask, 0), values, pa.scalar(None, pa.int64()))
+        self.values = array("q")
+        self.valid = bytearray()
+        return values.cast(type_)
+
+class _DictionaryListColumn:
+    """
+    list<dictionary<int32, string>> values built from int32 codes and
+    offsets. The dictionary is shared by every ad, so a platform is stored
+    as a string once per column however many ads list it.
+    """
+
+    def __init__(self) -> None:
+        self.dictionary: List[str] = []
+        self._codes_by_value: Dict[str, int] = {}
+        self.offsets = array("i", [0])
+        self.codes = array("i")
+
+    def append(self, items: Iterable[str]) -> None:
+        codes_by_value = self._codes_by_value
+        codes = self.codes
+        for item in items:
+            code = codes_by_value.get(item)
+            if code is None:
+                code = codes_by_value[item] = len(self.dictionary)
+                self.dictionary.append(item)
+            codes.append(code)
+        self.offsets.append(len(codes))
+
+    def finish(self) -> Any:
+        count = len(self.offsets) - 1
+        indices = pa.Array.from_buffers(pa.int32(), len(self.codes), [None, pa.py_buffer(self.codes)])
+        values = pa.DictionaryArray.from_arrays(indices, pa.array(self.dictionary, pa.string()))
+        offsets = pa.Array.from_buffers(pa.int32(), count + 1, [None, pa.py_buffer(self.offsets)])
+        self.offsets = array("i", [0])
+        self.codes = array("i")
+        return pa.ListArray.from_arrays(offsets, values)
+
+class AdColumns:
+    """
+    Columnar buffers filled straight from raw or normalized ads, for
+    filtering and aggregating millions of ads without holding a dict per ad.
+
+    append()/extend() read the same keys, with the same fallbacks, as
+    normalize_ad_record, so raw records of the generic input layouts and
+    already normalized ads give the same columns. Only the fields used for
+    analysis are kept: ids and page names as strings (page names
+    dictionary-encoded), ``page_like_count`` as int64, ``start_date`` and
+    ``end_date`` as UTC second timestamps (inputs may be epoch seconds,
+    milliseconds or ISO strings) and platforms and categories as lists of
+    dictionary-encoded strings. Integer columns live in C arrays and string
+    columns are moved into Arrow every ``chunk_size`` ads, so memory stays
+    near the size of the final table. Requires pyarrow.
+    """
+
+    def __init__(self, chunk_size: int = 65536) -> None:
+        require_pyarrow()
+        self.chunk_size = max(1, int(chunk_size))
+        self.count = 0
+        self._ids: List[Optional[str]] = []
+        self._page_ids: List[Optional[str]] = []
+        self._page_names: List[Optional[str]] = []
+        self._string_chunks: Dict[str, List[Any]] = {"ad_archive_id": [], "page_id": [], "page_name": []}
+        self._likes = _IntColumn()
+        self._starts = _IntColumn()
+        self._ends = _IntColumn()
+        self._platforms = _DictionaryListColumn()
+        self._categories = _DictionaryListColumn()
+
+    def append(self, ad: Any) -> None:
+        if isinstance(ad, AdRecord):
+            ad = ad.to_dict()
+        if not isinstance(ad, dict):
+            return
+        page = ad.get("page") or {}
+        if not isinstance(page, dict):
+            page = {}
+        self._ids.append(_as_str(extract_ad_archive_id(ad)))
+        self._page_ids.append(_as_str(ad.get("page_id") or page.get("id")))
+        self._page_names.append(_as_str(ad.get("page_name") or page.get("name")))
+        self._likes.append(
+            as_int64(ad.get("page_like_count") or page.get("like_count") or page.get("fan_count") or 0)
+        )
+        self._starts.append(epoch_seconds(ad.get("start_date") or ad.get("ad_delivery_start_time")))
+        self._ends.append(epoch_seconds(ad.get("end_date") or ad.get("ad_delivery_stop_time")))
+        self._platforms.append(extract_publisher_platforms(ad))
+        self._categories.append(extract_categories(ad))
+        self.count += 1
+        if len(self._ids) >= self.chunk_size:
+            self._flush_strings()
+
+    @pipeline_stage("normalize")
+    def extend(self, ads: Iterable[Any]) -> "AdColumns":
+        append = self.append
+        for ad in ads:
+            append(ad)
+        return self
+
+    def _flush_strings(self) -> None:
+        chunks = self._string_chunks
+        chunks["ad_archive_id"].append(pa.array(self._ids, pa.string()))
+        chunks["page_id"].append(pa.array(self._page_ids, pa.string()))
+        chunks["page_name"].append(pa.array(self._page_names, pa.string()))
+        self._ids, self._page_ids, self._page_names = [], [], []
+
+    def finish(self) -> Any:
+        """
+        The buffered ads as a pyarrow Table; the buffers are emptied.
+        """
+        self._flush_strings()
+        strings = {
+            name: pa.chunked_array(chunks, pa.string()).combine_chunks()
+            for name, chunks in self._string_chunks.items()
+        }
+        for chunks in self._string_chunks.values():
+            chunks.clear()
+        timestamp = pa.timestamp("s", tz="UTC")
+        table = pa.table(
+            {
+                "ad_archive_id": strings["ad_archive_id"],
+                "page_id": strings["page_id"],
+                "page_name": strings["page_name"].dictionary_encode(),
+                "page_like_count": self._likes.finish(pa.int64()),
+                "start_date": self._starts.finish(timestamp),
+                "end_date": self._ends.finish(timestamp),
+                "publisher_platform": self._platforms.finish(),
+                "categories": self._categories.finish(),
+            }
+        )
+        self.count = 0
+        return table
+
+def ad_columns(ads: Iterable[Any], chunk_size: int = 65536) -> Any:
+    """
+    Table of the analysis columns of ``ads`` (see AdColumns).
+    """
+    return AdColumns(chunk_size).extend(ads).finish()
+
+def _day_start(day: str) -> Any:
+    moment = datetime.combine(date.fromisoformat(day), datetime.min.time(), tzinfo=timezone.utc)
+    return pa.scalar(moment, pa.timestamp("s", tz="UTC"))
+
+def _day_end(day: str) -> Any:
+    # Exclusive upper bound, so the whole of ``day`` is included.
+    return _day_start((date.fromisoformat(day) + timedelta(days=1)).isoformat())
+
+def _rows_listing(column: Any, value: str) -> Any:
+    """
+    Boolean mask of the rows whose list ``column`` contains ``value``.
+    """
+    column = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    flat = pc.list_flatten(column)
+    if pa.types.is_dictionary(flat.type):
+        flat = flat.cast(pa.string())
+    rows = pc.filter(pc.list_parent_indices(column), pc.equal(flat, value))
+    return pc.is_in(pa.array(range(len(column)), pa.int64()), value_set=rows.cast(pa.int64()))
+
+def filter_ads(
+    table: Any,
+    start_after: Optional[str] = None,
+    start_before: Optional[str] = None,
+    end_after: Optional[str] = None,
+    end_before: Optional[str] = None,
+    platform: Optional[str] = None,
+    category: Optional[str] = None,
+) -> Any:
+    """
+    Rows of an ad_columns() table matching every filter given. Date bounds
+    are inclusive ``YYYY-MM-DD`` days in UTC; ads without the date never
+    match a bound on it. ``platform`` is matched upper-cased, the way
+    normalization stores it.
+    """
+    masks = []
+    if start_after:
+        masks.append(pc.greater_equal(table["start_date"], _day_start(start_after)))
+    if start_before:
+        masks.append(pc.less(table["start_date"], _day_end(start_before)))
+    if end_after:
+        masks.append(pc.greater_equal(table["end_date"], _day_start(end_after)))
+    if end_before:
+        masks.append(pc.less(table["end_date"], _day_end(end_before)))
+    if platform:
+        masks.append(_rows_listing(table["publisher_platform"], platform.upper()))
+    if category:
+        masks.append(_rows_listing(table["categories"], category))
+    if not masks:
+        return table
+    mask = functools.reduce(pc.and_kleene, masks)
+    return table.filter(pc.fill_null(mask, False))
+
+def value_counts(table: Any, column: str) -> Dict[str, int]:
+    """
+    Number of ads per value of a string or list-of-strings column, most
+    common first.
+    """
+    values = table[column]
+    if pa.types.is_list(values.type):
+        values = pa.chunked_array([pc.list_flatten(chunk) for chunk in values.chunks], values.type.value_type)
+    if pa.types.is_dictionary(values.type):
+        values = values.cast(pa.string())
+    counts = pc.value_counts(values)
+    pairs = [
+        (value, count)
+        for value, count in zip(counts.field("values").to_pylist(), counts.field("counts").to_pylist())
+        if value is not None
+    ]
+    pairs.sort(key=lambda item: (-item[1], item[0]))
+    return dict(pairs)
+
+def like_stats(table: Any) -> Dict[str, Any]:
+    """
+    Count, sum, min, max and mean of ``page_like_count`` over the ads that
+    have one, and the same per distinct page (the count is a page
+    property repeated on each of its ads).
+    """
+    likes = table["page_like_count"]
+    min_max = pc.min_max(likes).as_py()
+    stats: Dict[str, Any] = {
+        "ads": len(likes) - likes.null_count,
+        "sum": pc.sum(likes).as_py() or 0,
+        "min": min_max["min"],
+        "max": min_max["max"],
+        "mean": pc.mean(likes).as_py(),
+    }
+    pages = table.group_by("page_id").aggregate([("page_like_count", "max")])
+    page_likes = pages["page_like_count_max"]
+    stats["pages"] = len(page_likes) - page_likes.null_count
+    stats["page_mean"] = pc.mean(page_likes).as_py()
+    return stats
+
+def date_range(table: Any) -> Dict[str, Optional[str]]:
+    """
+    First and last start and the last end of the ads, as ISO timestamps.
+    """
+    starts = pc.min_max(table["start_date"]).as_py()
+    ends = pc.min_max(table["end_date"]).as_py()
+    bounds = {"first_start": starts["min"], "last_start": starts["max"], "last_end": ends["max"]}
+    return {key: value.isoformat() if value is not None else None for key, value in bounds.items()}
+
+def summarize(table: Any, top: int = 10) -> Dict[str, Any]:
+    """
+    Aggregate view of an ad_columns() table: ad and page counts, the date
+    range, ads per platform and category, page-like statistics and the
+    ``top`` pages by number of ads.
+    """
+    pages = table.group_by(["page_id", "page_name"]).aggregate([("ad_archive_id", "count")])
+    pages = pages.sort_by([("ad_archive_id_count", "descending"), ("page_id", "ascending")])
+    top_pages = pages.slice(0, max(0, int(top))).to_pylist()
+    return {
+        "ads": table.num_rows,
+        "pages": pc.count_distinct(table["page_id"]).as_py(),
+        "dates": date_range(table),
+        "platforms": value_counts(table, "publisher_platform"),
+        "categories": value_counts(table, "categories"),
+        "page_likes": like_stats(table),
+        "top_pages": [
+            {"page_id": row["page_id"], "page_name": row["page_name"], "ads": row["ad_archive_id_count"]}
+            for row in top_pages
+        ],
+    }
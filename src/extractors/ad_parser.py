@@ -1,8 +1,18 @@
-thonfrom typing import Any, Dict, List, Union
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+import collections
+import functools
+import itertools
 import logging
 
+from utils.helpers import json_dumps, json_loads
+from utils.metrics import pipeline_stage
+
 LOGGER = logging.getLogger(__name__)
 
+# Callable turning one raw record into a normalized ad.
+Normalizer = Callable[[Dict[str, Any]], Dict[str, Any]]
+
 def _extract_snapshot(raw: Dict[str, Any]) -> Dict[str, Any]:
     """
     Normalize the snapshot/body/images subtree to the format:
@@ -72,7 +82,7 @@ def _extract_snapshot(raw: Dict[str, Any]) -> Dict[str, Any]:
         "images": normalized_images,
     }
 
-def _extract_publisher_platforms(raw: Dict[str, Any]) -> List[str]:
+def extract_publisher_platforms(raw: Dict[str, Any]) -> List[str]:
     platforms = raw.get("publisher_platform") or raw.get("publisher_platforms")
     if isinstance(platforms, list):
         return [str(p).upper() for p in platforms]
@@ -90,7 +100,7 @@ def _extract_publisher_platforms(raw: Dict[str, Any]) -> List[str]:
 
     return []
 
-def _extract_categories(raw: Dict[str, Any]) -> List[str]:
+def extract_categories(raw: Dict[str, Any]) -> List[str]:
     categories = raw.get("categories") or raw.get("ad_reached_countries") or []
     if isinstance(categories, list):
         return [str(c) for c in categories]
@@ -98,17 +108,23 @@ def _extract_categories(raw: Dict[str, Any]) -> List[str]:
         return [categories]
     return []
 
-def normalize_ad_record(raw: Dict[str, Any]) -> Dict[str, Any]:
+def extract_ad_archive_id(raw: Dict[str, Any]) -> Any:
     """
-    Convert a raw ad structure from an arbitrary Facebook Ads Library-like
-    endpoint to the normalized shape described in the README.
+    Return the ad's archive id from whichever key the backend uses, or None.
     """
-    ad_archive_id = (
+    return (
         raw.get("ad_archive_id")
         or raw.get("id")
         or raw.get("adid")
         or raw.get("ad_id")
     )
+
+def normalize_ad_record(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a raw ad structure from an arbitrary Facebook Ads Library-like
+    endpoint to the normalized shape described in the README.
+    """
+    ad_archive_id = extract_ad_archive_id(raw)
     page = raw.get("page") or {}
     if not isinstance(page, dict):
         page = {}
@@ -122,7 +138,7 @@ def normalize_ad_record(raw: Dict[str, Any]) -> Dict[str, Any]:
         or page.get("link")
     )
 
-    publisher_platform = _extract_publisher_platforms(raw)
+    publisher_platform = extract_publisher_platforms(raw)
 
     page_like_count = (
         raw.get("page_like_count")
@@ -135,7 +151,7 @@ def normalize_ad_record(raw: Dict[str, Any]) -> Dict[str, Any]:
     start_date = raw.get("start_date") or raw.get("ad_delivery_start_time")
     end_date = raw.get("end_date") or raw.get("ad_delivery_stop_time")
 
-    categories = _extract_categories(raw)
+    categories = extract_categories(raw)
     snapshot = _extract_snapshot(raw)
 
     normalized = {
@@ -151,33 +167,166 @@ def normalize_ad_record(raw: Dict[str, Any]) -> Dict[str, Any]:
         "categories": categories,
     }
 
-    LOGGER.debug("Normalized ad %s", ad_archive_id)
+    if LOGGER.isEnabledFor(logging.DEBUG):
+        LOGGER.debug("Normalized ad %s", ad_archive_id)
+    return normalized
+
+def _normalize_keeping(
+    normalize: Normalizer, fields: Sequence[str], raw: Dict[str, Any]
+) -> Dict[str, Any]:
+    normalized = normalize(raw)
+    for field in fields:
+        if field in raw:
+            normalized[field] = raw[field]
     return normalized
 
-def parse_ads(raw_data: Union[List[Dict[str, Any]], Dict[str, Any]]) -> List[Dict[str, Any]]:
+def keep_fields(normalize: Optional[Normalizer], fields: Sequence[str]) -> Normalizer:
     """
-    Take a list of raw ad objects (or a dict containing one) and normalize
-    each record, skipping malformed entries but logging them.
+    Wrap a normalizer so the given raw fields (e.g. fetch provenance) are
+    copied onto its output. The result is picklable whenever ``normalize``
+    is, so it can be used with worker processes.
     """
+    return functools.partial(_normalize_keeping, normalize or normalize_ad_record, tuple(fields))
+
+def _iter_items(
+    raw_data: Union[Iterable[Dict[str, Any]], Dict[str, Any]]
+) -> Iterable[Any]:
     if isinstance(raw_data, dict):
         if "data" in raw_data and isinstance(raw_data["data"], list):
-            items = raw_data["data"]
-        else:
-            raise ValueError("Expected 'data' key with list when passing a dict to parse_ads.")
-    elif isinstance(raw_data, list):
-        items = raw_data
-    else:
-        raise TypeError("parse_ads expects a list of dicts or a dict with 'data'.")
-
-    normalized_ads: List[Dict[str, Any]] = []
-    for idx, item in enumerate(items):
+            return raw_data["data"]
+        raise ValueError("Expected 'data' key with list when passing a dict to parse_ads.")
+    if isinstance(raw_data, (str, bytes)) or not isinstance(raw_data, Iterable):
+        raise TypeError("parse_ads expects an iterable of dicts or a dict with 'data'.")
+    return raw_data
+
+@pipeline_stage("normalize")
+def iter_normalized_ads(
+    raw_data: Union[Iterable[Dict[str, Any]], Dict[str, Any]],
+    normalize: Optional[Normalizer] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily normalize raw ad objects one at a time, skipping malformed entries
+    but logging them. Accepts the same inputs as parse_ads, including
+    generators that are still being filled from the network. ``normalize``
+    defaults to normalize_ad_record.
+    """
+    normalize = normalize or normalize_ad_record
+    for idx, item in enumerate(_iter_items(raw_data)):
         if not isinstance(item, dict):
             LOGGER.warning("Skipping non-dict ad record at index %d", idx)
             continue
         try:
-            normalized = normalize_ad_record(item)
-            normalized_ads.append(normalized)
+            normalized = normalize(item)
         except Exception as err:
             LOGGER.exception("Failed to normalize ad at index %d: %s", idx, err)
+            continue
+        yield normalized
+
+# Per-record result codes exchanged with normalization worker processes.
+_OK, _NOT_A_DICT, _FAILED = 0, 1, 2
+
+def _encode_chunk(items: List[Any]) -> bytes:
+    """
+    Serialize a chunk of raw records as NDJSON. Records that are already raw
+    JSON text (e.g. lines from an NDJSON input) are passed through without
+    being decoded in the parent process.
+    """
+    lines = []
+    for item in items:
+        if isinstance(item, str):
+            item = item.encode("utf-8")
+        elif not isinstance(item, bytes):
+            item = json_dumps(item)
+        lines.append(item.strip())
+    return b"\n".join(lines)
+
+def _normalize_chunk(payload: bytes, normalize: Optional[Normalizer] = None) -> bytes:
+    """
+    Worker entry point: decode an NDJSON chunk of raw records, normalize each
+    one and return an NDJSON chunk of ``[code, value]`` results in the same
+    order.
+    """
+    normalize = normalize or normalize_ad_record
+    out = []
+    for line in payload.split(b"\n"):
+        try:
+            item = json_loads(line)
+        except ValueError as err:
+            out.append(json_dumps([_FAILED, f"invalid JSON: {err}"]))
+            continue
+        if not isinstance(item, dict):
+            out.append(json_dumps([_NOT_A_DICT, None]))
+            continue
+        try:
+            result = [_OK, normalize(item)]
+        except Exception as err:
+            result = [_FAILED, f"{type(err).__name__}: {err}"]
+        out.append(json_dumps(result, default=str))
+    return b"\n".join(out)
+
+@pipeline_stage("normalize")
+def iter_normalized_ads_parallel(
+    raw_data: Union[Iterable[Any], Dict[str, Any]],
+    workers: int,
+    chunk_size: int = 1000,
+    normalize: Optional[Normalizer] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Normalize records on a pool of ``workers`` processes.
+
+    Input is split into chunks of ``chunk_size`` records that travel to the
+    workers and back as single NDJSON byte strings, which is much cheaper
+    than pickling lists of dicts. Raw JSON text lines are accepted as items
+    and are never decoded in this process. Output order matches input order
+    and malformed records are skipped and logged exactly as in
+    iter_normalized_ads. At most ``2 * workers`` chunks are in flight. A
+    custom ``normalize`` callable must be picklable.
+    """
+    items = iter(_iter_items(raw_data))
+    chunk_size = max(1, int(chunk_size))
+    max_pending = max(1, int(workers)) * 2
+    pending: Deque["Future[bytes]"] = collections.deque()
 
-    return normalized_ads
\ No newline at end of file
+    # Loading multiprocessing is a noticeable part of startup, so only
+    # runs with worker processes import it.
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=max(1, int(workers))) as pool:
+        base = 0
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                chunk = list(itertools.islice(items, chunk_size))
+                if not chunk:
+                    exhausted = True
+                    break
+                pending.append(pool.submit(_normalize_chunk, _encode_chunk(chunk), normalize))
+            if not pending:
+                return
+
+            results = pending.popleft().result().split(b"\n")
+            for offset, line in enumerate(results):
+                idx = base + offset
+                code, value = json_loads(line)
+                if code == _OK:
+                    yield value
+                elif code == _NOT_A_DICT:
+                    LOGGER.warning("Skipping non-dict ad record at index %d", idx)
+                else:
+                    LOGGER.error("Failed to normalize ad at index %d: %s", idx, value)
+            base += len(results)
+
+def parse_ads(
+    raw_data: Union[Iterable[Dict[str, Any]], Dict[str, Any]],
+    workers: int = 1,
+    chunk_size: int = 1000,
+    normalize: Optional[Normalizer] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Take a list (or any iterable) of raw ad objects, or a dict containing
+    one, and normalize each record, skipping malformed entries but logging
+    them. With ``workers > 1`` records are normalized in a process pool.
+    """
+    if workers > 1:
+        return list(iter_normalized_ads_parallel(raw_data, workers, chunk_size, normalize))
+    return list(iter_normalized_ads(raw_data, normalize))
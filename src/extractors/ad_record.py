@@ -0,0 +1,215 @@
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+import sys
+
+from utils.metrics import pipeline_stage
+
+# Top-level keys of a normalized ad, in the order normalize_ad_record emits them.
+AD_KEYS = (
+    "ad_archive_id",
+    "page_id",
+    "page_name",
+    "page_profile_uri",
+    "publisher_platform",
+    "snapshot",
+    "page_like_count",
+    "start_date",
+    "end_date",
+    "categories",
+)
+_SNAPSHOT_KEYS = ("body", "cta_text", "images")
+
+# Upper bound on distinct tuples shared between records, so a stream of
+# unique category lists cannot grow the cache without limit.
+_MAX_SHARED_TUPLES = 1 << 16
+_shared_tuples: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if type(value) is str else value
+
+def _shared_tuple(values: Iterable[Any]) -> Tuple[Any, ...]:
+    """
+    Tuple of interned strings, shared with every earlier record that had
+    the same values (e.g. the same platform list).
+    """
+    items = tuple(_intern(v) for v in values)
+    shared = _shared_tuples.get(items)
+    if shared is not None:
+        return shared
+    if len(_shared_tuples) < _MAX_SHARED_TUPLES:
+        _shared_tuples[items] = items
+    return items
+
+class AdRecord:
+    """
+    Memory-compact form of a normalized ad.
+
+    The nested snapshot dicts are flattened into slots, list fields become
+    shared tuples of interned strings, and low-cardinality strings (page
+    names, CTA texts) are interned. to_dict() rebuilds exactly the dict
+    produced by normalize_ad_record, including any extra top-level fields
+    such as ``_delta``. ``get()`` answers top-level lookups like a dict, so
+    code that only reads an ad does not need to convert it.
+    """
+
+    __slots__ = (
+        "ad_archive_id",
+        "page_id",
+        "page_name",
+        "page_profile_uri",
+        "publisher_platform",
+        "body_text",
+        "cta_text",
+        "image_urls",
+        "page_like_count",
+        "start_date",
+        "end_date",
+        "categories",
+        "extra",
+    )
+
+    def __init__(
+        self,
+        ad_archive_id: Any,
+        page_id: Any,
+        page_name: Any,
+        page_profile_uri: Any,
+        publisher_platform: Tuple[Any, ...],
+        body_text: Any,
+        cta_text: Any,
+        image_urls: Tuple[Any, ...],
+        page_like_count: Any,
+        start_date: Any,
+        end_date: Any,
+        categories: Tuple[Any, ...],
+        extra: Optional[Tuple[Tuple[str, Any], ...]] = None,
+    ) -> None:
+        self.ad_archive_id = ad_archive_id
+        self.page_id = page_id
+        self.page_name = page_name
+        self.page_profile_uri = page_profile_uri
+        self.publisher_platform = publisher_platform
+        self.body_text = body_text
+        self.cta_text = cta_text
+        self.image_urls = image_urls
+        self.page_like_count = page_like_count
+        self.start_date = start_date
+        self.end_date = end_date
+        self.categories = categories
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, ad: Dict[str, Any]) -> Optional["AdRecord"]:
+        """
+        Compact a normalized ad, or return None if it does not have exactly
+        the normalized shape (in which case it could not be rebuilt
+        faithfully and should be kept as a dict).
+        """
+        keys = tuple(ad)
+        if keys[: len(AD_KEYS)] != AD_KEYS:
+            return None
+        snapshot = ad["snapshot"]
+        if not isinstance(snapshot, dict) or tuple(snapshot) != _SNAPSHOT_KEYS:
+            return None
+        body = snapshot["body"]
+        if not isinstance(body, dict) or tuple(body) != ("text",):
+            return None
+        images = snapshot["images"]
+        platforms = ad["publisher_platform"]
+        categories = ad["categories"]
+        if not (isinstance(images, list) and isinstance(platforms, list) and isinstance(categories, list)):
+            return None
+        urls = []
+        for image in images:
+            if not isinstance(image, dict) or tuple(image) != ("original_image_url",):
+                return None
+            urls.append(image["original_image_url"])
+
+        extra = None
+        if len(keys) > len(AD_KEYS):
+            extra = tuple((key, ad[key]) for key in keys[len(AD_KEYS):])
+
+        return cls(
+            ad["ad_archive_id"],
+            ad["page_id"],
+            _intern(ad["page_name"]),
+            ad["page_profile_uri"],
+            _shared_tuple(platforms),
+            body["text"],
+            _intern(snapshot["cta_text"]),
+            tuple(urls),
+            ad["page_like_count"],
+            ad["start_date"],
+            ad["end_date"],
+            _shared_tuple(categories),
+            extra,
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "body": {"text": self.body_text},
+            "cta_text": self.cta_text,
+            "images": [{"original_image_url": url} for url in self.image_urls],
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        ad = {
+            "ad_archive_id": self.ad_archive_id,
+            "page_id": self.page_id,
+            "page_name": self.page_name,
+            "page_profile_uri": self.page_profile_uri,
+            "publisher_platform": list(self.publisher_platform),
+            "snapshot": self.snapshot(),
+            "page_like_count": self.page_like_count,
+            "start_date": self.start_date,
+            "end_date": self.end_date,
+            "categories": list(self.categories),
+        }
+        if self.extra:
+            ad.update(self.extra)
+        return ad
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == "snapshot":
+            return self.snapshot()
+        if key in ("publisher_platform", "categories"):
+            return list(getattr(self, key))
+        if key in AD_KEYS:
+            return getattr(self, key)
+        for name, value in self.extra or ():
+            if name == key:
+                return value
+        return default
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, AdRecord):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self) -> str:
+        return f"AdRecord(ad_archive_id={self.ad_archive_id!r}, page_name={self.page_name!r})"
+
+Ad = Union[AdRecord, Dict[str, Any]]
+
+@pipeline_stage("normalize")
+def compact_ad(ad: Dict[str, Any]) -> Ad:
+    """
+    Return the compact form of a normalized ad, or the dict itself if it
+    does not have the normalized shape (e.g. an ``ended`` delta stub).
+    """
+    record = AdRecord.from_dict(ad)
+    return ad if record is None else record
+
+def expand_ad(ad: Ad) -> Dict[str, Any]:
+    """
+    Dict form of an ad returned by compact_ad.
+    """
+    return ad.to_dict() if isinstance(ad, AdRecord) else ad
+
+def json_default(value: Any) -> Any:
+    """
+    ``default`` hook for JSON encoders, so lists of compact records can be
+    serialized without expanding them all first.
+    """
+    if isinstance(value, AdRecord):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,193 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import logging
+import os
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+from utils.metrics import pipeline_stage
+
+LOGGER = logging.getLogger(__name__)
+
+# Blob extensions worth decoding; videos and unknown types are skipped.
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp")
+
+# Field added to normalized ads: ids of the clusters of their creatives.
+CREATIVE_CLUSTERS_FIELD = "creative_clusters"
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # pragma: no cover - Python < 3.10
+    def _popcount(value: int) -> int:
+        return bin(value).count("1")
+
+def pillow_available() -> bool:
+    return Image is not None
+
+def hamming(a: int, b: int) -> int:
+    return _popcount(a ^ b)
+
+def dhash_file(path: str, size: int = 8) -> Optional[int]:
+    """
+    Difference hash of an image: shrink it to ``size + 1`` x ``size``
+    grayscale pixels and set one bit per horizontally adjacent pair that
+    gets darker. Resizing, recompression and small edits change only a few
+    of the ``size * size`` bits. Returns None if the file cannot be decoded.
+    """
+    try:
+        with Image.open(path) as img:
+            # Lets the JPEG decoder downscale while decoding, which is most
+            # of the cost for large creatives.
+            img.draft("L", ((size + 1) * 8, size * 8))
+            pixels = img.convert("L").resize((size + 1, size), Image.BILINEAR).tobytes()
+    except Exception as err:
+        LOGGER.debug("Cannot hash %s: %s", path, err)
+        return None
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def hash_files(
+    paths: Sequence[str],
+    workers: int = 0,
+    chunk_size: int = 64,
+) -> Iterator[Tuple[str, Optional[int]]]:
+    """
+    ``(path, dhash)`` for each path, decoding in a pool of ``workers``
+    processes (0 means one per CPU). Yields in input order.
+    """
+    if Image is None:
+        raise RuntimeError(
+            "Creative clustering requires Pillow. Install it with 'pip install Pillow'."
+        )
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(paths) < chunk_size:
+        for path in paths:
+            yield path, dhash_file(path)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from zip(paths, pool.map(dhash_file, paths, chunksize=chunk_size))
+
+class HammingIndex:
+    """
+    Multi-index hash table over 64-bit hashes for radius-``radius`` lookups.
+
+    The hash is cut into ``radius + 1`` substrings, each with its own table.
+    Two hashes at most ``radius`` bits apart agree exactly on at least one
+    substring (pigeonhole), so a lookup only compares against the hashes
+    sharing a bucket with it instead of against every hash. Buckets shrink
+    exponentially with substring width, so small radii stay fast into the
+    millions of hashes.
+    """
+
+    def __init__(self, radius: int, bits: int = 64) -> None:
+        self.radius = max(0, int(radius))
+        parts = self.radius + 1
+        self._slices: List[Tuple[int, int]] = []
+        offset = 0
+        for i in range(parts):
+            width = bits // parts + (1 if i < bits % parts else 0)
+            self._slices.append((offset, (1 << width) - 1))
+            offset += width
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in self._slices]
+        self._values: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def get(self, value_hash: int) -> Optional[str]:
+        return self._values.get(value_hash)
+
+    def add(self, value_hash: int, value: str) -> None:
+        """
+        Insert ``value_hash`` labelled ``value``; a hash already indexed
+        keeps its first label.
+        """
+        if value_hash in self._values:
+            return
+        self._values[value_hash] = value
+        for (offset, mask), table in zip(self._slices, self._tables):
+            table.setdefault((value_hash >> offset) & mask, []).append(value_hash)
+
+    def nearest(self, value_hash: int) -> Optional[Tuple[int, str]]:
+        """
+        ``(distance, value)`` of the closest hash within ``radius``, or None.
+        """
+        exact = self._values.get(value_hash)
+        if exact is not None:
+            return 0, exact
+        best: Optional[int] = None
+        best_distance = self.radius + 1
+        for (offset, mask), table in zip(self._slices, self._tables):
+            for candidate in table.get((value_hash >> offset) & mask, ()):
+                distance = _popcount(value_hash ^ candidate)
+                if distance < best_distance:
+                    best, best_distance = candidate, distance
+        if best is None:
+            return None
+        return best_distance, self._values[best]
+
+def cluster_id(value_hash: int) -> str:
+    return f"{value_hash:016x}"
+
+class CreativeClusterer:
+    """
+    Assign perceptual hashes to clusters of near-identical creatives.
+
+    A hash within ``max_distance`` bits of one already seen joins the
+    cluster of the closest such hash; otherwise it starts a new cluster
+    named after itself. Clusters are never merged or renamed afterwards,
+    so ids stay stable as later runs add creatives. Each hash costs one
+    HammingIndex lookup, so clustering is roughly linear in the number of
+    distinct hashes rather than quadratic.
+    """
+
+    def __init__(self, max_distance: int = 4) -> None:
+        self.max_distance = max(0, int(max_distance))
+        self._index = HammingIndex(self.max_distance)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def add_known(self, value_hash: int, cluster: str) -> None:
+        """
+        Load a hash clustered by an earlier run.
+        """
+        self._index.add(value_hash, cluster)
+
+    def assign(self, value_hash: int) -> str:
+        match = self._index.nearest(value_hash)
+        cluster = match[1] if match is not None else cluster_id(value_hash)
+        self._index.add(value_hash, cluster)
+        return cluster
+
+@pipeline_stage("media")
+def cluster_blobs(
+    known: Iterable[Tuple[int, str]],
+    blobs: Sequence[Tuple[str, Path]],
+    max_distance: int = 4,
+    workers: int = 0,
+) -> List[Tuple[str, Optional[int], Optional[str]]]:
+    """
+    Hash the image ``blobs`` (``(sha256, path)`` pairs) and cluster them
+    against the ``known`` ``(dhash, cluster)`` pairs of earlier runs.
+    Returns ``(sha256, dhash, cluster)`` per blob, with None for blobs that
+    could not be decoded.
+    """
+    clusterer = CreativeClusterer(max_distance)
+    for value_hash, cluster in known:
+        clusterer.add_known(value_hash, cluster)
+
+    results: List[Tuple[str, Optional[int], Optional[str]]] = []
+    sha_by_path = {str(path): sha256 for sha256, path in blobs}
+    for path, value_hash in hash_files(list(sha_by_path), workers=workers):
+        cluster = clusterer.assign(value_hash) if value_hash is not None else None
+        results.append((sha_by_path[path], value_hash, cluster))
+    return results
@@ -0,0 +1,227 @@
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+import hashlib
+import logging
+import math
+import sqlite3
+
+from extractors.ad_parser import extract_ad_archive_id
+from utils.metrics import get_metrics, pipeline_stage
+
+LOGGER = logging.getLogger(__name__)
+
+# Every query (``{"search_term": ..., "country": ...}``) that returned an ad,
+# merged onto the single copy of it that is emitted.
+MATCHED_QUERIES_FIELD = "matched_queries"
+
+class MemoryIndex:
+    """
+    Exact in-memory set of the ids seen so far. Fine for runs of up to a
+    few million ads.
+    """
+
+    def __init__(self) -> None:
+        self._seen: set = set()
+
+    def add(self, key: str) -> bool:
+        """
+        Remember ``key``; returns True if it had not been seen before.
+        """
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def close(self) -> None:
+        self._seen.clear()
+
+class DiskIndex:
+    """
+    Exact set of ids kept in a scratch SQLite file, for runs too large to
+    hold every id in memory. Inserts are committed in batches; the file is
+    deleted on close().
+    """
+
+    def __init__(self, path: Path, batch_size: int = 10_000) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.unlink(missing_ok=True)
+        self.batch_size = max(1, int(batch_size))
+        self._count = 0
+        self._pending = 0
+        self._conn = sqlite3.connect(str(self.path), isolation_level=None)
+        # Scratch data: nothing to recover after a crash.
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute("CREATE TABLE seen (id TEXT PRIMARY KEY) WITHOUT ROWID")
+        self._conn.execute("BEGIN")
+
+    def add(self, key: str) -> bool:
+        cursor = self._conn.execute("INSERT OR IGNORE INTO seen (id) VALUES (?)", (key,))
+        if cursor.rowcount != 1:
+            return False
+        self._count += 1
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self._conn.execute("COMMIT")
+            self._conn.execute("BEGIN")
+            self._pending = 0
+        return True
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        self._conn.close()
+        self.path.unlink(missing_ok=True)
+
+class BloomIndex:
+    """
+    Fixed-size Bloom filter over the ids seen so far, sized for
+    ``capacity`` ids at a false-positive rate of ``error_rate``. Memory is
+    about 1.2 * log2(1 / error_rate) bytes per id whatever the id length,
+    but a false positive drops a unique ad as a duplicate, so keep the rate
+    well below one over the expected number of ads.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 1e-7) -> None:
+        capacity = max(1, int(capacity))
+        error_rate = min(max(float(error_rate), 1e-12), 0.5)
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._count = 0
+        LOGGER.debug(
+            "Bloom dedup index: %d bits (%.1f MiB), %d hashes.",
+            self.size,
+            len(self._bits) / 2**20,
+            self.hashes,
+        )
+
+    def add(self, key: str) -> bool:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        bits = self._bits
+        size = self.size
+        new = False
+        for i in range(self.hashes):
+            bit = (h1 + i * h2) % size
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                new = True
+        if new:
+            self._count += 1
+        return new
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        self._bits = bytearray()
+
+class AdDeduplicator:
+    """
+    Drop repeated copies of an ad, keyed by ``ad_archive_id``, before they
+    are normalized.
+
+    The first copy of each ad is passed on; later copies are dropped. With
+    ``source_field`` the query that returned the copy (as tagged by the live
+    fetcher) becomes a one-item ``matched_queries`` list on it. With
+    ``merge`` the queries of later copies are appended to that list in
+    place, which reaches the output as long as the ad has not been written
+    yet, i.e. in batch runs; it costs a list per ad, so streaming runs and
+    the memory-bounded ``disk`` and ``bloom`` indexes keep only the first
+    query.
+    """
+
+    def __init__(
+        self,
+        index: Any,
+        source_field: Optional[str] = None,
+        merge: bool = False,
+        key: Callable[[Dict[str, Any]], Any] = extract_ad_archive_id,
+    ) -> None:
+        self.index = index
+        self.source_field = source_field
+        self.key = key
+        self.duplicates = 0
+        self._matches: Optional[Dict[str, List[Dict[str, Any]]]] = (
+            {} if merge and source_field is not None else None
+        )
+
+    @classmethod
+    def from_settings(
+        cls,
+        settings: Dict[str, Any],
+        source_field: Optional[str] = None,
+    ) -> Optional["AdDeduplicator"]:
+        """
+        The deduplicator for the configured index, or None when ``dedup``
+        is off.
+        """
+        mode = settings["dedup"]
+        if mode == "off":
+            return None
+        if mode == "disk":
+            path = settings["dedup_path"] or f"{settings['output_path']}.dedup.sqlite3"
+            index: Any = DiskIndex(Path(path))
+        elif mode == "bloom":
+            index = BloomIndex(settings["dedup_capacity"], settings["dedup_error_rate"])
+        else:
+            index = MemoryIndex()
+        merge = mode == "memory" and not settings["stream"]
+        return cls(index, source_field, merge=merge)
+
+    def seed(self, ads: Iterable[Dict[str, Any]]) -> int:
+        """
+        Mark ads that were already emitted (e.g. by the run being resumed)
+        as seen. Returns the number of ids added.
+        """
+        added = 0
+        for ad in ads:
+            key = self.key(ad) if isinstance(ad, dict) else None
+            if key is not None and self.index.add(str(key)):
+                added += 1
+        return added
+
+    @pipeline_stage("dedup")
+    def filter(self, records: Iterable[Any]) -> Iterator[Any]:
+        """
+        Pass on the first copy of every ad. Records that are not dicts or
+        have no id are passed through for the normalizer to deal with.
+        """
+        matches = self._matches
+        for record in records:
+            key = self.key(record) if isinstance(record, dict) else None
+            if key is None:
+                yield record
+                continue
+            key = str(key)
+            source = record.get(self.source_field) if self.source_field is not None else None
+            if not self.index.add(key):
+                self.duplicates += 1
+                if matches is not None and isinstance(source, dict):
+                    queries = matches.get(key)
+                    if queries is not None and source not in queries:
+                        queries.append(dict(source))
+                continue
+            if self.source_field is not None:
+                queries = [dict(source)] if isinstance(source, dict) else []
+                record[MATCHED_QUERIES_FIELD] = queries
+                if matches is not None:
+                    matches[key] = queries
+            yield record
+
+    def close(self) -> None:
+        get_metrics().count("duplicates_dropped", self.duplicates)
+        if self.duplicates:
+            LOGGER.info(
+                "Dropped %d duplicate ads; %d unique ads seen.", self.duplicates, len(self.index)
+            )
+        self.index.close()
+        self._matches = None
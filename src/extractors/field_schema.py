@@ -0,0 +1,305 @@
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+import logging
+
+from extractors.ad_parser import normalize_ad_record
+from utils.helpers import load_json_file
+
+LOGGER = logging.getLogger(__name__)
+
+FIELD_NAMES = (
+    "ad_archive_id",
+    "page_id",
+    "page_name",
+    "page_profile_uri",
+    "publisher_platform",
+    "page_like_count",
+    "start_date",
+    "end_date",
+    "categories",
+    "body_text",
+    "cta_text",
+    "images",
+)
+
+class _Codegen:
+    """
+    Emit the body of a specialized normalize function for one profile.
+
+    Every dotted path prefix is looked up once into a local variable and
+    fallback chains become inline ``or`` expressions, so the generated
+    function is a flat sequence of dict lookups with no per-field calls.
+    Whenever a value does not have the shape the profile expects (a
+    container that is not an object, a list field that is neither a list
+    nor a string) the function returns None, and the caller falls back to
+    the generic normalizer instead of emitting a lossy record.
+    """
+
+    def __init__(self) -> None:
+        self.lines: List[str] = []
+        self.constants: Dict[str, Any] = {}
+        self._prefixes: Dict[Tuple[str, ...], str] = {(): "raw"}
+        self._counter = 0
+
+    def _name(self, prefix: str) -> str:
+        self._counter += 1
+        return f"_{prefix}{self._counter}"
+
+    def constant(self, value: Any) -> str:
+        name = self._name("c")
+        self.constants[name] = value
+        return name
+
+    def _container(self, keys: Tuple[str, ...]) -> str:
+        """
+        Local variable holding the dict at ``keys`` ({} if absent), emitted
+        on first use. Anything other than a dict makes the function bail.
+        """
+        if keys in self._prefixes:
+            return self._prefixes[keys]
+        parent = self._container(keys[:-1])
+        var = self._name("p")
+        self.lines.append(f"{var} = {parent}.get({keys[-1]!r})")
+        self.lines.append(f"if {var} is None: {var} = _EMPTY")
+        self.lines.append(f"elif not isinstance({var}, dict): return None")
+        self._prefixes[keys] = var
+        return var
+
+    def path(self, path: str) -> str:
+        keys = tuple(path.split("."))
+        return f"{self._container(keys[:-1])}.get({keys[-1]!r})"
+
+    def chain(self, paths: Sequence[str]) -> str:
+        # ``a or b or c`` keeps the generic normalizer's falsy-fallback semantics.
+        return " or ".join(self.path(p) for p in paths)
+
+    def bail_unless(self, value: str, types: str) -> None:
+        self.lines.append(f"if {value} is not None and not isinstance({value}, {types}): return None")
+
+    def bail_if_present(self, path: str) -> None:
+        self.lines.append(f"if {self.path(path)} is not None: return None")
+
+    def assign(self, expr: str) -> str:
+        var = self._name("v")
+        self.lines.append(f"{var} = {expr}")
+        return var
+
+    def field(self, name: str, spec: Union[str, List[str], Dict[str, Any]]) -> str:
+        """
+        Emit statements for one output field and return the expression
+        holding its value.
+        """
+        if isinstance(spec, (str, list)):
+            spec = {"paths": spec}
+        paths = spec.get("paths", spec.get("path"))
+        if isinstance(paths, str):
+            paths = [paths]
+        if not paths:
+            raise ValueError(f"Field {name!r} in field mapping has no path.")
+
+        kind = spec.get("type", "value")
+        expr = self.chain(paths)
+        if "default" in spec:
+            expr = f"{expr} or {self.constant(spec['default'])}"
+        value = self.assign(expr)
+        if kind == "value":
+            return value
+        if kind == "text":
+            return f"(str({value}) if {value} is not None else '')"
+        if kind == "upper_list":
+            self.bail_unless(value, "(list, str)")
+            return (
+                f"([str(x).upper() for x in {value}] if isinstance({value}, list) "
+                f"else [{value}.upper()] if isinstance({value}, str) else [])"
+            )
+        if kind == "str_list":
+            self.bail_unless(value, "(list, str)")
+            return (
+                f"([str(x) for x in {value}] if isinstance({value}, list) "
+                f"else [{value}] if isinstance({value}, str) else [])"
+            )
+        if kind == "image_list":
+            item_keys = spec.get("item") or ["original_image_url", "url"]
+            if isinstance(item_keys, str):
+                item_keys = [item_keys]
+            images = self._name("i")
+            url = " or ".join(f"_item.get({k!r})" for k in item_keys)
+            self.bail_unless(value, "list")
+            self.lines.extend(
+                [
+                    f"{images} = []",
+                    f"for _item in {value} or ():",
+                    "    if isinstance(_item, dict):",
+                    f"        _url = {url}",
+                    "        if _url:",
+                    f"            {images}.append({{'original_image_url': _url}})",
+                ]
+            )
+            return images
+        raise ValueError(f"Unknown field type {kind!r} for field {name!r} in field mapping.")
+
+# Compiled normalize functions by profile name, source and constants, so a
+# long-running process re-reading the same mapping compiles it only once.
+_COMPILED: Dict[Tuple[str, str, str], Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]] = {}
+
+def compile_profile(
+    name: str,
+    fields: Dict[str, Any],
+    fallback_paths: Sequence[str] = (),
+) -> Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Compile a profile's field specs into one specialized normalize function.
+    It returns None for records it cannot normalize exactly like the
+    generic normalizer: those with a value at any of ``fallback_paths``
+    (keys the generic normalizer would consult but the profile does not
+    model) or with values of an unexpected shape.
+    """
+    missing = [f for f in FIELD_NAMES if f not in fields]
+    if missing:
+        raise ValueError(f"Profile {name!r} in field mapping is missing fields: {missing}")
+
+    gen = _Codegen()
+    for path in fallback_paths:
+        gen.bail_if_present(path)
+    exprs = {f: gen.field(f, fields[f]) for f in FIELD_NAMES}
+    # Same key order as normalize_ad_record so output is byte-identical.
+    body = gen.lines + [
+        "return {",
+        f"    'ad_archive_id': {exprs['ad_archive_id']},",
+        f"    'page_id': {exprs['page_id']},",
+        f"    'page_name': {exprs['page_name']},",
+        f"    'page_profile_uri': {exprs['page_profile_uri']},",
+        f"    'publisher_platform': {exprs['publisher_platform']},",
+        "    'snapshot': {",
+        f"        'body': {{'text': {exprs['body_text']}}},",
+        f"        'cta_text': {exprs['cta_text']},",
+        f"        'images': {exprs['images']},",
+        "    },",
+        f"    'page_like_count': {exprs['page_like_count']},",
+        f"    'start_date': {exprs['start_date']},",
+        f"    'end_date': {exprs['end_date']},",
+        f"    'categories': {exprs['categories']},",
+        "}",
+    ]
+    source = "def normalize(raw):\n" + "\n".join("    " + line for line in body)
+    key = (name, source, repr(sorted(gen.constants.items())))
+    cached = _COMPILED.get(key)
+    if cached is not None:
+        return cached
+    LOGGER.debug("Compiled field mapping profile %s:\n%s", name, source)
+
+    namespace: Dict[str, Any] = dict(gen.constants, _EMPTY={})
+    exec(compile(source, f"<field-mapping:{name}>", "exec"), namespace)
+    _COMPILED[key] = namespace["normalize"]
+    return namespace["normalize"]
+
+class CompiledProfile:
+    """
+    A backend profile from the field mapping, compiled into a specialized
+    normalize function that does no fallback probing. ``normalize`` returns
+    None for records the profile does not fully describe.
+    """
+
+    def __init__(self, name: str, spec: Dict[str, Any]) -> None:
+        self.name = name
+        self.detect: Tuple[str, ...] = tuple(spec.get("detect") or ())
+        self.normalize = compile_profile(name, spec.get("fields") or {}, spec.get("fallback_paths") or ())
+
+    def matches(self, raw: Dict[str, Any]) -> bool:
+        for key in self.detect:
+            if key not in raw:
+                return False
+        return True
+
+def load_field_mapping(path: Path) -> Dict[str, Any]:
+    path = Path(path)
+    LOGGER.debug("Loading field mapping from %s", path)
+    schema = load_json_file(path)
+    if not isinstance(schema, dict) or not isinstance(schema.get("profiles"), dict):
+        raise ValueError(f"Field mapping {path} must be an object with a 'profiles' object.")
+    return schema
+
+class SchemaNormalizer:
+    """
+    Drop-in replacement for normalize_ad_record driven by a field mapping.
+
+    The first ``sample_size`` records go through the generic normalizer
+    while being sampled. A profile is then selected only if it produces
+    exactly the generic output for every sampled record it handles; after
+    that each record whose top-level keys match the profile takes the
+    compiled fast path, and anything else (including records of a shape
+    the profile does not handle) still falls back to the generic
+    normalizer.
+    Instances pickle as their schema, so they can be sent to worker
+    processes, which re-run detection on their own input.
+    """
+
+    def __init__(self, schema: Dict[str, Any]) -> None:
+        self.schema = schema
+        self.sample_size = max(1, int(schema.get("sample_size", 20)))
+        self.profiles = [
+            CompiledProfile(name, spec) for name, spec in schema["profiles"].items()
+        ]
+        self.profile: Optional[CompiledProfile] = None
+        self.fallbacks = 0
+        self._samples: Optional[List[Dict[str, Any]]] = []
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]) -> Optional["SchemaNormalizer"]:
+        if not settings.get("field_mapping"):
+            return None
+        try:
+            return cls(load_field_mapping(Path(settings["field_mapping_path"])))
+        except (OSError, ValueError) as err:
+            LOGGER.warning("Ignoring field mapping %s: %s", settings["field_mapping_path"], err)
+            return None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"schema": self.schema}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["schema"])
+
+    def __call__(self, raw: Dict[str, Any]) -> Dict[str, Any]:
+        profile = self.profile
+        if profile is not None:
+            if profile.matches(raw):
+                ad = profile.normalize(raw)
+                if ad is not None and ad["ad_archive_id"] is not None:
+                    return ad
+            self.fallbacks += 1
+            return normalize_ad_record(raw)
+
+        if self._samples is not None:
+            self._samples.append(raw)
+            if len(self._samples) >= self.sample_size:
+                self._detect()
+        return normalize_ad_record(raw)
+
+    def _detect(self) -> None:
+        samples, self._samples = self._samples or [], None
+        for profile in self.profiles:
+            verdicts = [self._agrees(profile, raw) for raw in samples]
+            if False not in verdicts and True in verdicts:
+                self.profile = profile
+                LOGGER.info(
+                    "Field mapping: using '%s' profile (matched %d sampled records).",
+                    profile.name,
+                    len(samples),
+                )
+                return
+        LOGGER.info("Field mapping: no profile matched the input; using generic normalization.")
+
+    @staticmethod
+    def _agrees(profile: CompiledProfile, raw: Dict[str, Any]) -> Optional[bool]:
+        """
+        Whether ``profile`` normalizes ``raw`` exactly like the generic
+        normalizer, or None if it hands the record back to it.
+        """
+        if not profile.matches(raw):
+            return False
+        try:
+            ad = profile.normalize(raw)
+            return None if ad is None else ad == normalize_ad_record(raw)
+        except Exception:
+            return False
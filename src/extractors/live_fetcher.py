@@ -0,0 +1,496 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+import datetime
+import itertools
+import logging
+import queue
+import threading
+import time
+
+from utils.metrics import get_metrics, in_context, pipeline_stage
+
+if TYPE_CHECKING:  # pragma: no cover
+    from utils.http_client import ApiClient
+
+LOGGER = logging.getLogger(__name__)
+
+# (search_term, country)
+Query = Tuple[str, str]
+
+def build_queries(search_terms: Sequence[str], countries: Sequence[str]) -> List[Query]:
+    """
+    Expand configured search terms and countries into their full cross
+    product, preserving configuration order.
+    """
+    terms = list(search_terms) or [""]
+    codes = list(countries) or [""]
+    return list(itertools.product(terms, codes))
+
+# (date_min, date_max) as YYYY-MM-DD; None leaves that side open.
+DateWindow = Tuple[Optional[str], Optional[str]]
+
+def date_windows(date_min: str, date_max: str, days: int) -> List[DateWindow]:
+    """
+    Split the inclusive range ``date_min``..``date_max`` into consecutive
+    windows of ``days`` days, the last one possibly shorter. Without both
+    bounds, or with ``days`` of 0, the whole range is a single window.
+    """
+    if not date_min or not date_max or days <= 0:
+        return [(date_min or None, date_max or None)]
+    start = datetime.date.fromisoformat(date_min)
+    end = datetime.date.fromisoformat(date_max)
+    step = datetime.timedelta(days=days)
+    windows: List[DateWindow] = []
+    while start <= end:
+        stop = min(end, start + step - datetime.timedelta(days=1))
+        windows.append((start.isoformat(), stop.isoformat()))
+        start = stop + datetime.timedelta(days=1)
+    return windows
+
+def window_days(window: DateWindow) -> int:
+    """
+    Number of days in a closed window.
+    """
+    start = datetime.date.fromisoformat(window[0])
+    end = datetime.date.fromisoformat(window[1])
+    return (end - start).days + 1
+
+class WindowQuery(NamedTuple):
+    """
+    A query restricted to the ``date_min``..``date_max`` delivery window.
+    Its first two fields are those of a Query, so it can be used wherever
+    a query's term and country are read.
+    """
+
+    search_term: str
+    country: str
+    date_min: Optional[str]
+    date_max: Optional[str]
+
+# Countries that stand for "every country"; only these are split per country.
+_ALL_COUNTRIES = ("", "ALL")
+
+class WindowPlanner:
+    """
+    Adaptive date-window plan for queries whose results the backend caps.
+
+    Every query starts as one window over the whole date range. A window
+    that returns ``result_cap`` records was probably truncated, so it is
+    split into shorter windows, which run as new queries; one that returns
+    fewer is complete. Split windows are sized so that, at the ads-per-day
+    density learned so far for the query, each is expected to be
+    ``fill`` full, which keeps the number of requests close to the minimum
+    needed without overflowing again. A saturated window of ``min_days``
+    that cannot be split further is split into one query per country of
+    ``split_countries`` if it covered every country, and is otherwise
+    reported as truncated.
+
+    split() is called from the thread consuming the records only, so the
+    planner needs no locking.
+    """
+
+    def __init__(
+        self,
+        result_cap: int,
+        min_days: int = 1,
+        split_countries: Sequence[str] = (),
+        fill: float = 0.5,
+    ) -> None:
+        self.result_cap = max(1, int(result_cap))
+        self.min_days = max(1, int(min_days))
+        self.split_countries = [str(c) for c in split_countries]
+        self.fill = min(max(float(fill), 0.05), 1.0)
+        self.splits = 0
+        self.truncated = 0
+        # Estimated ads per day by (search_term, country).
+        self._density: Dict[Query, float] = {}
+
+    def plan(self, queries: Iterable[Query], date_min: str, date_max: str) -> List[WindowQuery]:
+        """
+        The initial windowed queries: one window per query, or windows
+        sized from densities learned earlier if any are known.
+        """
+        planned: List[WindowQuery] = []
+        for term, country in queries:
+            density = self._density.get((term, country))
+            days = window_days((date_min, date_max))
+            if density:
+                days = max(self.min_days, int(self.fill * self.result_cap / density))
+            for window_min, window_max in date_windows(date_min, date_max, days):
+                planned.append(WindowQuery(term, country, window_min, window_max))
+        return planned
+
+    def _learn(self, key: Query, density: float) -> None:
+        previous = self._density.get(key)
+        self._density[key] = density if previous is None else (previous + density) / 2
+
+    def split(self, query: Any, fetched: int) -> List[WindowQuery]:
+        """
+        The queries to run in place of a finished ``query`` that returned
+        ``fetched`` records; empty if it was complete (or cannot be split).
+        """
+        if not isinstance(query, WindowQuery) or not query.date_min or not query.date_max:
+            return []
+        key = (query.search_term, query.country)
+        days = window_days((query.date_min, query.date_max))
+        if fetched < self.result_cap:
+            self._learn(key, fetched / days)
+            return []
+
+        # At least result_cap ads in the window; assume twice that until
+        # sibling windows tell us better.
+        density = max(self._density.get(key, 0.0), 2.0 * fetched / days)
+        self._density[key] = max(self._density.get(key, 0.0), fetched / days)
+        metrics = get_metrics()
+        if days > self.min_days:
+            size = max(self.min_days, int(self.fill * self.result_cap / density))
+            size = min(size, (days + 1) // 2)
+            children = [
+                query._replace(date_min=window_min, date_max=window_max)
+                for window_min, window_max in date_windows(query.date_min, query.date_max, size)
+            ]
+        elif self.split_countries and query.country.upper() in _ALL_COUNTRIES:
+            children = [query._replace(country=country) for country in self.split_countries]
+        else:
+            self.truncated += 1
+            metrics.count("windows_truncated")
+            LOGGER.warning(
+                "Query term=%r country=%r still hit the %d-result cap on %s..%s; "
+                "some of its ads were not fetched.",
+                query.search_term,
+                query.country,
+                self.result_cap,
+                query.date_min,
+                query.date_max,
+            )
+            return []
+
+        self.splits += 1
+        metrics.count("windows_split")
+        LOGGER.info(
+            "Query term=%r country=%r hit the %d-result cap on %s..%s; splitting it into %d queries.",
+            query.search_term,
+            query.country,
+            self.result_cap,
+            query.date_min,
+            query.date_max,
+            len(children),
+        )
+        return children
+
+def extract_records(response_data: Any) -> List[Dict[str, Any]]:
+    """
+    Accept either a top-level list or an object with 'data' and return the
+    list of raw ad records it contains.
+    """
+    if isinstance(response_data, list):
+        return response_data
+    if isinstance(response_data, dict) and "data" in response_data:
+        data = response_data["data"]
+        if isinstance(data, list):
+            return data
+        raise ValueError("Expected 'data' to be a list in live API response.")
+    raise ValueError("Unexpected data format from live API.")
+
+# (url, params) of a page request; params are None for opaque next URLs.
+PageRequest = Tuple[str, Optional[Dict[str, Any]]]
+
+class Page(NamedTuple):
+    """
+    One page of raw records plus the cursor that fetches the page after it
+    and the request for it (both ``None`` on the last page).
+    """
+
+    records: List[Dict[str, Any]]
+    cursor: Optional[str]
+    next_request: Optional[PageRequest] = None
+
+class QueryProgress(NamedTuple):
+    """
+    How far a query got: records fetched so far and the request for its
+    next page, or ``None`` once the query is finished.
+    """
+
+    fetched: int
+    next_request: Optional[PageRequest]
+
+def _next_page_request(
+    response_data: Any,
+    api_url: str,
+    params: Dict[str, Any],
+    limit: int,
+) -> Optional[Tuple[str, Optional[Dict[str, Any]], str]]:
+    """
+    Work out how to request the page after ``response_data``.
+
+    Prefers the ``paging.cursors.after`` cursor, which keeps our own params
+    (and page size) in control, and falls back to the opaque ``paging.next``
+    URL. Returns ``(url, params, cursor)`` or ``None`` on the last page.
+    """
+    if not isinstance(response_data, dict):
+        return None
+    paging = response_data.get("paging")
+    if not isinstance(paging, dict):
+        return None
+
+    cursors = paging.get("cursors")
+    after = cursors.get("after") if isinstance(cursors, dict) else None
+    if after:
+        return api_url, dict(params, limit=limit, after=after), str(after)
+
+    next_url = paging.get("next")
+    if next_url:
+        return str(next_url), None, str(next_url)
+    return None
+
+def iter_pages(
+    client: "ApiClient",
+    api_url: str,
+    params: Dict[str, Any],
+    max_items: int,
+    page_size: int = 100,
+    start: Optional[PageRequest] = None,
+) -> Iterator[Page]:
+    """
+    Follow ``paging`` cursors for a single query, yielding one page at a
+    time until ``max_items`` records have been produced or the backend runs
+    out of pages. ``start`` resumes from a page request saved earlier
+    instead of requesting the first page.
+
+    The next page is requested on a background thread as soon as the current
+    one arrives, so network time overlaps with the caller processing the
+    page. At most two pages are held in memory at once.
+    """
+    remaining = max(0, int(max_items))
+    page_size = max(1, int(page_size))
+    if remaining == 0:
+        return
+
+    if start is None:
+        start = (api_url, dict(params, limit=min(page_size, remaining)))
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="page-prefetch") as prefetcher:
+        pending: Optional[Future] = prefetcher.submit(in_context(client.get_json), *start)
+        try:
+            while pending is not None:
+                response_data = pending.result()
+                pending = None
+
+                records = extract_records(response_data)[:remaining]
+                remaining -= len(records)
+
+                cursor = None
+                next_request: Optional[PageRequest] = None
+                if records and remaining > 0:
+                    request = _next_page_request(
+                        response_data, api_url, params, min(page_size, remaining)
+                    )
+                    if request is not None:
+                        next_url, next_params, cursor = request
+                        next_request = (next_url, next_params)
+                        pending = prefetcher.submit(in_context(client.get_json), next_url, next_params)
+
+                yield Page(records, cursor, next_request)
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+class _QueryDone(NamedTuple):
+    index: int
+    error: Optional[BaseException]
+    fetched: int = 0
+    # False for a query that had already finished before a resume.
+    fresh: bool = True
+
+class _QueryPage(NamedTuple):
+    index: int
+    records: List[Dict[str, Any]]
+    progress: QueryProgress
+
+@pipeline_stage("fetch")
+def iter_queries_concurrently(
+    client: "ApiClient",
+    api_url: str,
+    queries: Iterable[Any],
+    params_for: Callable[[Any], Dict[str, Any]],
+    max_items: int,
+    page_size: int = 100,
+    max_workers: int = 8,
+    source_field: Optional[str] = None,
+    progress: Optional[Dict[Any, QueryProgress]] = None,
+    on_page: Optional[Callable[[Any, QueryProgress], None]] = None,
+    split: Optional[Callable[[Any, int], Sequence[Any]]] = None,
+    failed: Optional[List[Any]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Run every query against ``api_url`` on a bounded thread pool and stream
+    the merged records back as pages arrive.
+
+    Each query paginates independently up to ``max_items`` records. Pages are
+    handed over through a bounded queue, so memory stays proportional to
+    ``max_workers * page_size`` however many records are fetched in total.
+    Records are yielded in arrival order. A failing query is logged,
+    counted as ``live_queries_failed`` in the run metrics, appended to
+    ``failed`` if given, and skipped; if every query fails the last error
+    is re-raised. With ``source_field`` each record is tagged with the
+    query that returned it as ``{"search_term": ..., "country": ...}``
+    under that key.
+
+    ``progress`` resumes queries from an earlier run (finished ones are
+    skipped). ``on_page(query, progress)`` is called once every record of a
+    page has been consumed, i.e. when the caller asks for the record after
+    the page's last one, so a checkpoint taken then covers exactly the
+    records handed out.
+
+    ``split(query, fetched)`` is called with each query that finishes in
+    this run; the queries it returns are run as well, on the same pool
+    (see WindowPlanner). Each is reported through ``on_page`` with no
+    records fetched and its first page request before any of its records,
+    so a checkpoint knows about them. With ``split`` a query's records are
+    held back until it finishes, and dropped if it is split, because its
+    replacements fetch the same records again; memory is then bounded by
+    ``max_workers * max_items`` instead. A failed query's held records are
+    dropped too. Queries are tuples whose first two items are the search
+    term and country.
+    """
+    queries = list(queries)
+    if not queries:
+        return
+
+    workers = max(1, int(max_workers) if split is not None else min(int(max_workers), len(queries)))
+    LOGGER.info(
+        "Fetching %d live queries with up to %d concurrent workers.",
+        len(queries),
+        workers,
+    )
+
+    pages: "queue.Queue[Any]" = queue.Queue(maxsize=workers * 2)
+    stop = threading.Event()
+
+    def put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fetch_one(index: int, query: Any) -> None:
+        error: Optional[BaseException] = None
+        started = time.monotonic()
+        resumed = (progress or {}).get(query)
+        count = resumed.fetched if resumed is not None else 0
+        source = {"search_term": query[0], "country": query[1]}
+        if resumed is not None and resumed.next_request is None:
+            put(_QueryDone(index, None, count, fresh=False))
+            return
+        try:
+            query_pages = iter_pages(
+                client,
+                api_url,
+                params_for(query),
+                max_items - count,
+                page_size,
+                start=resumed.next_request if resumed is not None else None,
+            )
+            for page in query_pages:
+                if source_field is not None:
+                    for record in page.records:
+                        if isinstance(record, dict):
+                            record[source_field] = dict(source)
+                count += len(page.records)
+                if not put(_QueryPage(index, page.records, QueryProgress(count, page.next_request))):
+                    return
+        except Exception as err:
+            error = err
+        else:
+            LOGGER.debug(
+                "Query term=%r country=%r returned %d records in %.2fs",
+                query[0],
+                query[1],
+                count,
+                time.monotonic() - started,
+            )
+        put(_QueryDone(index, error, count))
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="live-fetch")
+    try:
+        for index, query in enumerate(queries):
+            pool.submit(in_context(fetch_one), index, query)
+
+        finished = 0
+        succeeded = 0
+        total = 0
+        last_error: BaseException = RuntimeError("No live queries succeeded.")
+        # Records and progress of queries that may still be split.
+        held: Dict[int, List[Dict[str, Any]]] = {}
+        held_progress: Dict[int, QueryProgress] = {}
+        while finished < len(queries):
+            item = pages.get()
+            if isinstance(item, _QueryDone):
+                finished += 1
+                records = held.pop(item.index, [])
+                last_page = held_progress.pop(item.index, None)
+                if item.error is None:
+                    succeeded += 1
+                    query = queries[item.index]
+                    children = split(query, item.fetched) if split and item.fresh else ()
+                    if children:
+                        LOGGER.debug("Dropped %d records of split query %r.", len(records), query)
+                        if on_page is not None:
+                            on_page(query, QueryProgress(item.fetched, None))
+                    elif records:
+                        total += len(records)
+                        yield from records
+                        if on_page is not None and last_page is not None:
+                            on_page(query, last_page)
+                    for child in children:
+                        if on_page is not None:
+                            first = (api_url, dict(params_for(child), limit=min(page_size, max_items)))
+                            on_page(child, QueryProgress(0, first))
+                        queries.append(child)
+                        pool.submit(in_context(fetch_one), len(queries) - 1, child)
+                else:
+                    last_error = item.error
+                    term, country = queries[item.index][:2]
+                    LOGGER.error(
+                        "Live query term=%r country=%r failed: %s", term, country, item.error
+                    )
+                    get_metrics().count("live_queries_failed")
+                    if failed is not None:
+                        failed.append(queries[item.index])
+                continue
+            if split is not None:
+                held.setdefault(item.index, []).extend(item.records)
+                held_progress[item.index] = item.progress
+                continue
+            total += len(item.records)
+            yield from item.records
+            if on_page is not None:
+                on_page(queries[item.index], item.progress)
+
+        get_metrics().count("live_queries", len(queries))
+        if not succeeded:
+            raise last_error
+        LOGGER.info(
+            "Merged %d records from %d/%d successful queries.",
+            total,
+            succeeded,
+            len(queries),
+        )
+    finally:
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -1,17 +1,35 @@
-thonfrom pathlib import Path
-from typing import Any, Dict, Iterable, List
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import functools
+import hashlib
 import logging
-import os
-import uuid
+import threading
+import time
 
 import requests
 
+from extractors.ad_record import AdRecord, expand_ad
+from extractors.creative_hash import (
+    CREATIVE_CLUSTERS_FIELD,
+    IMAGE_EXTENSIONS,
+    cluster_blobs,
+    pillow_available,
+)
+from extractors.media_store import MediaStore, StoredMedia, guess_extension, normalize_media_url
+from utils.http_client import build_session
+from utils.metrics import get_metrics, in_context, pipeline_stage
+from utils.rate_limit import RETRYABLE_STATUS, HostRateLimiter, backoff_delay
+
 LOGGER = logging.getLogger(__name__)
 
 def extract_image_urls_from_ad(ad: Dict[str, Any]) -> List[str]:
     """
-    Extract image URLs from a normalized ad structure.
+    Extract image URLs from a normalized ad structure (dict or AdRecord).
     """
+    if isinstance(ad, AdRecord):
+        return [str(url) for url in ad.image_urls if url]
     urls: List[str] = []
     snapshot = ad.get("snapshot") or {}
     if isinstance(snapshot, dict):
@@ -26,70 +44,391 @@ def extract_image_urls_from_ad(ad: Dict[str, Any]) -> List[str]:
 
     return urls
 
-def download_media_assets(
-    ads: Iterable[Dict[str, Any]],
-    download_dir: Path,
-    timeout: int = 15,
-) -> None:
+@dataclass
+class DownloadStats:
+    downloaded: int = 0
+    cached: int = 0
+    revalidated: int = 0
+    deduplicated: int = 0
+    failed: int = 0
+    retries: int = 0
+    bytes: int = 0
+    started: float = field(default_factory=time.monotonic)
+    finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    def summary(self) -> str:
+        elapsed = max(self.elapsed, 1e-9)
+        return (
+            f"{self.downloaded} downloaded, {self.cached} cached, "
+            f"{self.revalidated} revalidated, {self.deduplicated} deduplicated, "
+            f"{self.failed} failed, {self.retries} retries, "
+            f"{self.bytes / 1e6:.1f} MB in {elapsed:.1f}s "
+            f"({self.downloaded / elapsed:.1f} files/s, "
+            f"{self.bytes / 1e6 / elapsed:.2f} MB/s)"
+        )
+
+class _RetryableError(Exception):
+    pass
+
+class _NotModified(Exception):
+    pass
+
+class MediaDownloader:
     """
-    Download image assets for each ad to the given directory.
+    Concurrent image downloader.
 
-    - Skips invalid URLs.
-    - Avoids overwriting files by using UUIDs when necessary.
+    Ads are handed over with submit_ad() as soon as they are parsed, so
+    downloads overlap with fetching and normalization; close() waits for the
+    remaining work and returns the run's DownloadStats. The connection pool
+    is sized to the worker count, requests are rate limited per host, and
+    transient failures are retried with jittered exponential backoff.
+
+    Files go into a content-addressed MediaStore. URLs already in its index
+    are not requested again unless they are older than ``revalidate_after``
+    seconds, in which case a conditional request is sent.
+
+    With ``cluster_creatives`` the images stored by the run are hashed once
+    the downloads finish and grouped into clusters of near-identical
+    creatives (see extractors.creative_hash), against the hashes the store
+    kept from earlier runs. cluster() returns the clusters of every ad
+    submitted; close() also writes them to ``creatives.json`` in the store.
     """
-    download_dir = Path(download_dir)
-    download_dir.mkdir(parents=True, exist_ok=True)
-    LOGGER.info("Downloading media assets to %s", download_dir)
-
-    session = requests.Session()
-    session.headers.update(
-        {
-            "User-Agent": "facebook-ads-library-scraper/1.0 (+https://bitbash.dev)",
-        }
-    )
-
-    count = 0
-    for ad in ads:
-        ad_id = ad.get("ad_archive_id") or "unknown"
-        urls = extract_image_urls_from_ad(ad)
-        if not urls:
-            continue
 
+    def __init__(
+        self,
+        download_dir: Path,
+        workers: int = 8,
+        requests_per_second: float = 0.0,
+        retries: int = 3,
+        timeout: int = 15,
+        revalidate_after: float = 0.0,
+        progress_interval: float = 10.0,
+        cluster_creatives: bool = False,
+        hash_distance: int = 4,
+        hash_workers: int = 0,
+    ) -> None:
+        self.download_dir = Path(download_dir)
+        self.store = MediaStore(self.download_dir)
+        self.revalidate_after = float(revalidate_after or 0.0)
+        self.workers = max(1, int(workers))
+        self.retries = max(0, int(retries))
+        self.timeout = timeout
+        self.progress_interval = progress_interval
+        self.stats = DownloadStats()
+        self.cluster_creatives = bool(cluster_creatives)
+        self.hash_distance = max(0, int(hash_distance))
+        self.hash_workers = max(0, int(hash_workers))
+        if self.cluster_creatives and not pillow_available():
+            LOGGER.warning(
+                "Creative clustering requires Pillow ('pip install Pillow'); skipping it."
+            )
+            self.cluster_creatives = False
+        self.ad_clusters: Dict[str, List[str]] = {}
+
+        self._session = build_session(pool_size=self.workers)
+        self._rate_limiter = HostRateLimiter(requests_per_second)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="media")
+        # Bound queued work so a fast parser cannot pile up unbounded futures.
+        self._slots = threading.BoundedSemaphore(self.workers * 4)
+        self._lock = threading.Lock()
+        self._last_progress = time.monotonic()
+        self._accepting = True
+        self._closed = False
+        self._clustered = False
+        self._ad_ids: Set[str] = set()
+        # Normalized URL -> event set once its download finishes, so the
+        # same creative queued by many ads is only fetched once.
+        self._inflight: Dict[str, threading.Event] = {}
+
+        LOGGER.info(
+            "Downloading media assets to %s with %d workers", self.download_dir, self.workers
+        )
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]) -> "MediaDownloader":
+        return cls(
+            Path(settings["media_download_dir"]),
+            workers=settings["media_workers"],
+            requests_per_second=settings["media_requests_per_second"],
+            retries=settings["media_retries"],
+            timeout=settings["http_timeout"],
+            revalidate_after=settings["media_revalidate_after"],
+            cluster_creatives=settings["cluster_creatives"],
+            hash_distance=settings["creative_hash_distance"],
+            hash_workers=settings["creative_hash_workers"],
+        )
+
+    @pipeline_stage("media")
+    def submit_ad(self, ad: Dict[str, Any]) -> None:
+        """
+        Queue every image of a normalized ad for download. Blocks when the
+        queue is full, applying back-pressure to the producer.
+        """
+        if not self._accepting:
+            raise RuntimeError("MediaDownloader is closed.")
+        ad_id = str(ad.get("ad_archive_id") or "unknown")
+        urls = extract_image_urls_from_ad(ad)
+        if urls and self.cluster_creatives:
+            self._ad_ids.add(ad_id)
         for url in urls:
+            self._slots.acquire()
+            future = self._pool.submit(in_context(self._download), url, ad_id)
+            future.add_done_callback(functools.partial(self._on_done, url, ad_id))
+
+    def submit_ads(self, ads: Iterable[Dict[str, Any]]) -> None:
+        for ad in ads:
+            self.submit_ad(ad)
+
+    @pipeline_stage("media")
+    def cluster(self) -> Dict[str, List[str]]:
+        """
+        Wait for the queued downloads, cluster the images not clustered by
+        an earlier run and return the sorted cluster ids of each submitted
+        ad that has any. No ads can be submitted afterwards.
+        """
+        self._accepting = False
+        self._pool.shutdown(wait=True)
+        if not self.cluster_creatives or self._clustered:
+            return self.ad_clusters
+        self._clustered = True
+        blobs = self.store.unclustered_blobs(IMAGE_EXTENSIONS)
+        if blobs:
+            results = cluster_blobs(
+                self.store.creative_hashes(),
+                blobs,
+                max_distance=self.hash_distance,
+                workers=self.hash_workers,
+            )
+            self.store.save_creatives(results)
+            hashed = sum(1 for _, value_hash, _ in results if value_hash is not None)
+            get_metrics().count("creatives_hashed", hashed)
+            LOGGER.info(
+                "Hashed %d new creatives (%d could not be decoded).", hashed, len(results) - hashed
+            )
+        self.ad_clusters = self.store.creative_clusters(self._ad_ids)
+        return self.ad_clusters
+
+    def with_clusters(self, ad: Any) -> Dict[str, Any]:
+        """
+        The ad as a dict carrying the ``creative_clusters`` found for it by
+        cluster() (an empty list if it has none).
+        """
+        record = expand_ad(ad)
+        if isinstance(record, dict):
+            key = str(record.get("ad_archive_id") or "unknown")
+            record[CREATIVE_CLUSTERS_FIELD] = self.ad_clusters.get(key, [])
+        return record
+
+    @pipeline_stage("media")
+    def close(self) -> DownloadStats:
+        if not self._closed:
+            self._closed = True
+            self._accepting = False
+            self._pool.shutdown(wait=True)
+            self._session.close()
             try:
-                filename = _derive_filename(url, ad_id)
-                filepath = download_dir / filename
+                if self.cluster_creatives:
+                    try:
+                        self.store.export_creatives(self.cluster())
+                    except Exception as err:
+                        LOGGER.exception("Creative clustering failed: %s", err)
+                self.store.export_manifest()
+            finally:
+                self.store.close()
+            self.stats.finished = time.monotonic()
+            metrics = get_metrics()
+            metrics.add_records("media", self.stats.downloaded)
+            metrics.add_bytes("media", self.stats.bytes)
+            LOGGER.info("Finished downloading media: %s", self.stats.summary())
+        return self.stats
 
-                if filepath.exists():
-                    LOGGER.debug("File already exists, skipping: %s", filepath)
-                    continue
+    def __enter__(self) -> "MediaDownloader":
+        return self
 
-                LOGGER.debug("Downloading %s for ad %s", url, ad_id)
-                resp = session.get(url, stream=True, timeout=timeout)
-                resp.raise_for_status()
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
 
-                with open(filepath, "wb") as f:
-                    for chunk in resp.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
+    def _on_done(self, url: str, ad_id: str, future: Future) -> None:
+        self._slots.release()
+        # _download handles download errors itself; anything that escapes
+        # it (e.g. a media store error) would otherwise vanish with the future.
+        error = None if future.cancelled() else future.exception()
+        if error is not None:
+            LOGGER.error(
+                "Media task for ad %s failed on %s: %s", ad_id, url, error, exc_info=error
+            )
+            self._count("failed")
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_progress < self.progress_interval:
+                return
+            self._last_progress = now
+        LOGGER.info("Media download progress: %s", self.stats.summary())
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(self.stats, name, getattr(self.stats, name) + amount)
+
+    def _download(self, url: str, ad_id: str) -> None:
+        url_key = normalize_media_url(url)
+        with self._lock:
+            waiter = self._inflight.get(url_key)
+            if waiter is None:
+                self._inflight[url_key] = threading.Event()
+        if waiter is not None:
+            # Another worker is fetching the same creative; reuse its result.
+            waiter.wait()
+            stored = self.store.lookup(url)
+            if stored is not None:
+                self.store.link(ad_id, url, stored.sha256)
+                self._count("cached")
+            else:
+                self._count("failed")
+            return
+
+        try:
+            self._download_once(url, ad_id)
+        finally:
+            with self._lock:
+                self._inflight.pop(url_key).set()
 
-                count += 1
+    def _download_once(self, url: str, ad_id: str) -> None:
+        stored = self.store.lookup(url)
+        if stored is not None and not self._needs_revalidation(stored):
+            LOGGER.debug("Media already stored, skipping request: %s", url)
+            self.store.link(ad_id, url, stored.sha256)
+            self._count("cached")
+            return
+
+        for attempt in range(self.retries + 1):
+            try:
+                sha256, size, is_new = self._fetch_to_store(url, stored)
+            except _NotModified:
+                assert stored is not None
+                self.store.touch(url)
+                self.store.link(ad_id, url, stored.sha256)
+                self._count("revalidated")
+                return
+            except _RetryableError as err:
+                error: Exception = err
+            except requests.RequestException as err:
+                status = err.response.status_code if err.response is not None else None
+                if status is not None and status not in RETRYABLE_STATUS:
+                    LOGGER.warning("Failed to download image for ad %s from %s: %s", ad_id, url, err)
+                    self._count("failed")
+                    return
+                error = err
             except Exception as err:
                 LOGGER.warning("Failed to download image for ad %s from %s: %s", ad_id, url, err)
+                self._count("failed")
+                return
+            else:
+                self.store.link(ad_id, url, sha256)
+                self._count("downloaded")
+                self._count("bytes", size)
+                if not is_new:
+                    self._count("deduplicated")
+                return
+
+            if attempt < self.retries:
+                delay = backoff_delay(attempt)
+                LOGGER.debug("Retrying %s in %.2fs after: %s", url, delay, error)
+                self._count("retries")
+                time.sleep(delay)
+
+        LOGGER.warning("Failed to download image for ad %s from %s: %s", ad_id, url, error)
+        self._count("failed")
+
+    def _needs_revalidation(self, stored: StoredMedia) -> bool:
+        if self.revalidate_after <= 0:
+            return False
+        return time.time() - stored.checked_at >= self.revalidate_after
+
+    def _fetch_to_store(
+        self, url: str, stored: Optional[StoredMedia]
+    ) -> Tuple[str, int, bool]:
+        headers: Dict[str, str] = {}
+        if stored is not None:
+            if stored.etag:
+                headers["If-None-Match"] = stored.etag
+            if stored.last_modified:
+                headers["If-Modified-Since"] = stored.last_modified
 
-    LOGGER.info("Finished downloading %d media files.", count)
+        self._rate_limiter.acquire(url)
+        LOGGER.debug("Downloading %s", url)
+        started = time.perf_counter()
+        try:
+            return self._stream_to_store(url, stored, headers)
+        except requests.RequestException:
+            get_metrics().count("media_errors")
+            raise
+        finally:
+            # Latency includes reading the body, which is the bulk of an image.
+            get_metrics().observe("http_request_duration_seconds", time.perf_counter() - started, "media")
 
-def _derive_filename(url: str, ad_id: str) -> str:
+    def _stream_to_store(
+        self, url: str, stored: Optional[StoredMedia], headers: Dict[str, str]
+    ) -> Tuple[str, int, bool]:
+        with self._session.get(url, stream=True, timeout=self.timeout, headers=headers) as resp:
+            if resp.status_code == 304 and stored is not None:
+                raise _NotModified()
+            if resp.status_code in RETRYABLE_STATUS:
+                raise _RetryableError(f"HTTP {resp.status_code} from {url}")
+            resp.raise_for_status()
+
+            # Stream into a temp file while hashing, so an interrupted
+            # download never lands in the store.
+            tmp_path = self.store.new_temp_file()
+            digest = hashlib.sha256()
+            size = 0
+            try:
+                with open(tmp_path, "wb") as f:
+                    for chunk in resp.iter_content(chunk_size=65536):
+                        if chunk:
+                            f.write(chunk)
+                            digest.update(chunk)
+                            size += len(chunk)
+                sha256 = digest.hexdigest()
+                is_new = self.store.add_file(
+                    url,
+                    tmp_path,
+                    sha256,
+                    size,
+                    guess_extension(url, resp.headers.get("Content-Type")),
+                    etag=resp.headers.get("ETag"),
+                    last_modified=resp.headers.get("Last-Modified"),
+                )
+            except BaseException:
+                tmp_path.unlink(missing_ok=True)
+                raise
+        return sha256, size, is_new
+
+def download_media_assets(
+    ads: Iterable[Dict[str, Any]],
+    download_dir: Path,
+    timeout: int = 15,
+    workers: int = 8,
+    requests_per_second: float = 0.0,
+    retries: int = 3,
+) -> DownloadStats:
     """
-    Build a safe filename based on the URL and ad ID.
+    Download image assets for each ad to the given directory.
+
+    - Skips invalid URLs.
+    - Stores each distinct image once, keyed by content hash, and skips
+      URLs already downloaded by a previous run.
+    - Downloads concurrently on ``workers`` threads with retries.
     """
-    basename = os.path.basename(url.split("?", 1)[0]) or "image"
-    if "." in basename:
-        name, ext = basename.rsplit(".", 1)
-        ext = "." + ext
-    else:
-        name, ext = basename, ".jpg"
-
-    safe_name = f"{ad_id}_{name}".replace("/", "_").replace("\\", "_")
-    unique_suffix = uuid.uuid4().hex[:8]
-    return f"{safe_name}_{unique_suffix}{ext}"
\ No newline at end of file
+    with MediaDownloader(
+        download_dir,
+        workers=workers,
+        requests_per_second=requests_per_second,
+        retries=retries,
+        timeout=timeout,
+    ) as downloader:
+        downloader.submit_ads(ads)
+    return downloader.stats
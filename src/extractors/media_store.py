@@ -0,0 +1,341 @@
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from utils.helpers import json_dumps
+
+LOGGER = logging.getLogger(__name__)
+
+INDEX_FILENAME = "index.sqlite3"
+MANIFEST_FILENAME = "manifest.json"
+CREATIVES_FILENAME = "creatives.json"
+
+# Query parameters that sign or route CDN URLs without changing the image.
+# fbcdn links carry fresh `oh`/`oe`/`_nc_*` values on every API response.
+_VOLATILE_PARAMS = {"oh", "oe", "stp", "ccb", "efg"}
+_VOLATILE_PREFIXES = ("_nc_",)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS urls (
+    url_key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    sha256 TEXT NOT NULL REFERENCES blobs(sha256),
+    etag TEXT,
+    last_modified TEXT,
+    checked_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS manifest (
+    ad_archive_id TEXT NOT NULL,
+    url_key TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (ad_archive_id, url_key)
+);
+CREATE INDEX IF NOT EXISTS manifest_sha256 ON manifest(sha256);
+CREATE TABLE IF NOT EXISTS creatives (
+    sha256 TEXT PRIMARY KEY REFERENCES blobs(sha256),
+    dhash TEXT,
+    cluster TEXT
+);
+CREATE INDEX IF NOT EXISTS creatives_cluster ON creatives(cluster);
+"""
+
+def normalize_media_url(url: str) -> str:
+    """
+    Canonical form of a media URL used as the index key: lower-cased scheme
+    and host, no fragment, volatile CDN signature params dropped and the
+    remaining query params sorted.
+    """
+    parts = urlsplit(url.strip())
+    query = sorted(
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k not in _VOLATILE_PARAMS and not k.startswith(_VOLATILE_PREFIXES)
+    )
+    return urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(query), "")
+    )
+
+def guess_extension(url: str, content_type: Optional[str] = None) -> str:
+    ext = os.path.splitext(urlsplit(url).path)[1].lower()
+    if ext and len(ext) <= 5 and ext[1:].isalnum():
+        return ext
+    content_type = (content_type or "").split(";", 1)[0].strip().lower()
+    return {
+        "image/png": ".png",
+        "image/gif": ".gif",
+        "image/webp": ".webp",
+        "video/mp4": ".mp4",
+    }.get(content_type, ".jpg")
+
+class StoredMedia(NamedTuple):
+    url_key: str
+    sha256: str
+    path: Path
+    etag: Optional[str]
+    last_modified: Optional[str]
+    checked_at: float
+
+class MediaStore:
+    """
+    Content-addressed media store shared across runs.
+
+    Blobs live under ``blobs/<sha[:2]>/<sha256><ext>`` so identical creatives
+    are stored once however many ads or URLs reference them. A SQLite index
+    maps normalized URLs to blobs (with their ETag/Last-Modified validators)
+    and keeps a manifest of which blobs belong to which ``ad_archive_id``.
+    Manifest links are written ``LINK_BATCH`` at a time, and the ads linked
+    since the store was opened are remembered so export_manifest() only
+    has to write this run's part.
+    """
+
+    LINK_BATCH = 256
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+        self.blob_dir = self.root / "blobs"
+        self.tmp_dir = self.root / "tmp"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.root / INDEX_FILENAME), timeout=30, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute("CREATE TEMP TABLE run_ads (ad_archive_id TEXT PRIMARY KEY)")
+        self._conn.commit()
+        self._pending_links: List[Tuple[str, str, str]] = []
+
+    def blob_path(self, sha256: str, ext: str) -> Path:
+        return self.blob_dir / sha256[:2] / f"{sha256}{ext}"
+
+    def lookup(self, url: str) -> Optional[StoredMedia]:
+        """
+        Return the stored blob for ``url`` if it is indexed and still on disk.
+        """
+        url_key = normalize_media_url(url)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT u.sha256, b.ext, u.etag, u.last_modified, u.checked_at "
+                "FROM urls u JOIN blobs b ON b.sha256 = u.sha256 WHERE u.url_key = ?",
+                (url_key,),
+            ).fetchone()
+        if row is None:
+            return None
+        sha256, ext, etag, last_modified, checked_at = row
+        path = self.blob_path(sha256, ext)
+        if not path.exists():
+            return None
+        return StoredMedia(url_key, sha256, path, etag, last_modified, checked_at)
+
+    def new_temp_file(self) -> Path:
+        fd, name = tempfile.mkstemp(dir=self.tmp_dir, suffix=".part")
+        os.close(fd)
+        return Path(name)
+
+    def add_file(
+        self,
+        url: str,
+        tmp_path: Path,
+        sha256: str,
+        size: int,
+        ext: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> bool:
+        """
+        Move a fully downloaded temp file into the store under its content
+        hash and index ``url`` against it. Returns False if an identical blob
+        was already stored (the temp file is discarded).
+        """
+        url_key = normalize_media_url(url)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT ext FROM blobs WHERE sha256 = ?", (sha256,)
+            ).fetchone()
+            if row is not None:
+                ext = row[0]
+            final_path = self.blob_path(sha256, ext)
+            is_new = not final_path.exists()
+            if is_new:
+                final_path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, final_path)
+            else:
+                tmp_path.unlink(missing_ok=True)
+
+            self._conn.execute(
+                "INSERT OR IGNORE INTO blobs (sha256, ext, size, created_at) VALUES (?, ?, ?, ?)",
+                (sha256, ext, size, now),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO urls "
+                "(url_key, url, sha256, etag, last_modified, checked_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url_key, url, sha256, etag, last_modified, now),
+            )
+            self._conn.commit()
+        return is_new
+
+    def touch(self, url: str) -> None:
+        """
+        Record that ``url`` was successfully revalidated just now.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE urls SET checked_at = ? WHERE url_key = ?",
+                (time.time(), normalize_media_url(url)),
+            )
+            self._conn.commit()
+
+    def link(self, ad_archive_id: str, url: str, sha256: str) -> None:
+        """
+        Record that ``ad_archive_id`` uses the blob ``sha256`` for ``url``.
+        Links are committed in batches; anything reading the manifest
+        flushes them first.
+        """
+        with self._lock:
+            self._pending_links.append((str(ad_archive_id), normalize_media_url(url), sha256))
+            if len(self._pending_links) >= self.LINK_BATCH:
+                self._flush_links()
+
+    def _flush_links(self) -> None:
+        # Callers hold self._lock.
+        if not self._pending_links:
+            return
+        links, self._pending_links = self._pending_links, []
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO manifest (ad_archive_id, url_key, sha256) VALUES (?, ?, ?)",
+                links,
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO temp.run_ads (ad_archive_id) VALUES (?)",
+                [(ad_archive_id,) for ad_archive_id, _, _ in links],
+            )
+
+    def manifest(self, current_run: bool = False) -> Dict[str, Any]:
+        """
+        Map each ``ad_archive_id`` to the store-relative paths of its blobs:
+        every ad in the store, or with ``current_run`` only the ads linked
+        since the store was opened.
+        """
+        query = (
+            "SELECT m.ad_archive_id, b.sha256, b.ext FROM manifest m "
+            "JOIN blobs b ON b.sha256 = m.sha256 "
+        )
+        if current_run:
+            query += "WHERE m.ad_archive_id IN (SELECT ad_archive_id FROM temp.run_ads) "
+        result: Dict[str, Any] = {}
+        with self._lock:
+            self._flush_links()
+            rows = self._conn.execute(query + "ORDER BY m.ad_archive_id, m.url_key").fetchall()
+        for ad_archive_id, sha256, ext in rows:
+            rel = self.blob_path(sha256, ext).relative_to(self.root).as_posix()
+            result.setdefault(ad_archive_id, []).append(rel)
+        return result
+
+    def export_manifest(self, path: Optional[Path] = None) -> Path:
+        """
+        Write the manifest of this run's ads (as in creatives.json) to
+        ``manifest.json``; the links of earlier runs stay in the index.
+        """
+        path = Path(path) if path is not None else self.root / MANIFEST_FILENAME
+        tmp_path = path.with_name(path.name + ".tmp")
+        with tmp_path.open("wb") as f:
+            f.write(json_dumps(self.manifest(current_run=True), pretty=True))
+        os.replace(tmp_path, path)
+        return path
+
+    def unclustered_blobs(self, extensions: Sequence[str]) -> List[Tuple[str, Path]]:
+        """
+        ``(sha256, path)`` of the stored blobs with one of ``extensions``
+        that have not been through creative clustering yet.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT b.sha256, b.ext FROM blobs b LEFT JOIN creatives c ON c.sha256 = b.sha256 "
+                "WHERE c.sha256 IS NULL"
+            ).fetchall()
+        extensions = tuple(ext.lower() for ext in extensions)
+        return [
+            (sha256, self.blob_path(sha256, ext))
+            for sha256, ext in rows
+            if ext.lower() in extensions
+        ]
+
+    def creative_hashes(self) -> Iterator[Tuple[int, str]]:
+        """
+        ``(dhash, cluster)`` of every creative clustered so far.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT dhash, cluster FROM creatives WHERE dhash IS NOT NULL"
+            ).fetchall()
+        for dhash, cluster in rows:
+            yield int(dhash, 16), cluster
+
+    def save_creatives(self, rows: Iterable[Tuple[str, Optional[int], Optional[str]]]) -> None:
+        """
+        Store ``(sha256, dhash, cluster)`` results; blobs that could not be
+        decoded are saved with a None hash so they are not retried.
+        """
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO creatives (sha256, dhash, cluster) VALUES (?, ?, ?)",
+                [
+                    (sha256, f"{dhash:016x}" if dhash is not None else None, cluster)
+                    for sha256, dhash, cluster in rows
+                ],
+            )
+            self._conn.commit()
+
+    def creative_clusters(self, ad_archive_ids: Iterable[str]) -> Dict[str, List[str]]:
+        """
+        Map each of ``ad_archive_ids`` that has clustered creatives to the
+        sorted ids of their clusters.
+        """
+        wanted = set(map(str, ad_archive_ids))
+        result: Dict[str, List[str]] = {}
+        if not wanted:
+            return result
+        with self._lock:
+            self._flush_links()
+            rows = self._conn.execute(
+                "SELECT DISTINCT m.ad_archive_id, c.cluster FROM manifest m "
+                "JOIN creatives c ON c.sha256 = m.sha256 WHERE c.cluster IS NOT NULL "
+                "ORDER BY m.ad_archive_id, c.cluster"
+            ).fetchall()
+        for ad_archive_id, cluster in rows:
+            if ad_archive_id in wanted:
+                result.setdefault(ad_archive_id, []).append(cluster)
+        return result
+
+    def export_creatives(self, clusters: Dict[str, List[str]], path: Optional[Path] = None) -> Path:
+        path = Path(path) if path is not None else self.root / CREATIVES_FILENAME
+        tmp_path = path.with_name(path.name + ".tmp")
+        with tmp_path.open("wb") as f:
+            f.write(json_dumps(clusters, pretty=True))
+        os.replace(tmp_path, path)
+        return path
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._flush_links()
+            finally:
+                self._conn.close()
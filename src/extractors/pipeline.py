@@ -0,0 +1,678 @@
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional
+import collections
+import datetime
+import itertools
+import logging
+import sqlite3
+
+from extractors.ad_parser import iter_normalized_ads, iter_normalized_ads_parallel, keep_fields
+from extractors.ad_record import compact_ad, expand_ad, json_default
+from extractors.dedup import MATCHED_QUERIES_FIELD, AdDeduplicator
+from extractors.field_schema import SchemaNormalizer
+from extractors.live_fetcher import (
+    DateWindow,
+    QueryProgress,
+    WindowPlanner,
+    WindowQuery,
+    build_queries,
+    iter_queries_concurrently,
+)
+from utils.checkpoint import RunCheckpoint, iter_written_records, settings_fingerprint
+from utils.columnar import COLUMNAR_FORMATS, SOURCE_FIELD, ColumnarWriter
+from utils.helpers import RecordWriter, save_json_file, set_json_backend
+from utils.json_stream import iter_json_records
+from utils.metrics import Metrics, get_metrics, reset_metrics, timed_stage, write_text_atomic
+
+if TYPE_CHECKING:  # pragma: no cover
+    from extractors.media_handler import MediaDownloader
+    from extractors.state_store import SeenAdsStore
+    from utils.http_client import ApiClient
+
+LOGGER = logging.getLogger(__name__)
+
+# Exit status of a run that wrote its output but lost some live queries.
+EXIT_PARTIAL = 3
+
+def build_query_params(
+    settings: Dict[str, Any],
+    search_term: Optional[str] = None,
+    country: Optional[str] = None,
+    window: Optional[DateWindow] = None,
+) -> Dict[str, Any]:
+    """
+    Build query parameters for a generic HTTP-based ads endpoint.
+
+    This is intentionally generic so you can point it at your own proxy or
+    scraping backend which exposes a Facebook Ads Library compatible interface.
+    When ``search_term``/``country`` are omitted the first configured values
+    are used. A ``window`` replaces the configured delivery date range.
+    """
+    if search_term is None:
+        search_term = settings["search_terms"][0] if settings["search_terms"] else ""
+    if country is None:
+        country = settings["countries"][0] if settings["countries"] else ""
+
+    params: Dict[str, Any] = {
+        "q": search_term,
+        "country": country,
+        "limit": min(settings["page_size"], settings["max_items"]),
+    }
+    date_min, date_max = window if window is not None else (settings["date_min"], settings["date_max"])
+    if date_min:
+        params["ad_delivery_date_min"] = date_min
+    if date_max:
+        params["ad_delivery_date_max"] = date_max
+    # Additional params for custom backends can be added here
+    return params
+
+def _partition_by(settings: Dict[str, Any]) -> List[str]:
+    # Partitioning only applies to columnar output.
+    if settings["output_format"] not in COLUMNAR_FORMATS:
+        return []
+    return settings["partition_by"]
+
+def _partitions_by_query(settings: Dict[str, Any]) -> bool:
+    return settings["live_mode"] and any(
+        key in ("country", "search_term") for key in _partition_by(settings)
+    )
+
+def _tracks_matches(settings: Dict[str, Any]) -> bool:
+    """
+    Whether ads get the ``matched_queries`` that returned them: deduplicated
+    live runs over more than one query, outside incremental mode (where the
+    provenance would make ads look changed from run to run).
+    """
+    return (
+        settings["live_mode"]
+        and settings["dedup"] != "off"
+        and not settings["incremental"]
+        and len(build_queries(settings["search_terms"], settings["countries"])) > 1
+    )
+
+def _tags_source(settings: Dict[str, Any]) -> bool:
+    """
+    Whether live records must carry the query that returned them, which is
+    needed to partition output by country or search term and to record
+    which queries matched an ad.
+    """
+    return _partitions_by_query(settings) or _tracks_matches(settings)
+
+def _today() -> str:
+    return datetime.date.today().isoformat()
+
+def _window_planner(settings: Dict[str, Any]) -> Optional[WindowPlanner]:
+    """
+    The adaptive window planner for a live run, or None when windows are
+    not split (adaptive_windows off, or no date_min to split from).
+    """
+    if not settings["adaptive_windows"] or not settings["date_min"]:
+        return None
+    return WindowPlanner(
+        settings["window_result_cap"] or settings["max_items"],
+        min_days=settings["min_window_days"],
+        split_countries=settings["split_countries"],
+    )
+
+def fetch_ads_live(
+    settings: Dict[str, Any],
+    client: Optional["ApiClient"] = None,
+    checkpoint: Optional[RunCheckpoint] = None,
+    failed: Optional[List[Any]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Fetch the full cross product of configured search terms and countries
+    concurrently, following pagination cursors, and stream the merged raw
+    records as pages arrive. A ``client`` passed in is used and left open;
+    otherwise one is created for this run. With a ``checkpoint`` queries
+    resume from their saved cursors and report each page consumed. Queries
+    that fail while others succeed are appended to ``failed``.
+    """
+    api_url = settings["api_url"]
+    if not api_url:
+        raise RuntimeError(
+            "No 'api_url' configured for live mode. "
+            "Update your settings file with a reachable backend URL."
+        )
+
+    if client is None:
+        # Only live runs load the HTTP stack (requests, urllib3).
+        from utils.http_client import ApiClient
+
+        with ApiClient.from_settings(settings) as own_client:
+            yield from fetch_ads_live(settings, own_client, checkpoint, failed)
+        return
+
+    progress: Dict[Any, QueryProgress] = {}
+    on_page: Optional[Callable[[Any, QueryProgress], None]] = None
+    if checkpoint is not None:
+        progress = {
+            query: QueryProgress(fetched, next_request)
+            for query, (fetched, next_request) in checkpoint.queries.items()
+        }
+
+        def page_done(query: Any, state: QueryProgress) -> None:
+            checkpoint.page_done(query, state.fetched, state.next_request)
+
+        on_page = page_done
+
+    queries: List[Any] = build_queries(settings["search_terms"], settings["countries"])
+    max_items = settings["max_items"]
+    planner = _window_planner(settings)
+    if planner is not None:
+        # A window reaching the cap is split and its records dropped anyway.
+        max_items = min(max_items, planner.result_cap)
+        queries = planner.plan(queries, settings["date_min"], settings["date_max"] or _today())
+        # Windows split off by the interrupted run carry on as well.
+        planned = set(queries)
+        queries.extend(WindowQuery(*key) for key in progress if len(key) == 4 and key not in planned)
+        progress = {WindowQuery(*key) if len(key) == 4 else key: state for key, state in progress.items()}
+
+    def params_for(query: Any) -> Dict[str, Any]:
+        window = (query[2], query[3]) if len(query) == 4 else None
+        return build_query_params(settings, query[0], query[1], window)
+
+    LOGGER.info("Fetching ads from live API: %s", api_url)
+    yield from iter_queries_concurrently(
+        client,
+        api_url,
+        queries,
+        params_for=params_for,
+        max_items=max_items,
+        page_size=settings["page_size"],
+        max_workers=settings["max_concurrency"],
+        source_field=SOURCE_FIELD if _tags_source(settings) else None,
+        progress=progress,
+        on_page=on_page,
+        split=planner.split if planner is not None else None,
+        failed=failed,
+    )
+
+def fetch_ads_offline(settings: Dict[str, Any], decode: bool = True) -> Iterator[Any]:
+    """
+    Stream raw ads from the offline input file (JSON array, ``{"data": [...]}``
+    object or NDJSON, optionally gzip-compressed) without loading it whole.
+    With ``decode=False`` NDJSON lines are passed on as undecoded text.
+    """
+    input_path = Path(settings["offline_input_path"])
+    LOGGER.info("Loading offline input data from %s", input_path)
+    records = iter_json_records(input_path, decode=decode)
+    if input_path.is_file():
+        get_metrics().add_bytes("fetch", input_path.stat().st_size)
+    return records
+
+def _prime(records: Iterable[Dict[str, Any]]) -> Iterable[Dict[str, Any]]:
+    """
+    Pull the first record from a lazy source so connection and decoding
+    errors surface here rather than midway through parsing.
+    """
+    iterator = iter(records)
+    try:
+        first = next(iterator)
+    except StopIteration:
+        return []
+    return itertools.chain([first], iterator)
+
+def _output_size(path: Path) -> int:
+    # Partitioned columnar output is a directory of part files.
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+    return path.stat().st_size if path.exists() else 0
+
+def _uses_worker_pool(settings: Dict[str, Any]) -> bool:
+    # Incremental mode needs decoded records to fingerprint them up front.
+    return settings["normalize_workers"] > 1 and not settings["incremental"]
+
+def _tracked(
+    records: Iterable[Any],
+    checkpoint: Optional[RunCheckpoint],
+    paged: bool,
+) -> Iterable[Any]:
+    if checkpoint is None or isinstance(records, list):
+        return records
+    return checkpoint.track(records, paged)
+
+def load_raw_ads(
+    settings: Dict[str, Any],
+    client: Optional["ApiClient"] = None,
+    offline_fallback: bool = True,
+    checkpoint: Optional[RunCheckpoint] = None,
+    failed: Optional[List[Any]] = None,
+) -> Iterable[Dict[str, Any]]:
+    """
+    Load raw ads either from the live API or the offline file, falling back
+    to offline input if live scraping fails before producing any records
+    (unless ``offline_fallback`` is off, in which case the error is raised).
+    A resumed run never falls back, so its output keeps a single source.
+    Live queries that fail while others succeed are appended to ``failed``.
+    """
+    if settings["live_mode"]:
+        try:
+            live = fetch_ads_live(settings, client, checkpoint, failed)
+            return _tracked(_prime(live), checkpoint, paged=True)
+        except Exception as live_err:
+            if not offline_fallback or (checkpoint is not None and checkpoint.resumed):
+                raise
+            LOGGER.error(
+                "Live scraping failed: %s. Falling back to offline input.",
+                live_err,
+            )
+    records = _prime(fetch_ads_offline(settings, decode=not _uses_worker_pool(settings)))
+    return _tracked(records, checkpoint, paged=False)
+
+def _open_media_downloader(settings: Dict[str, Any]) -> Optional["MediaDownloader"]:
+    if not settings.get("download_media"):
+        return None
+    try:
+        from extractors.media_handler import MediaDownloader
+
+        return MediaDownloader.from_settings(settings)
+    except Exception as err:
+        LOGGER.exception("Could not start media download: %s", err)
+        return None
+
+def _close_media_downloader(downloader: Optional["MediaDownloader"]) -> None:
+    if downloader is None:
+        return
+    try:
+        downloader.close()
+    except Exception as err:
+        LOGGER.exception("Media download encountered an error: %s", err)
+
+def _with_media(
+    ads: Iterable[Dict[str, Any]],
+    downloader: Optional["MediaDownloader"],
+) -> Iterator[Dict[str, Any]]:
+    """
+    Pass normalized ads through unchanged, queueing their images for download
+    on the way so media transfer overlaps with fetching and parsing.
+    """
+    for ad in ads:
+        if downloader is not None:
+            try:
+                downloader.submit_ad(ad)
+            except Exception as err:
+                LOGGER.warning("Could not queue media for ad %s: %s", ad.get("ad_archive_id"), err)
+        yield ad
+
+def _without_source(ads: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    for ad in ads:
+        ad.pop(SOURCE_FIELD, None)
+        yield ad
+
+def normalize_stage(
+    settings: Dict[str, Any],
+    raw_ads: Iterable[Dict[str, Any]],
+    dedup: Optional[AdDeduplicator] = None,
+    store: Optional["SeenAdsStore"] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Turn raw records into the normalized ads to emit, dropping repeated
+    copies of an ad first if ``dedup`` is given. With a ``store`` (incremental
+    mode) only new, changed and ended ads (tagged with ``_delta``) come out,
+    and the caller commits the store once they have been written.
+    """
+    normalize = SchemaNormalizer.from_settings(settings)
+    if _uses_worker_pool(settings):
+        # Offline records reach the workers undecoded, so duplicates can
+        # only be recognized once they come back normalized.
+        if _tags_source(settings):
+            normalize = keep_fields(normalize, [SOURCE_FIELD])
+        ads = iter_normalized_ads_parallel(
+            raw_ads,
+            workers=settings["normalize_workers"],
+            chunk_size=settings["normalize_chunk_size"],
+            normalize=normalize,
+        )
+        if dedup is not None:
+            ads = dedup.filter(ads)
+            if not _partitions_by_query(settings):
+                ads = _without_source(ads)
+        yield from ads
+        return
+
+    kept = []
+    if _partitions_by_query(settings):
+        kept.append(SOURCE_FIELD)
+    if _tracks_matches(settings):
+        kept.append(MATCHED_QUERIES_FIELD)
+    if kept:
+        normalize = keep_fields(normalize, kept)
+    if dedup is not None:
+        raw_ads = dedup.filter(raw_ads)
+    if store is None:
+        yield from iter_normalized_ads(raw_ads, normalize)
+        return
+
+    from extractors.state_store import iter_delta_ads, scope_key
+
+    yield from iter_delta_ads(raw_ads, store, scope_key(settings), normalize)
+
+def open_writer(
+    settings: Dict[str, Any],
+    output_path: Path,
+    checkpoint: Optional[RunCheckpoint] = None,
+    include_clusters: bool = False,
+) -> Any:
+    """
+    Open the incremental writer for the configured output format: a
+    ColumnarWriter for Parquet/Arrow, otherwise a RecordWriter (continuing
+    the output of a resumed ``checkpoint``).
+    """
+    fmt = settings["output_format"]
+    if fmt not in COLUMNAR_FORMATS:
+        if checkpoint is not None and checkpoint.resumed:
+            return RecordWriter(
+                output_path,
+                fmt=fmt,
+                flush_every=settings["flush_every"],
+                resume_offset=checkpoint.output_offset,
+                resume_count=checkpoint.records_written,
+            )
+        return RecordWriter(output_path, fmt=fmt, flush_every=settings["flush_every"])
+
+    # Live records carry the query that returned them (see _tags_source);
+    # offline ones have no country or term, so they go to the default
+    # partition rather than under whatever the settings name.
+    return ColumnarWriter(
+        output_path,
+        fmt=fmt,
+        row_group_size=settings["row_group_size"],
+        partition_by=_partition_by(settings),
+        compression=settings["columnar_compression"],
+        include_delta=settings["incremental"],
+        include_clusters=include_clusters,
+    )
+
+def run_batch(settings: Dict[str, Any], ads: Iterable[Dict[str, Any]]) -> int:
+    """
+    Normalize everything in memory, then write the output in one go
+    (pretty-printed JSON by default). Media downloads start while ads are
+    still being parsed. With ``compact_records`` ads are held as AdRecords
+    until they are written. With creative clustering the downloads are
+    finished before writing, so every ad can carry its ``creative_clusters``.
+    """
+    downloader = _open_media_downloader(settings)
+    try:
+        # Normalize and parse ads
+        try:
+            ads = _with_media(ads, downloader)
+            if settings["compact_records"]:
+                parsed_ads = [compact_ad(ad) for ad in ads]
+            else:
+                parsed_ads = list(ads)
+        except Exception as err:
+            LOGGER.exception("Failed to parse ads: %s", err)
+            return 1
+
+        LOGGER.info("Parsed %d ads into normalized structure.", len(parsed_ads))
+
+        clustered = downloader is not None and downloader.cluster_creatives
+        if clustered:
+            try:
+                with get_metrics().stage_time("media"):
+                    downloader.cluster()
+            except Exception as err:
+                LOGGER.exception("Creative clustering failed: %s", err)
+            parsed_ads = [downloader.with_clusters(ad) for ad in parsed_ads]
+
+        output_path = Path(settings["output_path"])
+        try:
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            with get_metrics().stage_time("write"):
+                if settings["output_format"] == "json":
+                    save_json_file(
+                        output_path,
+                        parsed_ads,
+                        pretty=not settings["compact_output"],
+                        default=json_default,
+                    )
+                else:
+                    with open_writer(settings, output_path, include_clusters=clustered) as writer:
+                        for ad in parsed_ads:
+                            writer.write(expand_ad(ad))
+        except Exception as err:
+            LOGGER.exception("Failed to write output file %s: %s", output_path, err)
+            return 1
+
+        metrics = get_metrics()
+        metrics.add_records("write", len(parsed_ads))
+        metrics.add_bytes("write", _output_size(output_path))
+        LOGGER.info("Wrote normalized ads to %s", output_path)
+    finally:
+        _close_media_downloader(downloader)
+    return 0
+
+def run_streaming(
+    settings: Dict[str, Any],
+    ads: Iterable[Dict[str, Any]],
+    checkpoint: Optional[RunCheckpoint] = None,
+) -> int:
+    """
+    Normalize and write records one at a time so peak memory stays flat and
+    the output file can be tailed while the run is in progress. Media
+    downloads are queued as each record is written. With a ``checkpoint``
+    progress is committed as records are written; a resumed run first
+    requeues media for the records already written (images already in the
+    media store are not requested again).
+    """
+    output_path = Path(settings["output_path"])
+    downloader = _open_media_downloader(settings)
+    try:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        if downloader is not None and checkpoint is not None and checkpoint.resumed:
+            for ad in iter_written_records(output_path, checkpoint.output_offset):
+                downloader.submit_ad(ad)
+        with get_metrics().stage_time("write"), open_writer(settings, output_path, checkpoint) as writer:
+            if checkpoint is not None:
+                checkpoint.writer = writer
+            for ad in _with_media(ads, downloader):
+                writer.write(ad)
+    except Exception as err:
+        LOGGER.exception("Streaming run failed while writing %s: %s", output_path, err)
+        return 1
+    finally:
+        _close_media_downloader(downloader)
+
+    metrics = get_metrics()
+    metrics.add_records("write", writer.count)
+    metrics.add_bytes("write", _output_size(output_path))
+    LOGGER.info("Streamed %d normalized ads to %s", writer.count, output_path)
+    return 0
+
+def write_metrics(settings: Dict[str, Any], metrics: Metrics, status: int, job: Optional[str] = None) -> None:
+    """
+    Log the run summary and write the JSON run report and Prometheus
+    textfile, if configured; a daemon ``job`` is named in both. Failing to
+    write them never fails the run.
+    """
+    metrics.count("runs_failed" if status else "runs_succeeded")
+    LOGGER.info("Run metrics: %s", metrics.summary())
+
+    if settings["metrics_report"]:
+        report = metrics.report()
+        report["status"] = status
+        report["run"] = {
+            "live_mode": settings["live_mode"],
+            "output_format": settings["output_format"],
+            "stream": settings["stream"],
+            "incremental": settings["incremental"],
+            "normalize_workers": settings["normalize_workers"],
+            "json_backend": settings["json_backend"],
+        }
+        if job is not None:
+            report["run"]["job"] = job
+        path = Path(settings["metrics_report"])
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            save_json_file(path, report)
+            LOGGER.info("Wrote run report to %s", path)
+        except OSError as err:
+            LOGGER.warning("Could not write run report %s: %s", path, err)
+
+    if settings["prometheus_textfile"]:
+        path = Path(settings["prometheus_textfile"])
+        try:
+            write_text_atomic(path, metrics.prometheus_text(labels={"job": job} if job is not None else None))
+        except OSError as err:
+            LOGGER.warning("Could not write Prometheus textfile %s: %s", path, err)
+
+def scrape(settings: Dict[str, Any]) -> int:
+    """
+    Run one fetch -> normalize -> write (-> media) pass with validated
+    settings, timing its stages. Returns a process exit code.
+    """
+    metrics = reset_metrics()
+    metrics.start_sampling(settings["metrics_sample_interval"])
+    status = 1
+    try:
+        status = run_pipeline(settings)
+    finally:
+        metrics.stop_sampling()
+        write_metrics(settings, metrics, status)
+    return status
+
+def open_checkpoint(settings: Dict[str, Any]) -> Optional[RunCheckpoint]:
+    """
+    Open the run's checkpoint: only streaming runs writing JSON/NDJSON on a
+    single thread, outside incremental mode, can be checkpointed. Raises
+    ValueError if ``resume`` is set but the checkpoint is for other settings.
+    """
+    supported = (
+        settings["stream"]
+        and settings["output_format"] in RecordWriter.FORMATS
+        and settings["normalize_workers"] == 1
+        and not settings["incremental"]
+    )
+    if not supported or settings["checkpoint_interval"] <= 0:
+        if settings["resume"]:
+            LOGGER.warning(
+                "--resume needs a checkpointed run (--stream, json/ndjson output, one "
+                "normalize worker, not incremental); starting from scratch."
+            )
+        return None
+
+    output_path = Path(settings["output_path"])
+    path = Path(settings["checkpoint_path"] or f"{output_path}.checkpoint.sqlite3")
+    fingerprint = settings_fingerprint(settings)
+    checkpoint = RunCheckpoint(
+        path, fingerprint, resume=settings["resume"], interval=settings["checkpoint_interval"]
+    )
+    if checkpoint.resumed and _output_size(output_path) < checkpoint.output_offset:
+        LOGGER.warning("Output %s is shorter than its checkpoint; starting from scratch.", output_path)
+        checkpoint.close()
+        checkpoint = RunCheckpoint(path, fingerprint, interval=settings["checkpoint_interval"])
+    return checkpoint
+
+def run_pipeline(
+    settings: Dict[str, Any],
+    client: Optional["ApiClient"] = None,
+    offline_fallback: bool = True,
+) -> int:
+    """
+    The scrape itself, without per-run metrics setup. Live requests go
+    through ``client`` if given, so callers can keep connections warm
+    across runs.
+    """
+    LOGGER.info("Effective settings: max_items=%d, live_mode=%s, stream=%s, incremental=%s",
+                settings["max_items"], settings["live_mode"], settings["stream"],
+                settings["incremental"])
+    LOGGER.debug("JSON backend: %s", set_json_backend(settings["json_backend"]))
+    if settings["partition_by"] and not _partition_by(settings):
+        LOGGER.warning("partition_by only applies to parquet/arrow output; ignoring it.")
+
+    try:
+        checkpoint = open_checkpoint(settings)
+    except (ValueError, sqlite3.Error) as err:
+        LOGGER.error("Cannot resume: %s", err)
+        return 1
+
+    failed_queries: List[Any] = []
+    try:
+        raw_ads = load_raw_ads(settings, client, offline_fallback, checkpoint, failed_queries)
+    except Exception as err:
+        LOGGER.exception("Failed to load raw ads data: %s", err)
+        if checkpoint is not None:
+            checkpoint.close()
+        return 1
+
+    if isinstance(raw_ads, list):
+        LOGGER.info("Loaded %d raw ad records.", len(raw_ads))
+
+    dedup = AdDeduplicator.from_settings(
+        settings, SOURCE_FIELD if _tracks_matches(settings) else None
+    )
+    archive = None
+    if settings["archive"]:
+        from extractors.ad_archive import AdArchive
+
+        archive = AdArchive(Path(settings["archive_path"]))
+    store = None
+    if settings["incremental"]:
+        from extractors.state_store import SeenAdsStore
+
+        store = SeenAdsStore(Path(settings["state_path"]))
+    try:
+        if checkpoint is not None and checkpoint.resumed:
+            written = Path(settings["output_path"]), checkpoint.output_offset
+            if dedup is not None:
+                dedup.seed(iter_written_records(*written))
+            if archive is not None:
+                # The tail of the interrupted run may not have been archived.
+                collections.deque(archive.ingest(iter_written_records(*written)), maxlen=0)
+        ads = timed_stage(normalize_stage(settings, timed_stage(raw_ads, "fetch"), dedup, store), "normalize")
+        if archive is not None:
+            ads = timed_stage(archive.ingest(ads), "archive")
+        if settings["stream"]:
+            status = run_streaming(settings, ads, checkpoint)
+        else:
+            status = run_batch(settings, ads)
+        if status == 0 and failed_queries:
+            LOGGER.error(
+                "%d live queries failed, so the output is missing their ads%s.",
+                len(failed_queries),
+                "; rerun with --resume to retry them" if checkpoint is not None else "",
+            )
+            status = EXIT_PARTIAL
+        if store is not None and status == 0:
+            # Only now is every delta the store has recorded in the output.
+            store.commit_run()
+    finally:
+        if store is not None:
+            store.close()
+        if dedup is not None:
+            dedup.close()
+        if archive is not None:
+            archive.close()
+    if checkpoint is not None:
+        if status == 0:
+            checkpoint.complete()
+        else:
+            checkpoint.close()
+    if status != 0:
+        return status
+
+    LOGGER.info("Facebook Ads Library scraping flow completed successfully.")
+    return 0
+
+def profile_scrape(settings: Dict[str, Any], path: Path, top: int = 25) -> int:
+    """
+    Run scrape() under cProfile, dump the stats to ``path`` (readable with
+    ``python -m pstats`` or snakeviz) and log the functions with the most
+    own time.
+    """
+    import cProfile
+    import io
+    import pstats
+
+    profiler = cProfile.Profile()
+    # The stage sampler's signal handler would show up in the profile.
+    status = profiler.runcall(scrape, dict(settings, metrics_sample_interval=0.0))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(str(path))
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.strip_dirs().sort_stats(pstats.SortKey.TIME).print_stats(top)
+    LOGGER.info("Wrote profile to %s. Hottest functions:\n%s", path, stream.getvalue().strip())
+    return status
@@ -0,0 +1,247 @@
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+
+from extractors.ad_parser import Normalizer, extract_ad_archive_id, normalize_ad_record
+from extractors.media_store import normalize_media_url
+from utils.metrics import pipeline_stage
+
+LOGGER = logging.getLogger(__name__)
+
+DELTA_FIELD = "_delta"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen_ads (
+    scope TEXT NOT NULL,
+    ad_archive_id TEXT NOT NULL,
+    raw_fp TEXT NOT NULL,
+    norm_fp TEXT NOT NULL,
+    status TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    last_run INTEGER NOT NULL,
+    PRIMARY KEY (scope, ad_archive_id)
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    scope TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+"""
+
+def scope_key(settings: Dict[str, Any]) -> str:
+    """
+    Identify the population a run observes, so ads are only reported as
+    ended by a later run that looked at the same terms and countries.
+    """
+    source = "live" if settings["live_mode"] else "offline"
+    payload = json.dumps(
+        [source, sorted(settings["search_terms"]), sorted(settings["countries"])],
+        separators=(",", ":"),
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def _fingerprint(value: Any) -> str:
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def raw_fingerprint(raw: Dict[str, Any]) -> str:
+    return _fingerprint(raw)
+
+def normalized_fingerprint(ad: Dict[str, Any]) -> str:
+    """
+    Fingerprint of a normalized ad that ignores per-response CDN signatures
+    in image URLs, so a re-signed but otherwise identical ad is unchanged.
+    """
+    snapshot = ad.get("snapshot") or {}
+    images = [
+        normalize_media_url(str(img.get("original_image_url") or ""))
+        for img in snapshot.get("images") or []
+        if isinstance(img, dict)
+    ]
+    stable = dict(ad, snapshot=dict(snapshot, images=images))
+    return _fingerprint(stable)
+
+class SeenAdsStore:
+    """
+    SQLite record of the ads observed by previous runs of the same scope.
+
+    Each run is a single transaction: begin_run(), then observe()/record()
+    per ad, then end_unseen() to flag ads that were not seen again as ended,
+    and commit_run() once the run's output has been written. A run that is
+    interrupted or fails to write its output rolls back, so its ads are
+    reported again next time instead of being silently lost.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self.scope: Optional[str] = None
+        self.run_id: Optional[int] = None
+
+    def begin_run(self, scope: str) -> int:
+        self._conn.execute("BEGIN IMMEDIATE")
+        cursor = self._conn.execute(
+            "INSERT INTO runs (scope, started_at) VALUES (?, ?)", (scope, time.time())
+        )
+        self.scope = scope
+        self.run_id = int(cursor.lastrowid)
+        return self.run_id
+
+    def _row(self, ad_archive_id: str) -> Optional[Sequence[Any]]:
+        return self._conn.execute(
+            "SELECT raw_fp, norm_fp, status FROM seen_ads WHERE scope = ? AND ad_archive_id = ?",
+            (self.scope, ad_archive_id),
+        ).fetchone()
+
+    @pipeline_stage("state")
+    def observe(self, ad_archive_id: str, raw_fp: str) -> bool:
+        """
+        Fast path before normalization: if the raw record is byte-for-byte
+        what we saw last time, mark it seen and return True.
+        """
+        row = self._row(ad_archive_id)
+        if row is None or row[2] != "active" or row[0] != raw_fp:
+            return False
+        self._touch(ad_archive_id)
+        return True
+
+    @pipeline_stage("state")
+    def record(self, ad_archive_id: str, raw_fp: str, norm_fp: str) -> str:
+        """
+        Store a normalized ad and classify it as "new", "changed" or
+        "unchanged" relative to the previous run.
+        """
+        now = time.time()
+        row = self._row(ad_archive_id)
+        if row is None or row[2] != "active":
+            status = "new"
+            self._conn.execute(
+                "INSERT OR REPLACE INTO seen_ads "
+                "(scope, ad_archive_id, raw_fp, norm_fp, status, first_seen, last_seen, last_run) "
+                "VALUES (?, ?, ?, ?, 'active', ?, ?, ?)",
+                (self.scope, ad_archive_id, raw_fp, norm_fp, now, now, self.run_id),
+            )
+            return status
+
+        status = "unchanged" if row[1] == norm_fp else "changed"
+        self._conn.execute(
+            "UPDATE seen_ads SET raw_fp = ?, norm_fp = ?, last_seen = ?, last_run = ? "
+            "WHERE scope = ? AND ad_archive_id = ?",
+            (raw_fp, norm_fp, now, self.run_id, self.scope, ad_archive_id),
+        )
+        return status
+
+    def _touch(self, ad_archive_id: str) -> None:
+        self._conn.execute(
+            "UPDATE seen_ads SET last_seen = ?, last_run = ? WHERE scope = ? AND ad_archive_id = ?",
+            (time.time(), self.run_id, self.scope, ad_archive_id),
+        )
+
+    @pipeline_stage("state")
+    def end_unseen(self) -> List[str]:
+        """
+        Mark active ads of this scope that were not seen in this run as
+        ended and return their ids. Nothing is committed until commit_run().
+        """
+        ended = [
+            row[0]
+            for row in self._conn.execute(
+                "SELECT ad_archive_id FROM seen_ads "
+                "WHERE scope = ? AND status = 'active' AND last_run < ?",
+                (self.scope, self.run_id),
+            )
+        ]
+        self._conn.execute(
+            "UPDATE seen_ads SET status = 'ended' "
+            "WHERE scope = ? AND status = 'active' AND last_run < ?",
+            (self.scope, self.run_id),
+        )
+        return ended
+
+    def commit_run(self) -> None:
+        self._conn.execute(
+            "UPDATE runs SET finished_at = ? WHERE run_id = ?", (time.time(), self.run_id)
+        )
+        self._conn.execute("COMMIT")
+        self.run_id = None
+
+    def abort_run(self) -> None:
+        if self.run_id is not None and self._conn.in_transaction:
+            self._conn.execute("ROLLBACK")
+        self.run_id = None
+
+    def close(self) -> None:
+        self.abort_run()
+        self._conn.close()
+
+@pipeline_stage("normalize")
+def iter_delta_ads(
+    raw_ads: Iterable[Dict[str, Any]],
+    store: SeenAdsStore,
+    scope: str,
+    normalize: Optional[Normalizer] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Normalize only what changed since the previous run of ``scope``.
+
+    Unchanged raw records are skipped before normalization. New and changed
+    ads are yielded normalized with a ``_delta`` field, followed by an
+    ``{"ad_archive_id": ..., "_delta": "ended"}`` stub for every ad that has
+    disappeared. Nothing is committed here: the caller calls
+    ``store.commit_run()`` once everything yielded has been written, and
+    the run is rolled back if the generator is closed early or raises.
+    """
+    normalize = normalize or normalize_ad_record
+    store.begin_run(scope)
+    counts = {"new": 0, "changed": 0, "unchanged": 0, "ended": 0}
+    try:
+        for idx, item in enumerate(raw_ads):
+            if not isinstance(item, dict):
+                LOGGER.warning("Skipping non-dict ad record at index %d", idx)
+                continue
+            ad_archive_id = extract_ad_archive_id(item)
+            if ad_archive_id is None:
+                LOGGER.warning("Skipping ad without an id at index %d", idx)
+                continue
+            ad_archive_id = str(ad_archive_id)
+
+            raw_fp = raw_fingerprint(item)
+            if store.observe(ad_archive_id, raw_fp):
+                counts["unchanged"] += 1
+                continue
+
+            try:
+                normalized = normalize(item)
+            except Exception as err:
+                LOGGER.exception("Failed to normalize ad at index %d: %s", idx, err)
+                continue
+
+            status = store.record(ad_archive_id, raw_fp, normalized_fingerprint(normalized))
+            counts[status] += 1
+            if status != "unchanged":
+                normalized[DELTA_FIELD] = status
+                yield normalized
+
+        for ad_archive_id in store.end_unseen():
+            counts["ended"] += 1
+            yield {"ad_archive_id": ad_archive_id, DELTA_FIELD: "ended"}
+    except BaseException:
+        store.abort_run()
+        raise
+
+    LOGGER.info(
+        "Incremental run: %d new, %d changed, %d ended, %d unchanged ads.",
+        counts["new"],
+        counts["changed"],
+        counts["ended"],
+        counts["unchanged"],
+    )
@@ -1,21 +1,23 @@
-thonimport argparse
+import argparse
+import datetime
 import logging
 import sys
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
-from utils.helpers import (
-    http_get_json,
-    load_json_file,
-    save_json_file,
-    setup_logging,
-)
-from utils.validators import validate_settings
-from extractors.ad_parser import parse_ads
-from extractors.media_handler import download_media_assets
+from utils.helpers import setup_logging
+from utils.metrics import DEFAULT_SAMPLE_INTERVAL
+from utils.settings import load_settings
+from utils.validators import DEDUP_INDEXES, PARTITION_KEYS, infer_output_format
 
 LOGGER = logging.getLogger(__name__)
 
+def _iso_day(value: str) -> str:
+    try:
+        return datetime.date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a YYYY-MM-DD date, got {value!r}") from None
+
 def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Facebook Ads Library Scraper - extract structured ad data."
@@ -66,37 +68,314 @@ def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
         action="store_true",
         help="Download image assets for each ad.",
     )
-    return parser.parse_args(argv)
+    parser.add_argument(
+        "--media-workers",
+        type=int,
+        default=None,
+        help="Number of concurrent media download workers.",
+    )
+    parser.add_argument(
+        "--cluster-creatives",
+        action="store_true",
+        help="With --download-media, group near-identical images and tag ads with creative_clusters.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="Maximum number of live queries in flight at once.",
+    )
+    parser.add_argument(
+        "--adaptive-windows",
+        action="store_true",
+        help="Split queries that hit the result cap into shorter date windows (needs date_min).",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=None,
+        help="Maximum live API requests per second per host (0 disables).",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=None,
+        help="Retries per live API request on timeouts, 429 and 5xx responses.",
+    )
+    parser.add_argument(
+        "--http-cache",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Enable or disable the on-disk cache of live API responses.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Normalize records in this many worker processes (default: 1).",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only emit ads that are new, changed or ended since the last run.",
+    )
+    parser.add_argument(
+        "--dedup",
+        choices=list(DEDUP_INDEXES),
+        default=None,
+        help="Index used to drop repeated copies of an ad before normalizing "
+        "(memory, disk or bloom for very large runs; off keeps every copy).",
+    )
+    parser.add_argument(
+        "--archive",
+        action="store_true",
+        help="Add this run's ads to the searchable local archive (see the query command).",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Normalize and write records one at a time instead of in memory.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted --stream run from its last checkpoint.",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=["json", "ndjson", "parquet", "arrow"],
+        default=None,
+        help="Output file format (default: inferred from the output path).",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Write JSON output without indentation.",
+    )
+    parser.add_argument(
+        "--json-backend",
+        choices=["auto", "orjson", "msgspec", "json"],
+        default=None,
+        help="JSON codec to use (default: fastest installed).",
+    )
+    parser.add_argument(
+        "--partition-by",
+        type=str,
+        default=None,
+        help="Comma-separated partition keys for Parquet/Arrow output "
+        "(any of country, search_term, date).",
+    )
+    parser.add_argument(
+        "--metrics-report",
+        type=str,
+        default=None,
+        help="Write a JSON run report with per-stage timings to this path.",
+    )
+    parser.add_argument(
+        "--prometheus-textfile",
+        type=str,
+        default=None,
+        help="Write run metrics in Prometheus text format to this path.",
+    )
+    parser.add_argument(
+        "--sample-stages",
+        nargs="?",
+        type=float,
+        const=DEFAULT_SAMPLE_INTERVAL,
+        default=None,
+        metavar="SECONDS",
+        help="Profile where run time goes by sampling the pipeline stage every "
+        f"SECONDS (default: {DEFAULT_SAMPLE_INTERVAL}); 0 turns sampling off.",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="PATH",
+        help="Run under cProfile and dump the stats to PATH "
+        "(default: profile.pstats next to the output).",
+    )
+    parser.add_argument(
+        "--bench-startup",
+        action="store_true",
+        help="Run the command in a child process and report its startup time "
+        "and the import time of each module.",
+    )
+    parser.add_argument(
+        "--no-settings-cache",
+        action="store_true",
+        help="Validate the settings file again instead of reusing the validated "
+        "copy cached from an earlier run.",
+    )
 
-def load_settings(config_path: Optional[str], project_root: Path) -> Dict[str, Any]:
-    if config_path is None:
-        config_path = project_root / "src" / "config" / "settings.example.json"
-    else:
-        config_path = Path(config_path)
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    serve_parser = commands.add_parser(
+        "serve",
+        help="Run as a daemon, scraping the jobs in a jobs file on their schedules.",
+    )
+    serve_parser.add_argument(
+        "--jobs",
+        type=str,
+        default=None,
+        help="Path to the JSON jobs file (default: src/config/jobs.example.json).",
+    )
+    serve_parser.add_argument(
+        "--status-file",
+        type=str,
+        default=None,
+        help="Override status_path from the jobs file.",
+    )
+    serve_parser.add_argument(
+        "--max-concurrent-jobs",
+        type=int,
+        default=None,
+        help="Override max_concurrent_jobs from the jobs file.",
+    )
+    serve_parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Run every job once, without start-up splay, then exit.",
+    )
 
-    try:
-        raw = load_json_file(config_path)
-        LOGGER.info("Loaded settings from %s", config_path)
-    except FileNotFoundError:
-        LOGGER.warning(
-            "Settings file %s not found; falling back to internal defaults.", config_path
-        )
-        raw = {}
-
-    settings = validate_settings(raw)
-
-    # Resolve file system paths relative to project root
-    def resolve_path(p: str) -> str:
-        path = Path(p)
-        if not path.is_absolute():
-            path = project_root / path
-        return str(path)
-
-    settings["output_path"] = resolve_path(settings["output_path"])
-    settings["offline_input_path"] = resolve_path(settings["offline_input_path"])
-    settings["media_download_dir"] = resolve_path(settings["media_download_dir"])
+    coordinate_parser = commands.add_parser(
+        "coordinate",
+        help="Split the configured query space into shards and queue them for workers.",
+    )
+    coordinate_parser.add_argument(
+        "--queue",
+        type=str,
+        default=None,
+        help="Override queue_path from config.",
+    )
+    coordinate_parser.add_argument(
+        "--window-days",
+        type=int,
+        default=None,
+        help="Override shard_window_days: split date_min..date_max into windows of N days.",
+    )
+    coordinate_parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="Requeue shards that exhausted their attempts.",
+    )
+    coordinate_parser.add_argument(
+        "--status",
+        action="store_true",
+        help="Only report how many shards are pending, leased, done and failed.",
+    )
 
-    return settings
+    work_parser = commands.add_parser(
+        "work",
+        help="Lease shards from the queue and scrape them until it is drained.",
+    )
+    work_parser.add_argument(
+        "--queue",
+        type=str,
+        default=None,
+        help="Override queue_path from config.",
+    )
+    work_parser.add_argument(
+        "--worker-id",
+        type=str,
+        default=None,
+        help="Name this worker in the queue (default: host:pid).",
+    )
+    work_parser.add_argument(
+        "--max-shards",
+        type=int,
+        default=None,
+        help="Exit after this many shards.",
+    )
+    work_parser.add_argument(
+        "--wait",
+        action="store_true",
+        help="Keep polling for new shards instead of exiting when the queue is drained.",
+    )
+    work_parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=5.0,
+        help="Seconds between polls while waiting for shards (default: 5).",
+    )
+
+    query_parser = commands.add_parser(
+        "query",
+        help="Search the local ad archive and print matching ads as NDJSON.",
+    )
+    query_parser.add_argument(
+        "--archive-path",
+        type=str,
+        default=None,
+        help="Override archive_path from config.",
+    )
+    query_parser.add_argument("--page-id", type=str, default=None, help="Ads of this page.")
+    query_parser.add_argument(
+        "--platform",
+        type=str,
+        default=None,
+        help="Ads published on this platform, e.g. INSTAGRAM.",
+    )
+    query_parser.add_argument("--category", type=str, default=None, help="Ads in this category.")
+    query_parser.add_argument("--cta", type=str, default=None, help="Ads with this call-to-action text.")
+    query_parser.add_argument(
+        "--text",
+        type=str,
+        default=None,
+        help="Full-text search of the ad body (FTS5 syntax: words, \"phrases\", prefix*, OR, NOT).",
+    )
+    query_parser.add_argument("--start-after", type=_iso_day, default=None, help="Started on or after YYYY-MM-DD.")
+    query_parser.add_argument("--start-before", type=_iso_day, default=None, help="Started on or before YYYY-MM-DD.")
+    query_parser.add_argument("--end-after", type=_iso_day, default=None, help="Ended on or after YYYY-MM-DD.")
+    query_parser.add_argument("--end-before", type=_iso_day, default=None, help="Ended on or before YYYY-MM-DD.")
+    query_parser.add_argument(
+        "--active",
+        action="store_true",
+        help="Only ads still running: not reported ended, with no end date in the past.",
+    )
+    query_parser.add_argument(
+        "--limit",
+        type=int,
+        default=100,
+        help="Maximum number of ads to print (default: 100; 0 for all).",
+    )
+    query_parser.add_argument("--offset", type=int, default=0, help="Skip this many matching ads.")
+    query_parser.add_argument(
+        "--count",
+        action="store_true",
+        help="Print the number of matching ads instead of the ads.",
+    )
+
+    ingest_parser = commands.add_parser(
+        "ingest",
+        help="Add the ads in existing JSON/NDJSON output files to the local archive.",
+    )
+    ingest_parser.add_argument("files", nargs="+", metavar="FILE", help="Output files to add.")
+    ingest_parser.add_argument(
+        "--archive-path",
+        type=str,
+        default=None,
+        help="Override archive_path from config.",
+    )
+
+    stats_parser = commands.add_parser(
+        "stats",
+        help="Summarize the ads in JSON/NDJSON files (raw input or output) as JSON.",
+    )
+    stats_parser.add_argument("files", nargs="+", metavar="FILE", help="Files to summarize.")
+    stats_parser.add_argument("--platform", type=str, default=None, help="Only ads on this platform.")
+    stats_parser.add_argument("--category", type=str, default=None, help="Only ads in this category.")
+    stats_parser.add_argument("--start-after", type=_iso_day, default=None, help="Started on or after YYYY-MM-DD.")
+    stats_parser.add_argument("--start-before", type=_iso_day, default=None, help="Started on or before YYYY-MM-DD.")
+    stats_parser.add_argument("--end-after", type=_iso_day, default=None, help="Ended on or after YYYY-MM-DD.")
+    stats_parser.add_argument("--end-before", type=_iso_day, default=None, help="Ended on or before YYYY-MM-DD.")
+    stats_parser.add_argument(
+        "--top",
+        type=int,
+        default=10,
+        help="Number of pages to list by ad count (default: 10).",
+    )
+    return parser.parse_args(argv)
 
 def apply_cli_overrides(settings: Dict[str, Any], args: argparse.Namespace) -> Dict[str, Any]:
     if args.max_items is not None:
@@ -114,63 +393,55 @@ def apply_cli_overrides(settings: Dict[str, Any], args: argparse.Namespace) -> D
         settings["live_mode"] = True
     if args.download_media:
         settings["download_media"] = True
+    if args.media_workers is not None:
+        settings["media_workers"] = max(1, int(args.media_workers))
+    if args.cluster_creatives:
+        settings["cluster_creatives"] = True
+    if args.adaptive_windows:
+        settings["adaptive_windows"] = True
+    if args.concurrency is not None:
+        settings["max_concurrency"] = max(1, int(args.concurrency))
+    if args.rate_limit is not None:
+        settings["requests_per_second"] = max(0.0, float(args.rate_limit))
+    if args.retries is not None:
+        settings["http_retries"] = max(0, int(args.retries))
+    if args.http_cache is not None:
+        settings["http_cache"] = args.http_cache
+    if args.workers is not None:
+        settings["normalize_workers"] = max(1, int(args.workers))
+    if args.incremental:
+        settings["incremental"] = True
+    if args.dedup:
+        settings["dedup"] = args.dedup
+    if args.archive:
+        settings["archive"] = True
+    if args.stream:
+        settings["stream"] = True
+    if args.resume:
+        settings["resume"] = True
+    if args.output_format:
+        settings["output_format"] = args.output_format
+    elif args.output:
+        settings["output_format"] = infer_output_format(settings["output_path"])
+    if args.compact:
+        settings["compact_output"] = True
+    if args.json_backend:
+        settings["json_backend"] = args.json_backend
+    if args.partition_by is not None:
+        keys = [key.strip() for key in args.partition_by.split(",") if key.strip()]
+        unknown = [key for key in keys if key not in PARTITION_KEYS]
+        if unknown:
+            LOGGER.warning("Ignoring unknown --partition-by keys %s.", unknown)
+        settings["partition_by"] = [key for key in keys if key in PARTITION_KEYS]
+    if args.metrics_report:
+        settings["metrics_report"] = str(Path(args.metrics_report))
+    if args.prometheus_textfile:
+        settings["prometheus_textfile"] = str(Path(args.prometheus_textfile))
+    if args.sample_stages is not None:
+        settings["metrics_sample_interval"] = max(0.0, args.sample_stages)
 
     return settings
 
-def build_query_params(settings: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Build query parameters for a generic HTTP-based ads endpoint.
-
-    This is intentionally generic so you can point it at your own proxy or
-    scraping backend which exposes a Facebook Ads Library compatible interface.
-    """
-    search_term = settings["search_terms"][0] if settings["search_terms"] else ""
-    country = settings["countries"][0] if settings["countries"] else ""
-
-    params: Dict[str, Any] = {
-        "q": search_term,
-        "country": country,
-        "limit": settings["max_items"],
-    }
-    # Additional params for custom backends can be added here
-    return params
-
-def fetch_ads_live(settings: Dict[str, Any]) -> List[Dict[str, Any]]:
-    api_url = settings["api_url"]
-    if not api_url:
-        raise RuntimeError(
-            "No 'api_url' configured for live mode. "
-            "Update your settings file with a reachable backend URL."
-        )
-
-    params = build_query_params(settings)
-    LOGGER.info("Fetching ads from live API: %s", api_url)
-    response_data = http_get_json(api_url, params=params)
-
-    # Accept either a top-level list or an object with 'data'
-    if isinstance(response_data, list):
-        return response_data
-    if isinstance(response_data, dict) and "data" in response_data:
-        data = response_data["data"]
-        if isinstance(data, list):
-            return data
-        raise ValueError("Expected 'data' to be a list in live API response.")
-    raise ValueError("Unexpected data format from live API.")
-
-def fetch_ads_offline(settings: Dict[str, Any]) -> List[Dict[str, Any]]:
-    input_path = Path(settings["offline_input_path"])
-    LOGGER.info("Loading offline input data from %s", input_path)
-    raw = load_json_file(input_path)
-
-    if isinstance(raw, list):
-        return raw
-    if isinstance(raw, dict) and "data" in raw and isinstance(raw["data"], list):
-        return raw["data"]
-
-    raise ValueError(
-        f"Offline input file {input_path} did not contain a list or an object with 'data'."
-    )
-
 def run() -> int:
     project_root = Path(__file__).resolve().parents[1]
     setup_logging()
@@ -178,60 +449,48 @@ def run() -> int:
     args = parse_args()
     LOGGER.debug("CLI arguments: %s", args)
 
-    settings = load_settings(args.config, project_root)
-    settings = apply_cli_overrides(settings, args)
+    if args.bench_startup:
+        from utils.startup_bench import bench_startup
 
-    LOGGER.info("Effective settings: max_items=%d, live_mode=%s",
-                settings["max_items"], settings["live_mode"])
+        argv = [arg for arg in sys.argv[1:] if arg != "--bench-startup"]
+        return bench_startup(Path(__file__), argv, project_root, args.config)
 
-    # Load raw ads either from live API or offline file
-    try:
-        if settings["live_mode"]:
-            try:
-                raw_ads = fetch_ads_live(settings)
-            except Exception as live_err:
-                LOGGER.error(
-                    "Live scraping failed: %s. Falling back to offline input.",
-                    live_err,
-                )
-                raw_ads = fetch_ads_offline(settings)
-        else:
-            raw_ads = fetch_ads_offline(settings)
-    except Exception as err:
-        LOGGER.exception("Failed to load raw ads data: %s", err)
-        return 1
-
-    LOGGER.info("Loaded %d raw ad records.", len(raw_ads))
-
-    # Normalize and parse ads
-    try:
-        parsed_ads = parse_ads(raw_ads)
-    except Exception as err:
-        LOGGER.exception("Failed to parse ads: %s", err)
-        return 1
+    # Each command imports only the modules it needs, so short offline runs
+    # do not load the HTTP, media or Arrow stacks.
+    if args.command == "serve":
+        from commands.daemon import serve
 
-    LOGGER.info("Parsed %d ads into normalized structure.", len(parsed_ads))
+        return serve(args, project_root)
+    if args.command == "stats":
+        from commands.stats import summarize_files
 
-    output_path = Path(settings["output_path"])
-    try:
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        save_json_file(output_path, parsed_ads)
-    except Exception as err:
-        LOGGER.exception("Failed to write output file %s: %s", output_path, err)
-        return 1
+        return summarize_files(args)
+
+    settings = load_settings(args.config, project_root, use_cache=not args.no_settings_cache)
+    settings = apply_cli_overrides(settings, args)
+    if args.command == "coordinate":
+        from commands.sharding import coordinate
+
+        return coordinate(args, settings)
+    if args.command == "work":
+        from commands.sharding import work
+
+        return work(args, settings)
+    if args.command == "query":
+        from commands.archive import query_archive
+
+        return query_archive(args, settings)
+    if args.command == "ingest":
+        from commands.archive import ingest_files
 
-    LOGGER.info("Wrote normalized ads to %s", output_path)
+        return ingest_files(args, settings)
 
-    # Optionally download image media
-    if settings.get("download_media"):
-        media_dir = Path(settings["media_download_dir"])
-        try:
-            download_media_assets(parsed_ads, media_dir)
-        except Exception as err:
-            LOGGER.exception("Media download encountered an error: %s", err)
+    from extractors.pipeline import profile_scrape, scrape
 
-    LOGGER.info("Facebook Ads Library scraping flow completed successfully.")
-    return 0
+    if args.profile is not None:
+        path = Path(args.profile) if args.profile else Path(settings["output_path"]).parent / "profile.pstats"
+        return profile_scrape(settings, path)
+    return scrape(settings)
 
 if __name__ == "__main__":
-    sys.exit(run())
\ No newline at end of file
+    sys.exit(run())
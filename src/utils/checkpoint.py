@@ -0,0 +1,233 @@
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+import hashlib
+import itertools
+import json
+import logging
+import sqlite3
+import time
+
+from utils.helpers import json_loads
+
+LOGGER = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS queries (
+    query TEXT PRIMARY KEY,
+    fetched INTEGER NOT NULL,
+    next_request TEXT
+);
+"""
+
+# Settings that change which records a run produces or where they go; a
+# checkpoint only resumes a run with the same values.
+FINGERPRINT_KEYS = (
+    "live_mode",
+    "api_url",
+    "search_terms",
+    "countries",
+    "max_items",
+    "page_size",
+    "date_min",
+    "date_max",
+    "offline_input_path",
+    "output_path",
+    "output_format",
+    "field_mapping",
+    "field_mapping_path",
+    "partition_by",
+    "dedup",
+    "adaptive_windows",
+    "window_result_cap",
+    "min_window_days",
+    "split_countries",
+)
+
+# (search_term, country[, date_min, date_max]) -> (records fetched, (url,
+# params) of the next page or None once finished)
+QueryState = Tuple[int, Optional[Tuple[str, Optional[Dict[str, Any]]]]]
+
+def settings_fingerprint(settings: Dict[str, Any]) -> str:
+    payload = json.dumps(
+        {key: settings.get(key) for key in FINGERPRINT_KEYS}, sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+class RunCheckpoint:
+    """
+    Durable progress of a streaming run, for resuming it after a crash.
+
+    A checkpoint is one SQLite transaction holding the output size and
+    record count (after an fsync of the output), the number of raw records
+    consumed and, for live runs, each query's records fetched and next page
+    request. Live runs only commit right after a page has been fully
+    written, so the saved cursors cover exactly the records in the output;
+    offline runs can commit after any record. Commits happen at most every
+    ``interval`` seconds.
+
+    On resume the output is truncated back to the checkpointed size, live
+    queries continue from their saved page requests (finished ones are
+    skipped) and offline input skips the records already consumed, so
+    nothing is fetched twice or duplicated. The checkpoint is deleted once
+    the run completes.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        fingerprint: str,
+        resume: bool = False,
+        interval: float = 5.0,
+    ) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.interval = float(interval)
+        self.writer: Any = None
+        self.resumed = False
+        self.output_offset = 0
+        self.records_written = 0
+        self.raw_consumed = 0
+        self.queries: Dict[Tuple[Any, ...], QueryState] = {}
+
+        self._conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(_SCHEMA)
+        self._pending: Dict[Tuple[Any, ...], QueryState] = {}
+        self._boundary = False
+        self._last_commit = time.monotonic()
+
+        meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+        if resume and meta:
+            if meta.get("fingerprint") != fingerprint:
+                self._conn.close()
+                raise ValueError(
+                    f"Checkpoint {self.path} was written by a run with different settings; "
+                    "rerun without --resume to start over."
+                )
+            self.resumed = True
+            self.output_offset = int(meta.get("output_offset", 0))
+            self.records_written = int(meta.get("records_written", 0))
+            self.raw_consumed = int(meta.get("raw_consumed", 0))
+            for query, fetched, next_request in self._conn.execute(
+                "SELECT query, fetched, next_request FROM queries"
+            ):
+                request = json.loads(next_request) if next_request else None
+                self.queries[tuple(json.loads(query))] = (
+                    fetched,
+                    (request[0], request[1]) if request else None,
+                )
+            LOGGER.info(
+                "Resuming from checkpoint %s: %d records written, %d queries in progress or done.",
+                self.path,
+                self.records_written,
+                len(self.queries),
+            )
+            return
+
+        if resume:
+            LOGGER.info("No checkpoint at %s; starting from scratch.", self.path)
+        elif meta:
+            LOGGER.info("Discarding checkpoint %s; pass --resume to continue it instead.", self.path)
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.execute("DELETE FROM meta")
+        self._conn.execute("DELETE FROM queries")
+        self._conn.execute("INSERT INTO meta (key, value) VALUES ('fingerprint', ?)", (fingerprint,))
+        self._conn.execute("COMMIT")
+
+    def page_done(self, query: Tuple[Any, ...], fetched: int, next_request: Any) -> None:
+        """
+        Note that every record of a query's page has been consumed (called
+        from the thread consuming records).
+        """
+        self._pending[query] = (fetched, next_request)
+        self._boundary = True
+
+    def track(self, records: Iterable[Any], paged: bool) -> Iterator[Any]:
+        """
+        Pass raw records through, committing a checkpoint between records
+        once ``interval`` has passed. Pulling a record means every record
+        before it has been normalized and written, because the streaming
+        pipeline is pull-driven on one thread. ``paged`` sources only commit
+        right after page_done(); otherwise already consumed records are
+        skipped when resuming.
+        """
+        iterator = iter(records)
+        consumed = 0
+        if not paged and self.raw_consumed:
+            consumed = sum(1 for _ in itertools.islice(iterator, self.raw_consumed))
+            LOGGER.info("Skipped %d input records already processed.", consumed)
+        for record in iterator:
+            boundary, self._boundary = self._boundary, False
+            if (
+                self.writer is not None
+                and (boundary or not paged)
+                and time.monotonic() - self._last_commit >= self.interval
+            ):
+                self.commit(consumed)
+            consumed += 1
+            yield record
+
+    def commit(self, raw_consumed: int) -> None:
+        offset = self.writer.sync()
+        records = self.writer.count
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for query, (fetched, next_request) in self._pending.items():
+                conn.execute(
+                    "INSERT OR REPLACE INTO queries (query, fetched, next_request) VALUES (?, ?, ?)",
+                    (
+                        json.dumps(list(query)),
+                        fetched,
+                        json.dumps(list(next_request)) if next_request else None,
+                    ),
+                )
+            conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [
+                    ("output_offset", str(offset)),
+                    ("records_written", str(records)),
+                    ("raw_consumed", str(raw_consumed)),
+                ],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._pending.clear()
+        self._last_commit = time.monotonic()
+        LOGGER.debug("Checkpoint: %d records, %d bytes written.", records, offset)
+
+    def complete(self) -> None:
+        """
+        The run finished; drop the checkpoint.
+        """
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{self.path}{suffix}").unlink(missing_ok=True)
+
+    def close(self) -> None:
+        self._conn.close()
+
+def iter_written_records(path: Path, limit: int) -> Iterator[Any]:
+    """
+    Decode the records in the first ``limit`` bytes of a RecordWriter file
+    (NDJSON, or the one-record-per-line JSON array layout).
+    """
+    with Path(path).open("rb") as f:
+        remaining = limit
+        for line in f:
+            if remaining <= 0:
+                break
+            remaining -= len(line)
+            line = line.strip()
+            if line.endswith(b","):
+                line = line[:-1]
+            if not line or line in (b"[", b"]"):
+                continue
+            yield json_loads(line)
@@ -0,0 +1,441 @@
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import collections
+import functools
+import logging
+import re
+
+from utils.metrics import pipeline_stage
+from utils.validators import PARTITION_KEYS
+
+LOGGER = logging.getLogger(__name__)
+
+# pyarrow is loaded by require_pyarrow() on first use: importing it takes
+# longer than a small JSON run does in total.
+pa: Any = None
+pa_ipc: Any = None
+pc: Any = None
+pq: Any = None
+
+COLUMNAR_FORMATS = ("parquet", "arrow")
+
+# Value used for a partition key that cannot be determined for a record,
+# following the Hive convention understood by Spark, DuckDB and pyarrow.
+DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+# Provenance attached to records by the live fetcher when partitioning by
+# query; it becomes the partition directory rather than a data column.
+SOURCE_FIELD = "_query"
+
+# Epoch values above this are taken to be milliseconds rather than seconds.
+_MILLISECONDS_FROM = 1e11
+
+_DATE_PREFIX = re.compile(r"^\d{4}-\d{2}-\d{2}")
+_UNSAFE_PATH_CHARS = re.compile(r"[\\/:*?\"<>|=%\x00-\x1f]")
+
+def require_pyarrow() -> None:
+    global pa, pa_ipc, pc, pq
+    if pa is not None:
+        return
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:  # pragma: no cover - optional dependency
+        raise RuntimeError(
+            "Parquet/Arrow output requires pyarrow. Install it with 'pip install pyarrow'."
+        ) from None
+    pa, pa_ipc, pc, pq = pyarrow, pyarrow.ipc, pyarrow.compute, pyarrow.parquet
+
+def ad_schema(include_delta: bool = False, include_clusters: bool = False) -> "pa.Schema":
+    """
+    Arrow schema for normalized ads. Low-cardinality strings (page names,
+    CTA texts, platforms and categories) are dictionary-encoded, and start
+    and end dates are UTC timestamps in seconds.
+    """
+    require_pyarrow()
+    dict_string = pa.dictionary(pa.int32(), pa.string())
+    timestamp = pa.timestamp("s", tz="UTC")
+    fields = [
+        ("ad_archive_id", pa.string()),
+        ("page_id", pa.string()),
+        ("page_name", dict_string),
+        ("page_profile_uri", pa.string()),
+        ("publisher_platform", pa.list_(dict_string)),
+        (
+            "snapshot",
+            pa.struct(
+                [
+                    ("body", pa.struct([("text", pa.string())])),
+                    ("cta_text", dict_string),
+                    ("images", pa.list_(pa.struct([("original_image_url", pa.string())]))),
+                ]
+            ),
+        ),
+        ("page_like_count", pa.int64()),
+        ("start_date", timestamp),
+        ("end_date", timestamp),
+        ("categories", pa.list_(dict_string)),
+    ]
+    if include_delta:
+        fields.append(("_delta", dict_string))
+    if include_clusters:
+        fields.append(("creative_clusters", pa.list_(pa.string())))
+    return pa.schema(fields)
+
+def _as_str(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    return value if isinstance(value, str) else str(value)
+
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+def as_int64(value: Any) -> Optional[int]:
+    """
+    ``value`` as an int for an int64 column, or None if it is not a number
+    or does not fit in 64 bits.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return number if _INT64_MIN <= number <= _INT64_MAX else None
+
+def _str_list(value: Any) -> Optional[List[str]]:
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return [str(v) for v in value]
+    return [str(value)]
+
+def to_row(
+    ad: Dict[str, Any],
+    include_delta: bool = False,
+    include_clusters: bool = False,
+) -> Dict[str, Any]:
+    """
+    Coerce a normalized ad to the column types of ad_schema. Ids are kept
+    as strings because backends send them as either numbers or text; dates
+    given as epoch seconds, milliseconds or ISO 8601 strings become epoch
+    seconds (null if they cannot be parsed).
+    """
+    snapshot = ad.get("snapshot")
+    if isinstance(snapshot, dict):
+        body = snapshot.get("body")
+        images = snapshot.get("images")
+        snapshot = {
+            "body": {"text": _as_str(body.get("text"))} if isinstance(body, dict) else None,
+            "cta_text": _as_str(snapshot.get("cta_text")),
+            "images": [
+                {"original_image_url": _as_str(img.get("original_image_url"))}
+                for img in images
+                if isinstance(img, dict)
+            ]
+            if isinstance(images, list)
+            else None,
+        }
+    else:
+        snapshot = None
+
+    row = {
+        "ad_archive_id": _as_str(ad.get("ad_archive_id")),
+        "page_id": _as_str(ad.get("page_id")),
+        "page_name": _as_str(ad.get("page_name")),
+        "page_profile_uri": _as_str(ad.get("page_profile_uri")),
+        "publisher_platform": _str_list(ad.get("publisher_platform")),
+        "snapshot": snapshot,
+        "page_like_count": as_int64(ad.get("page_like_count")),
+        "start_date": epoch_seconds(ad.get("start_date")),
+        "end_date": epoch_seconds(ad.get("end_date")),
+        "categories": _str_list(ad.get("categories")),
+    }
+    if include_delta:
+        row["_delta"] = _as_str(ad.get("_delta"))
+    if include_clusters:
+        row["creative_clusters"] = _str_list(ad.get("creative_clusters"))
+    return row
+
+@functools.lru_cache(maxsize=1 << 14)
+def _iso_epoch(text: str) -> Optional[int]:
+    # Ads of one run share a handful of distinct dates, so parsing each once
+    # makes string timestamps about as cheap as integer ones.
+    try:
+        return epoch_seconds(float(text))
+    except ValueError:
+        pass
+    if text.endswith(("Z", "z")):
+        text = text[:-1] + "+00:00"
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        try:
+            parsed = datetime.strptime(text, "%Y-%m-%dT%H:%M:%S%z")
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+def epoch_seconds(value: Any) -> Optional[int]:
+    """
+    Unix time in seconds of a timestamp given as epoch seconds or
+    milliseconds (number or numeric string) or as an ISO 8601 string
+    (UTC unless it has an offset), else None.
+    """
+    if isinstance(value, str):
+        return _iso_epoch(value.strip()) if value else None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if value != value or value in (float("inf"), float("-inf")):
+            return None
+        return int(value / 1000) if abs(value) > _MILLISECONDS_FROM else int(value)
+    return None
+
+def partition_date(value: Any) -> Optional[str]:
+    """
+    ``YYYY-MM-DD`` for an ISO 8601 string or a Unix timestamp in seconds or
+    milliseconds, else None.
+    """
+    if isinstance(value, str):
+        text = value.strip()
+        if _DATE_PREFIX.match(text):
+            return text[:10]
+        try:
+            value = float(text)
+        except ValueError:
+            return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        seconds = value / 1000.0 if value > _MILLISECONDS_FROM else float(value)
+        try:
+            return datetime.fromtimestamp(seconds, tz=timezone.utc).strftime("%Y-%m-%d")
+        except (OverflowError, OSError, ValueError):
+            return None
+    return None
+
+def path_segment(value: Optional[str]) -> str:
+    """
+    A partition value made safe for use as a directory name.
+    """
+    if value is None or value == "":
+        return DEFAULT_PARTITION
+    return _UNSAFE_PATH_CHARS.sub("_", value)
+
+def _has_dictionary(kind: Any) -> bool:
+    if pa.types.is_dictionary(kind):
+        return True
+    return any(_has_dictionary(kind.field(i).type) for i in range(kind.num_fields))
+
+def _nulls(array: Any) -> Any:
+    return array.is_null() if array.null_count else None
+
+class _ArrowFileWriter:
+    """
+    Arrow IPC file writer for tables whose dictionary columns are encoded
+    batch by batch. The IPC file format allows a dictionary to grow
+    between batches (a delta) but not to be replaced, so each table is
+    re-encoded against one dictionary per column that only ever grows.
+    """
+
+    def __init__(self, path: Path, schema: Any, compression: str) -> None:
+        options = pa_ipc.IpcWriteOptions(compression=compression, emit_dictionary_deltas=True)
+        self._writer = pa_ipc.new_file(str(path), schema, options=options)
+        self._dictionaries: Dict[str, Any] = {}
+
+    def write_table(self, table: Any) -> None:
+        columns = [
+            self._encode(name, column.combine_chunks())
+            for name, column in zip(table.column_names, table.columns)
+        ]
+        self._writer.write_table(pa.Table.from_arrays(columns, schema=table.schema))
+
+    def _encode(self, path: str, array: Any) -> Any:
+        kind = array.type
+        if not _has_dictionary(kind):
+            return array
+        if pa.types.is_list(kind):
+            return pa.ListArray.from_arrays(array.offsets, self._encode(path, array.values), mask=_nulls(array))
+        if pa.types.is_struct(kind):
+            children = [self._encode(f"{path}.{field.name}", array.field(field.name)) for field in kind]
+            return pa.StructArray.from_arrays(children, fields=list(kind), mask=_nulls(array))
+
+        values = array.dictionary
+        known = self._dictionaries.get(path)
+        if known is None:
+            known = values
+        else:
+            added = values.filter(pc.invert(pc.is_in(values, value_set=known)))
+            if len(added):
+                known = pa.concat_arrays([known, added])
+        self._dictionaries[path] = known
+        indices = pc.take(pc.index_in(values, value_set=known), array.indices)
+        return pa.DictionaryArray.from_arrays(indices.cast(kind.index_type), known)
+
+    def close(self) -> None:
+        self._writer.close()
+
+class ColumnarWriter:
+    """
+    Incrementally write normalized ads as Parquet or Arrow.
+
+    Records are buffered and written ``row_group_size`` at a time, one
+    Parquet row group (or Arrow record batch) per flush, so memory stays
+    bounded while streaming. With ``partition_by`` the output path is a
+    directory laid out Hive-style (``country=US/search_term=x/date=...``)
+    holding one file per partition. Partition values come from the
+    record's ``_query`` provenance or ``start_date``, then from
+    ``partition_defaults``; unknown values go to the Hive default
+    partition. Buffered rows across all partitions are capped at twice
+    ``row_group_size``. At most ``max_open_files`` partition files are kept open;
+    the least recently used one is closed and the partition continues in
+    a new part file when it is written to again.
+
+    Arrow output uses the IPC file format (``.arrow``, also known as
+    Feather v2), which can be memory-mapped and read with
+    ``pyarrow.ipc.open_file``, ``pyarrow.feather.read_table`` or DuckDB.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        fmt: str = "parquet",
+        row_group_size: int = 50000,
+        partition_by: Sequence[str] = (),
+        partition_defaults: Optional[Dict[str, str]] = None,
+        compression: str = "zstd",
+        include_delta: bool = False,
+        include_clusters: bool = False,
+        max_open_files: int = 64,
+    ) -> None:
+        require_pyarrow()
+        if fmt not in COLUMNAR_FORMATS:
+            raise ValueError(f"Unsupported columnar format {fmt!r}; expected one of {COLUMNAR_FORMATS}.")
+        unknown = [key for key in partition_by if key not in PARTITION_KEYS]
+        if unknown:
+            raise ValueError(f"Unknown partition keys {unknown}; expected any of {PARTITION_KEYS}.")
+
+        self.path = Path(path)
+        self.fmt = fmt
+        self.row_group_size = max(1, int(row_group_size))
+        self.partition_by = tuple(partition_by)
+        self.partition_defaults = dict(partition_defaults or {})
+        self.compression = compression
+        self.include_delta = include_delta
+        self.include_clusters = include_clusters
+        self.max_open_files = max(1, int(max_open_files))
+        self.schema = ad_schema(include_delta, include_clusters)
+        self.count = 0
+        self.files: List[Path] = []
+
+        self._buffers: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+        self._buffered = 0
+        self._writers: "collections.OrderedDict[Tuple[str, ...], Any]" = collections.OrderedDict()
+        self._parts: Dict[Tuple[str, ...], int] = {}
+        self._closed = False
+
+        if self.partition_by:
+            self.path.mkdir(parents=True, exist_ok=True)
+        LOGGER.debug("Writing %s output to %s (partitioned by %s)", fmt, self.path, self.partition_by or "nothing")
+
+    def _partition_of(self, ad: Dict[str, Any]) -> Tuple[str, ...]:
+        if not self.partition_by:
+            return ()
+        source = ad.get(SOURCE_FIELD)
+        source = source if isinstance(source, dict) else {}
+        values = []
+        for key in self.partition_by:
+            if key == "date":
+                value = partition_date(ad.get("start_date"))
+            else:
+                value = _as_str(source.get(key))
+            if value is None:
+                value = self.partition_defaults.get(key)
+            values.append(path_segment(value))
+        return tuple(values)
+
+    @pipeline_stage("write")
+    def write(self, ad: Dict[str, Any]) -> None:
+        if self._closed:
+            raise ValueError("ColumnarWriter is closed.")
+        key = self._partition_of(ad)
+        buffer = self._buffers.setdefault(key, [])
+        buffer.append(to_row(ad, self.include_delta, self.include_clusters))
+        self.count += 1
+        self._buffered += 1
+        if len(buffer) >= self.row_group_size:
+            self._write_group(key)
+        elif self._buffered >= 2 * self.row_group_size:
+            # Many small partitions: bound memory by writing out the largest.
+            self._write_group(max(self._buffers, key=lambda k: len(self._buffers[k])))
+
+    def flush(self) -> None:
+        for key in list(self._buffers):
+            self._write_group(key)
+
+    def _file_for(self, key: Tuple[str, ...]) -> Path:
+        if not self.partition_by:
+            return self.path
+        directory = self.path.joinpath(
+            *(f"{name}={value}" for name, value in zip(self.partition_by, key))
+        )
+        directory.mkdir(parents=True, exist_ok=True)
+        part = self._parts.get(key, 0)
+        self._parts[key] = part + 1
+        suffix = ".parquet" if self.fmt == "parquet" else ".arrow"
+        return directory / f"part-{part:05d}{suffix}"
+
+    def _open(self, key: Tuple[str, ...]) -> Any:
+        writer = self._writers.get(key)
+        if writer is not None:
+            self._writers.move_to_end(key)
+            return writer
+
+        while len(self._writers) >= self.max_open_files:
+            _, oldest = self._writers.popitem(last=False)
+            oldest.close()
+
+        path = self._file_for(key)
+        self.files.append(path)
+        if self.fmt == "parquet":
+            writer = pq.ParquetWriter(str(path), self.schema, compression=self.compression)
+        else:
+            writer = _ArrowFileWriter(path, self.schema, self.compression)
+        self._writers[key] = writer
+        return writer
+
+    def _write_group(self, key: Tuple[str, ...]) -> None:
+        rows = self._buffers.pop(key, None)
+        if not rows:
+            return
+        self._buffered -= len(rows)
+        table = pa.Table.from_pylist(rows, schema=self.schema)
+        writer = self._open(key)
+        if self.fmt == "parquet":
+            # One row group per flush, however large the buffer grew.
+            writer.write_table(table, row_group_size=len(rows))
+        else:
+            writer.write_table(table)
+
+    @pipeline_stage("write")
+    def close(self) -> None:
+        if self._closed:
+            return
+        try:
+            self.flush()
+            if not self.partition_by and not self.files:
+                # Still leave a valid, empty file with the full schema.
+                self._open(())
+        finally:
+            self._closed = True
+            for writer in self._writers.values():
+                writer.close()
+            self._writers.clear()
+        LOGGER.debug("Closed %d %s file(s) under %s", len(self.files), self.fmt, self.path)
+
+    def __enter__(self) -> "ColumnarWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
@@ -1,12 +1,129 @@
-thonimport json
+import json
 import logging
+import os
+import time
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, Dict, Optional, Union
 
-import requests
+from utils.metrics import get_metrics, pipeline_stage
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+# msgspec is only needed without orjson or when picked explicitly, and it
+# takes about as long to import as a small run takes, so it is loaded by
+# _load_msgspec() on first use.
+msgspec: Any = None
+
+if TYPE_CHECKING:  # pragma: no cover
+    import requests
 
 LOGGER = logging.getLogger(__name__)
 
+JSON_BACKENDS = ("orjson", "msgspec", "json")
+
+def _load_msgspec() -> bool:
+    global msgspec
+    if msgspec is None:
+        try:
+            import msgspec as module
+        except ImportError:  # pragma: no cover - optional dependency
+            return False
+        msgspec = module
+    return True
+
+def _default_backend() -> str:
+    if orjson is not None:
+        return "orjson"
+    if _load_msgspec():
+        return "msgspec"
+    return "json"
+
+_json_backend = _default_backend()
+
+def set_json_backend(name: str = "auto") -> str:
+    """
+    Select the JSON codec used by json_dumps/json_loads: ``orjson``,
+    ``msgspec`` or ``json`` (stdlib), or ``auto`` for the fastest one
+    installed. An unavailable backend falls back to ``auto``. Returns the
+    backend in use.
+    """
+    global _json_backend
+    available = {"orjson": orjson is not None, "json": True}
+    if name == "msgspec":
+        available[name] = _load_msgspec()
+    if name != "auto" and not available.get(name):
+        LOGGER.warning("JSON backend %r is not available; using the fastest installed one.", name)
+        name = "auto"
+    _json_backend = _default_backend() if name == "auto" else name
+    LOGGER.debug("Using %s JSON backend", _json_backend)
+    return _json_backend
+
+def json_backend() -> str:
+    return _json_backend
+
+def _stdlib_dumps(obj: Any, pretty: bool, default: Optional[Callable[[Any], Any]]) -> bytes:
+    if pretty:
+        text = json.dumps(obj, ensure_ascii=False, indent=2, default=default)
+    else:
+        text = json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=default)
+    return text.encode("utf-8")
+
+def json_dumps(
+    obj: Any,
+    pretty: bool = False,
+    default: Optional[Callable[[Any], Any]] = None,
+) -> bytes:
+    """
+    Encode ``obj`` as UTF-8 JSON with the active backend.
+
+    ``pretty`` gives the same 2-space indented layout on every backend;
+    otherwise output is compact (no whitespace). Values a fast backend
+    cannot encode (e.g. integers wider than 64 bits) are retried with the
+    stdlib encoder so results never depend on which backend is installed.
+    """
+    try:
+        if _json_backend == "orjson":
+            option = orjson.OPT_NON_STR_KEYS
+            if pretty:
+                option |= orjson.OPT_INDENT_2
+            return orjson.dumps(obj, default=default, option=option)
+        if _json_backend == "msgspec":
+            data = msgspec.json.encode(obj, enc_hook=default)
+            return msgspec.json.format(data, indent=2) if pretty else data
+    except (TypeError, ValueError, OverflowError) as err:
+        LOGGER.debug("%s could not encode value (%s); using stdlib json", _json_backend, err)
+    except Exception as err:
+        if msgspec is None or not isinstance(err, msgspec.MsgspecError):
+            raise
+        LOGGER.debug("msgspec could not encode value (%s); using stdlib json", err)
+    return _stdlib_dumps(obj, pretty, default)
+
+@pipeline_stage("decode")
+def json_loads(data: Union[bytes, bytearray, str]) -> Any:
+    """
+    Decode JSON text or UTF-8 bytes with the active backend. Input a fast
+    backend rejects (e.g. NaN, or a number too large for a double) is
+    retried with the stdlib decoder, so malformed input raises ValueError
+    and what is accepted does not depend on the backend. orjson decodes
+    integers wider than 64 bits as floats; checking every document for them
+    would cost about half of what orjson saves, so pick the ``msgspec`` or
+    ``json`` backend for input that has them.
+    """
+    if _json_backend == "orjson":
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError as err:
+            LOGGER.debug("orjson could not decode value (%s); using stdlib json", err)
+    elif _json_backend == "msgspec":
+        try:
+            return msgspec.json.decode(data)
+        except msgspec.DecodeError as err:
+            LOGGER.debug("msgspec could not decode value (%s); using stdlib json", err)
+    return json.loads(data)
+
 def setup_logging(level: int = logging.INFO) -> None:
     """
     Configure root logger with a simple, readable format.
@@ -22,45 +139,164 @@ def setup_logging(level: int = logging.INFO) -> None:
 
 def load_json_file(path: Path) -> Any:
     """
-    Load JSON from a file, raising FileNotFoundError or json.JSONDecodeError
-    if something goes wrong.
+    Load JSON from a file, raising FileNotFoundError or ValueError if
+    something goes wrong.
     """
     path = Path(path)
     LOGGER.debug("Loading JSON from %s", path)
-    with path.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return json_loads(path.read_bytes())
 
-def save_json_file(path: Path, data: Any, pretty: bool = True) -> None:
+@pipeline_stage("write")
+def save_json_file(
+    path: Path,
+    data: Any,
+    pretty: bool = True,
+    default: Optional[Callable[[Any], Any]] = None,
+) -> None:
     """
-    Save Python data as JSON to a file.
+    Save Python data as JSON to a file, indented unless ``pretty`` is
+    False. ``default`` converts objects the encoder does not know.
     """
     path = Path(path)
     LOGGER.debug("Saving JSON to %s", path)
-    indent = 2 if pretty else None
-    with path.open("w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=indent)
+    with path.open("wb") as f:
+        f.write(json_dumps(data, pretty=pretty, default=default))
+
+class RecordWriter:
+    """
+    Incrementally write records to disk as they are produced.
+
+    ``fmt="ndjson"`` writes one compact JSON document per line;
+    ``fmt="json"`` writes a JSON array with one compact record per line, so
+    the file is still a valid JSON document once closed. Output is flushed every
+    ``flush_every`` records or ``flush_interval`` seconds, whichever comes
+    first, so other processes can tail it while the run is in progress.
+    With ``resume_offset`` an existing file is truncated to that many bytes
+    and appended to, continuing after ``resume_count`` records.
+    """
+
+    FORMATS = ("json", "ndjson")
+
+    def __init__(
+        self,
+        path: Path,
+        fmt: str = "ndjson",
+        flush_every: int = 500,
+        flush_interval: float = 2.0,
+        resume_offset: Optional[int] = None,
+        resume_count: int = 0,
+    ) -> None:
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unsupported output format {fmt!r}; expected one of {self.FORMATS}.")
+        self.path = Path(path)
+        self.fmt = fmt
+        self.flush_every = max(1, int(flush_every))
+        self.flush_interval = float(flush_interval)
+        self.count = 0
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        LOGGER.debug("Streaming %s output to %s", fmt, self.path)
+        if resume_offset is not None:
+            self._file: Optional[BinaryIO] = self.path.open("r+b")
+            self._file.truncate(resume_offset)
+            self._file.seek(resume_offset)
+            self.count = resume_count
+            return
+        self._file = self.path.open("wb")
+        if self.fmt == "json":
+            self._file.write(b"[")
+
+    @pipeline_stage("write")
+    def write(self, record: Any) -> None:
+        if self._file is None:
+            raise ValueError("RecordWriter is closed.")
+        line = json_dumps(record)
+        if self.fmt == "json":
+            self._file.write(b",\n" if self.count else b"\n")
+            self._file.write(line)
+        else:
+            self._file.write(line)
+            self._file.write(b"\n")
+        self.count += 1
+        self._pending += 1
+
+        if (
+            self._pending >= self.flush_every
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        if self._file is None:
+            return
+        self._file.flush()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def sync(self) -> int:
+        """
+        Flush and fsync what was written so far; returns the file size.
+        """
+        if self._file is None:
+            raise ValueError("RecordWriter is closed.")
+        self.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    @pipeline_stage("write")
+    def close(self) -> None:
+        if self._file is None:
+            return
+        if self.fmt == "json":
+            self._file.write(b"\n]\n" if self.count else b"]\n")
+        self._file.close()
+        self._file = None
+
+    def __enter__(self) -> "RecordWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
 
 def http_get_json(
     url: str,
     params: Optional[Dict[str, Any]] = None,
     timeout: int = 15,
+    session: Optional["requests.Session"] = None,
 ) -> Any:
     """
     Perform an HTTP GET and decode the response as JSON.
 
-    Raises requests.RequestException for network errors and json.JSONDecodeError
-    if the response cannot be parsed.
+    If a ``session`` is given its connection pool is reused; otherwise a
+    one-off request is made.
+
+    Raises requests.RequestException for network errors and ValueError if
+    the response cannot be parsed.
     """
+    # Imported here so offline runs never pay for loading requests.
+    import requests
+
     LOGGER.debug("HTTP GET %s params=%s", url, params)
+    metrics = get_metrics()
+    started = time.perf_counter()
     try:
-        resp = requests.get(url, params=params, timeout=timeout)
+        getter = session.get if session is not None else requests.get
+        resp = getter(url, params=params, timeout=timeout)
         resp.raise_for_status()
     except requests.RequestException as err:
-        LOGGER.error("HTTP GET failed for %s: %s", url, err)
+        metrics.count("api_errors")
+        # Callers decide whether this is worth retrying, and log it.
+        LOGGER.debug("HTTP GET failed for %s: %s", url, err)
         raise
+    finally:
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - started, "api")
+    metrics.add_bytes("fetch", len(resp.content))
 
+    started = time.perf_counter()
     try:
-        return resp.json()
+        return json_loads(resp.content)
     except ValueError as err:
         LOGGER.error("Failed to decode JSON from %s: %s", url, err)
-        raise
\ No newline at end of file
+        raise
+    finally:
+        metrics.count("api_decode_seconds", time.perf_counter() - started)
\ No newline at end of file
@@ -0,0 +1,203 @@
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+
+from utils.helpers import json_dumps, json_loads
+from utils.metrics import get_metrics
+
+LOGGER = logging.getLogger(__name__)
+
+CACHE_FILENAME = "responses.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    body BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses(accessed_at);
+"""
+
+def cache_key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Stable key for a GET request: the URL plus its params with keys sorted
+    and values stringified, so logically equal requests share an entry.
+    """
+    canonical = sorted((str(k), str(v)) for k, v in (params or {}).items() if v is not None)
+    payload = json.dumps([url, canonical], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    On-disk cache of decoded JSON responses.
+
+    Entries are zlib-compressed in a SQLite database in WAL mode, which makes
+    the cache safe to share between threads and between processes on the
+    same machine. Each thread gets its own connection; close() closes all
+    of them. Entries older than ``ttl`` seconds are ignored, and once the
+    stored size exceeds ``max_bytes`` the least recently used entries are
+    evicted. Hits, misses, stores and evictions are also counted in the
+    run metrics as ``http_cache_*`` counters.
+    """
+
+    # Re-check the total size only every few writes; it needs a table scan.
+    EVICTION_CHECK_EVERY = 32
+
+    def __init__(self, directory: Path, ttl: float = 3600.0, max_bytes: int = 256 << 20) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / CACHE_FILENAME
+        self.ttl = float(ttl)
+        self.max_bytes = int(max_bytes)
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        self._local = threading.local()
+        self._conns: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._writes_since_check = 0
+        self._connect().executescript(_SCHEMA)
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]) -> Optional["ResponseCache"]:
+        if not settings.get("http_cache"):
+            return None
+        return cls(
+            Path(settings["http_cache_dir"]),
+            ttl=settings["http_cache_ttl"],
+            max_bytes=int(settings["http_cache_max_mb"] * (1 << 20)),
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Only this thread uses it, but close() may run on another one.
+            conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._conns.append(conn)
+        return conn
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None) -> Optional[Any]:
+        key = cache_key(url, params)
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT created_at, body FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+
+        now = time.time()
+        if row is None or now - row[0] > self.ttl:
+            self._bump("misses")
+            return None
+
+        try:
+            value = json_loads(zlib.decompress(row[1]))
+        except (zlib.error, ValueError) as err:
+            LOGGER.warning("Dropping corrupt HTTP cache entry for %s: %s", url, err)
+            with conn:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._bump("misses")
+            return None
+
+        with conn:
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        self._bump("hits")
+        LOGGER.debug("HTTP cache hit for %s params=%s", url, params)
+        return value
+
+    def set(self, url: str, params: Optional[Dict[str, Any]], value: Any) -> None:
+        body = zlib.compress(json_dumps(value))
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, url, created_at, accessed_at, size, body) VALUES (?, ?, ?, ?, ?, ?)",
+                (cache_key(url, params), url, now, now, len(body), body),
+            )
+        self._bump("stores")
+
+        with self._lock:
+            self._writes_since_check += 1
+            due = self._writes_since_check >= self.EVICTION_CHECK_EVERY
+            if due:
+                self._writes_since_check = 0
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Drop expired entries, then least recently used ones until the cache
+        is back under 90% of ``max_bytes``. Returns the number removed.
+        """
+        conn = self._connect()
+        removed = 0
+        with conn:
+            removed += conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,)
+            ).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                target = int(self.max_bytes * 0.9)
+                rows = conn.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed_at"
+                ).fetchall()
+                stale = []
+                for key, size in rows:
+                    if total <= target:
+                        break
+                    stale.append((key,))
+                    total -= size
+                conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+                removed += len(stale)
+        if removed:
+            self._bump("evictions", removed)
+            LOGGER.debug("Evicted %d HTTP cache entries", removed)
+        return removed
+
+    def _bump(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+        get_metrics().count(f"http_cache_{name}", amount)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
+
+    def summary(self) -> str:
+        stats = self.stats()
+        lookups = stats["hits"] + stats["misses"]
+        ratio = stats["hits"] / lookups if lookups else 0.0
+        return (
+            f"{stats['hits']} hits, {stats['misses']} misses ({ratio:.0%} hit rate), "
+            f"{stats['stores']} stored, {stats['evictions']} evicted"
+        )
+
+    def close(self) -> None:
+        """
+        Close the connection of every thread that used the cache.
+        """
+        with self._lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            conn.close()
+        self._local = threading.local()
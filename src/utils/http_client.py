@@ -0,0 +1,182 @@
+from typing import Any, Dict, Optional
+import logging
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.helpers import http_get_json
+from utils.http_cache import ResponseCache
+from utils.metrics import get_metrics
+from utils.rate_limit import (
+    RETRYABLE_STATUS,
+    AdaptiveRateLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    backoff_delay,
+    endpoint_of,
+    parse_retry_after,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+USER_AGENT = "facebook-ads-library-scraper/1.0 (+https://bitbash.dev)"
+
+def build_session(pool_size: int = 10) -> requests.Session:
+    """
+    Create a requests.Session whose connection pool can hold ``pool_size``
+    keep-alive connections per host, so concurrent workers do not have to
+    open a fresh TCP/TLS connection for every request.
+    """
+    pool_size = max(1, int(pool_size))
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"User-Agent": USER_AGENT})
+    return session
+
+class ApiClient:
+    """
+    Shared HTTP client for live API calls.
+
+    Bundles a pooled session with an adaptive per-host rate limiter, a
+    per-endpoint circuit breaker and an optional on-disk response cache,
+    consulted before a request is rate limited or sent. Connection errors,
+    timeouts and retryable statuses (429, 5xx) are retried up to
+    ``retries`` times with jittered exponential backoff, waiting at least
+    as long as the server's Retry-After. A single instance is safe to
+    share between worker threads.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        requests_per_second: float = 0.0,
+        timeout: int = 15,
+        cache: Optional[ResponseCache] = None,
+        retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 30.0,
+        max_retry_after: float = 120.0,
+        rate_limiter: Optional[AdaptiveRateLimiter] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        pool_size: Optional[int] = None,
+    ) -> None:
+        self.timeout = timeout
+        self.session = build_session(pool_size=pool_size or max_concurrency)
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter(requests_per_second)
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.cache = cache
+        self.retries = max(0, int(retries))
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_retry_after = max_retry_after
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any], pool_size: Optional[int] = None) -> "ApiClient":
+        """
+        Build a client from validated settings. ``pool_size`` overrides the
+        keep-alive pool size, which otherwise matches ``max_concurrency``,
+        for a client shared by several concurrent runs.
+        """
+        return cls(
+            max_concurrency=settings["max_concurrency"],
+            requests_per_second=settings["requests_per_second"],
+            timeout=settings["http_timeout"],
+            cache=ResponseCache.from_settings(settings),
+            retries=settings["http_retries"],
+            backoff_base=settings["retry_backoff_base"],
+            backoff_cap=settings["retry_backoff_cap"],
+            rate_limiter=AdaptiveRateLimiter(
+                settings["requests_per_second"],
+                burst=settings["rate_limit_burst"],
+                increase=AdaptiveRateLimiter.DEFAULT_INCREASE if settings["adaptive_rate_limit"] else 0.0,
+            ),
+            circuit_breaker=CircuitBreaker(
+                failure_threshold=settings["circuit_breaker_threshold"],
+                reset_timeout=settings["circuit_breaker_reset"],
+            ),
+            pool_size=pool_size,
+        )
+
+    def get_json(self, url: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        if self.cache is not None:
+            cached = self.cache.get(url, params)
+            if cached is not None:
+                return cached
+
+        data = self._get_with_retries(url, params)
+
+        if self.cache is not None:
+            try:
+                self.cache.set(url, params, data)
+            except Exception as err:
+                LOGGER.warning("Could not store HTTP cache entry for %s: %s", url, err)
+        return data
+
+    def _get_with_retries(self, url: str, params: Optional[Dict[str, Any]]) -> Any:
+        endpoint = endpoint_of(url)
+        metrics = get_metrics()
+        attempt = 0
+        while True:
+            if not self.circuit_breaker.allow(endpoint):
+                metrics.count("api_circuit_rejections")
+                raise CircuitOpenError(f"Circuit open for {endpoint}; not sending request.")
+
+            self.rate_limiter.acquire(url)
+            try:
+                data = http_get_json(url, params=params, timeout=self.timeout, session=self.session)
+            except requests.RequestException as err:
+                response = err.response
+                status = response.status_code if response is not None else None
+                if status is None or status >= 500:
+                    self.circuit_breaker.record_failure(endpoint)
+                else:
+                    # The endpoint answered; it is up even if it refused us.
+                    self.circuit_breaker.record_success(endpoint)
+                if (status is not None and status not in RETRYABLE_STATUS) or attempt >= self.retries:
+                    raise
+
+                retry_after = None
+                if response is not None:
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    if retry_after is not None:
+                        retry_after = min(retry_after, self.max_retry_after)
+                if status == 429:
+                    metrics.count("api_throttled")
+                    self.rate_limiter.on_throttle(url, retry_after)
+                delay = max(backoff_delay(attempt, self.backoff_base, self.backoff_cap), retry_after or 0.0)
+                LOGGER.warning(
+                    "Retrying %s in %.2fs (attempt %d/%d) after: %s",
+                    url,
+                    delay,
+                    attempt + 1,
+                    self.retries,
+                    err,
+                )
+                metrics.count("api_retries")
+                attempt += 1
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # Undecodable JSON, a bug or an interrupt: count it like any
+                # other failure so a half-open trial never stays pending.
+                self.circuit_breaker.record_failure(endpoint)
+                raise
+            else:
+                self.circuit_breaker.record_success(endpoint)
+                self.rate_limiter.on_success(url)
+                return data
+
+    def close(self) -> None:
+        self.session.close()
+        if self.cache is not None:
+            LOGGER.info("HTTP cache: %s", self.cache.summary())
+            self.cache.close()
+
+    def __enter__(self) -> "ApiClient":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
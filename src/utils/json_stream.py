@@ -0,0 +1,213 @@
+from pathlib import Path
+from typing import Any, Dict, Generator, Iterable, Iterator, Optional, TextIO
+import gzip
+import json
+import logging
+
+from utils.helpers import json_loads
+from utils.metrics import pipeline_stage
+
+LOGGER = logging.getLogger(__name__)
+
+GZIP_MAGIC = b"\x1f\x8b"
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+DEFAULT_CHUNK_SIZE = 1 << 20
+_WHITESPACE = " \t\r\n"
+
+def open_text(path: Path) -> TextIO:
+    """
+    Open a possibly gzip-compressed file for reading as UTF-8 text.
+
+    Compression is detected from the file's magic bytes, not its name.
+    """
+    path = Path(path)
+    with path.open("rb") as f:
+        magic = f.read(2)
+    if magic == GZIP_MAGIC:
+        LOGGER.debug("Reading gzip-compressed input %s", path)
+        return gzip.open(path, "rt", encoding="utf-8")
+    return path.open("r", encoding="utf-8")
+
+def _logical_suffix(path: Path) -> str:
+    suffixes = [s.lower() for s in Path(path).suffixes]
+    if suffixes and suffixes[-1] == ".gz":
+        suffixes = suffixes[:-1]
+    return suffixes[-1] if suffixes else ""
+
+class _Scanner:
+    """
+    Minimal pull parser over a text stream.
+
+    Structural characters of the top-level container are consumed one by
+    one, while each element is decoded with ``json.JSONDecoder.raw_decode``
+    from a sliding buffer. Only the element being decoded (plus one read
+    chunk) is ever held in memory.
+    """
+
+    def __init__(self, stream: TextIO, chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+        self.stream = stream
+        self.chunk_size = max(1024, int(chunk_size))
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size: int) -> bool:
+        chunk = self.stream.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        Skip whitespace and return the next character, or "" at end of input.
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill(self.chunk_size):
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON input but found {found or 'end of input'!r}.")
+        self.pos += 1
+
+    @pipeline_stage("decode")
+    def value(self) -> Any:
+        """
+        Decode the next complete JSON value, reading more input as needed.
+        """
+        self.peek()
+        read_size = self.chunk_size
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                obj, end = None, -1
+
+            # A number or literal touching the end of the buffer may continue
+            # in the next chunk, so only accept it once more input is seen.
+            if end != -1 and (end < len(self.buf) or self.eof):
+                self.pos = end
+                return obj
+
+            if not self._fill(read_size):
+                continue
+            # Grow reads geometrically so huge elements do not cost
+            # quadratic re-decoding.
+            read_size = min(read_size * 2, 64 * self.chunk_size)
+
+    def iter_array(self) -> Iterator[Any]:
+        """
+        Yield the elements of the array whose opening bracket is next.
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            sep = self.peek()
+            self.pos += 1
+            if sep == "]":
+                return
+            if sep != ",":
+                raise ValueError(f"Expected ',' or ']' in JSON array but found {sep or 'end of input'!r}.")
+
+    def iter_data_member(self) -> Generator[Any, None, Optional[Dict[str, Any]]]:
+        """
+        Walk an object's members and stream the elements of its ``data``
+        array; anything after it is never read. An object without a
+        ``data`` array is not a wrapper but a record, and is returned whole
+        once its closing brace is consumed.
+        """
+        self.expect("{")
+        members: Dict[str, Any] = {}
+        while self.peek() != "}":
+            key = self.value()
+            self.expect(":")
+            if key == "data" and self.peek() == "[":
+                yield from self.iter_array()
+                return None
+            members[key] = self.value()
+            if self.peek() == ",":
+                self.pos += 1
+        self.pos += 1
+        return members
+
+def iter_ndjson(stream: Iterable[str], decode: bool = True) -> Iterator[Any]:
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        if not decode:
+            yield line
+            continue
+        try:
+            yield json_loads(line)
+        except ValueError as err:
+            raise ValueError(f"Invalid JSON on line {line_no}: {err}") from err
+
+@pipeline_stage("fetch")
+def iter_json_records(
+    path: Path,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    decode: bool = True,
+) -> Iterator[Any]:
+    """
+    Incrementally iterate the records of a JSON input file without loading
+    the whole document.
+
+    Supports a top-level array, an object with a ``data`` array, and NDJSON
+    (from a .ndjson/.jsonl extension, or when the first object turns out
+    not to have a ``data`` array), each optionally gzip-compressed. With ``decode=False`` NDJSON records are yielded as raw
+    JSON text lines, which parallel normalization can ship to workers as-is;
+    other layouts are always decoded. Raises FileNotFoundError, ValueError or
+    json.JSONDecodeError for unreadable input.
+    """
+    path = Path(path)
+    LOGGER.debug("Streaming JSON records from %s", path)
+    with open_text(path) as stream:
+        if _logical_suffix(path) in NDJSON_SUFFIXES:
+            yield from iter_ndjson(stream, decode=decode)
+            return
+
+        scanner = _Scanner(stream, chunk_size=chunk_size)
+        first = scanner.peek()
+        if first == "[":
+            yield from scanner.iter_array()
+        elif first == "{":
+            record = yield from scanner.iter_data_member()
+            if record is not None:
+                LOGGER.debug("Detected NDJSON content in %s", path)
+                yield record
+                rest = scanner.buf[scanner.pos:]
+                yield from iter_ndjson(_prepend(rest, stream), decode=decode)
+        else:
+            raise ValueError(
+                f"Input file {path} did not contain a list or an object with 'data'."
+            )
+
+def _prepend(head: str, stream: TextIO) -> Iterator[str]:
+    """
+    Re-join already buffered text with the rest of the stream as lines.
+    """
+    lines = head.split("\n")
+    tail = lines.pop()
+    for line in lines:
+        yield line
+    for line in stream:
+        if tail:
+            line, tail = tail + line, ""
+        yield line
+    if tail:
+        yield tail
@@ -0,0 +1,478 @@
+from pathlib import Path
+from types import CodeType
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+import contextlib
+import contextvars
+import functools
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets, Prometheus style.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Time spent outside any registered stage (setup, logging, teardown).
+OTHER_STAGE = "other"
+
+# Stage sampling interval (seconds) for runs that ask for it; off otherwise.
+DEFAULT_SAMPLE_INTERVAL = 0.002
+
+_STAGE_CODES: Dict[CodeType, str] = {}
+
+F = TypeVar("F", bound=Callable[..., Any])
+T = TypeVar("T")
+
+def pipeline_stage(name: str) -> Callable[[F], F]:
+    """
+    Mark a function (or generator function) as belonging to stage ``name``.
+
+    The function is returned unchanged; the stage sampler looks its code
+    object up in the sampled thread's stack, so marking costs nothing per
+    call. The innermost marked frame wins, which makes stage time
+    exclusive: a normalizer pulling from a fetch generator is charged as
+    fetch while it waits for the next record.
+    """
+
+    def mark(func: F) -> F:
+        _STAGE_CODES[func.__code__] = name
+        return func
+
+    return mark
+
+def _stage_of(frame: Any) -> str:
+    codes = _STAGE_CODES
+    while frame is not None:
+        name = codes.get(frame.f_code)
+        if name is not None:
+            return name
+        frame = frame.f_back
+    return OTHER_STAGE
+
+def peak_rss_bytes() -> Optional[int]:
+    """
+    Peak resident set size of this process, or None if unavailable.
+    """
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:  # pragma: no cover - Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Upper bound of the bucket holding the ``q`` quantile.
+        """
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def as_dict(self) -> Dict[str, Any]:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": buckets,
+        }
+
+class _Stage:
+    __slots__ = ("records", "bytes")
+
+    def __init__(self) -> None:
+        self.records = 0
+        self.bytes = 0
+
+class _StageClock:
+    """
+    Per-thread bookkeeping that makes stage times exclusive: ``nested``
+    is the time charged to stages so far on this thread, so a stage can
+    subtract the part of its own time spent inside stages nested in it.
+    """
+
+    __slots__ = ("nested",)
+
+    def __init__(self) -> None:
+        self.nested = 0.0
+
+class Metrics:
+    """
+    Instrumentation for one scraping run.
+
+    Stage wall time is measured at the few boundaries between pipeline
+    stages: timed_stage() charges the time spent producing each record to
+    its stage and stage_time() charges a block. Stages nest, and each is
+    charged its own time only. This costs two clock reads per record and
+    boundary, works on any thread and is always on.
+
+    For finer detail, stage wall and CPU time can also be sampled: an
+    interval timer interrupts the pipeline thread every few milliseconds
+    and the time since the previous sample is charged to the innermost
+    function on its stack marked with pipeline_stage(), e.g. JSON decoding
+    inside fetch. Sampled times are statistical, accurate to a few sampling
+    intervals, and need the main thread. Sampling is a profiling aid and is
+    off unless a run asks for it (``metrics_sample_interval``); when it is
+    on, the report shows sampled stage times instead of the measured ones.
+    Records, bytes, counters and HTTP latency histograms are exact and may
+    be updated from any thread.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.stages: Dict[str, _Stage] = {}
+        self.counters: Dict[str, float] = {}
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.started_at = time.time()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        # Stage -> (wall, cpu, samples), only ever replaced whole by the
+        # signal handler, which must not take the lock (it may interrupt
+        # code holding it).
+        self._sampled: Dict[str, Tuple[float, float, int]] = {}
+        self._sampling = False
+        self._previous_handler: Any = None
+        self._last_wall = 0.0
+        self._last_cpu = 0.0
+        self._local = threading.local()
+        self._timed: Dict[str, float] = {}
+
+    def _stage(self, name: str) -> _Stage:
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = _Stage()
+        return stage
+
+    # Stage timing
+
+    def _clock(self) -> _StageClock:
+        """
+        The calling thread's stage clock.
+        """
+        clock = getattr(self._local, "clock", None)
+        if clock is None:
+            clock = self._local.clock = _StageClock()
+        return clock
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._timed[stage] = self._timed.get(stage, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def stage_time(self, stage: str) -> Iterator[None]:
+        """
+        Charge the time spent in the block to ``stage``.
+        """
+        clock = self._clock()
+        before = clock.nested
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.add_time(stage, elapsed - (clock.nested - before))
+            clock.nested = before + elapsed
+
+    # Stage sampling
+
+    def start_sampling(self, interval: float = DEFAULT_SAMPLE_INTERVAL) -> bool:
+        """
+        Start attributing the calling thread's time to pipeline stages,
+        sampled every ``interval`` seconds by an interval timer signal.
+        Needs setitimer() and the main thread; returns False (and only the
+        run totals are measured) otherwise.
+        """
+        if self._sampling or interval <= 0:
+            return False
+        if not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+            LOGGER.debug("Stage sampling needs setitimer() on the main thread; skipping it.")
+            return False
+        self._last_wall = time.perf_counter()
+        self._last_cpu = time.thread_time()
+        self._previous_handler = signal.signal(signal.SIGALRM, self._sample)
+        signal.setitimer(signal.ITIMER_REAL, interval, interval)
+        self._sampling = True
+        return True
+
+    def stop_sampling(self) -> None:
+        if not self._sampling:
+            return
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, self._previous_handler)
+        self._sampling = False
+
+    def _sample(self, signum: int, frame: Any) -> None:
+        # Runs on the main thread between bytecodes, so ``frame`` is exactly
+        # where the pipeline is; time since the last sample is charged there.
+        now = time.perf_counter()
+        cpu = time.thread_time()
+        name = _stage_of(frame)
+        wall, cpu_total, samples = self._sampled.get(name, (0.0, 0.0, 0))
+        self._sampled[name] = (
+            wall + now - self._last_wall,
+            cpu_total + cpu - self._last_cpu,
+            samples + 1,
+        )
+        self._last_wall, self._last_cpu = now, cpu
+
+    # Counters and histograms
+
+    def add_records(self, stage: str, count: int = 1) -> None:
+        with self._lock:
+            self._stage(stage).records += count
+
+    def add_bytes(self, stage: str, count: int) -> None:
+        with self._lock:
+            self._stage(stage).bytes += count
+
+    def count(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, value: float, target: str = "") -> None:
+        with self._lock:
+            histogram = self.histograms.get((name, target))
+            if histogram is None:
+                histogram = self.histograms[(name, target)] = Histogram()
+            histogram.observe(value)
+
+    # Reporting
+
+    def report(self) -> Dict[str, Any]:
+        wall = time.perf_counter() - self._wall_start
+        cpu = time.process_time() - self._cpu_start
+        sampled = dict(self._sampled)
+        with self._lock:
+            if not sampled:
+                sampled = {name: (seconds, 0.0, 0) for name, seconds in self._timed.items()}
+            stages = {}
+            names = set(sampled) | set(self.stages)
+            for name in sorted(names, key=lambda n: -sampled.get(n, (0.0,))[0]):
+                stage_wall, stage_cpu, samples = sampled.get(name, (0.0, 0.0, 0))
+                counts = self.stages.get(name) or _Stage()
+                stages[name] = {
+                    "wall_seconds": round(stage_wall, 6),
+                    "cpu_seconds": round(stage_cpu, 6),
+                    "samples": samples,
+                    "records": counts.records,
+                    "records_per_second": _rate(counts.records, stage_wall),
+                    "bytes": counts.bytes,
+                    "bytes_per_second": _rate(counts.bytes, stage_wall),
+                }
+            histograms: Dict[str, Dict[str, Any]] = {}
+            for (name, target), histogram in sorted(self.histograms.items()):
+                histograms.setdefault(name, {})[target or "all"] = histogram.as_dict()
+            counters = {name: round(value, 6) for name, value in sorted(self.counters.items())}
+        return {
+            "started_at": round(self.started_at, 3),
+            "wall_seconds": round(wall, 6),
+            "cpu_seconds": round(cpu, 6),
+            "peak_rss_bytes": peak_rss_bytes(),
+            "stages": stages,
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+    def summary(self) -> str:
+        report = self.report()
+        parts = []
+        for name, stage in report["stages"].items():
+            if not stage["wall_seconds"]:
+                # Counted but never timed: only the records are known.
+                if stage["records"]:
+                    parts.append(f"{name} {stage['records']:,} records")
+                continue
+            part = f"{name} {stage['wall_seconds']:.2f}s"
+            if stage["records_per_second"]:
+                part += f" ({stage['records_per_second']:,.0f} rec/s)"
+            parts.append(part)
+        text = f"{report['wall_seconds']:.2f}s wall, {report['cpu_seconds']:.2f}s CPU"
+        if parts:
+            text += "; " + ", ".join(parts)
+        if report["peak_rss_bytes"]:
+            text += f"; peak RSS {report['peak_rss_bytes'] / (1 << 20):.0f} MB"
+        return text
+
+    def prometheus_text(self, prefix: str = "fb_ads_scraper", labels: Optional[Dict[str, str]] = None) -> str:
+        """
+        Render the report in the Prometheus text exposition format, for the
+        node_exporter textfile collector. ``labels`` are added to every
+        sample, e.g. the job name when several jobs export side by side.
+        """
+        report = self.report()
+        lines: List[str] = []
+        common = [f'{key}="{_label(value)}"' for key, value in (labels or {}).items()]
+
+        def declare(name: str, kind: str, help_text: str) -> str:
+            full = f"{prefix}_{name}"
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            return full
+
+        def sample(name: str, value: Any, *pairs: str) -> None:
+            label_text = ",".join(common + list(pairs))
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        name = declare("run_wall_seconds", "gauge", "Wall time of the last run.")
+        sample(name, report["wall_seconds"])
+        name = declare("run_cpu_seconds", "gauge", "Process CPU time of the last run.")
+        sample(name, report["cpu_seconds"])
+        if report["peak_rss_bytes"] is not None:
+            name = declare("peak_rss_bytes", "gauge", "Peak resident set size of the last run.")
+            sample(name, report["peak_rss_bytes"])
+        name = declare("run_finished_timestamp_seconds", "gauge", "Unix time the last run finished.")
+        sample(name, round(time.time(), 3))
+
+        for field, help_text in (
+            ("wall_seconds", "Wall time spent in each pipeline stage."),
+            ("cpu_seconds", "CPU time spent in each pipeline stage."),
+            ("records", "Records processed by each pipeline stage."),
+            ("bytes", "Bytes processed by each pipeline stage."),
+        ):
+            name = declare(f"stage_{field}", "gauge", help_text)
+            for stage, values in sorted(report["stages"].items()):
+                sample(name, values[field], f'stage="{_label(stage)}"')
+
+        if report["counters"]:
+            name = declare("events", "gauge", "Event counts of the last run.")
+            for counter, value in report["counters"].items():
+                sample(name, value, f'event="{_label(counter)}"')
+
+        for hist_name, targets in report["histograms"].items():
+            name = declare(hist_name, "histogram", f"{hist_name.replace('_', ' ').capitalize()}.")
+            for target, data in targets.items():
+                target_label = f'target="{_label(target)}"'
+                for bound, count in data["buckets"].items():
+                    sample(f"{name}_bucket", count, target_label, f'le="{bound}"')
+                sample(f"{name}_sum", data["sum"], target_label)
+                sample(f"{name}_count", data["count"], target_label)
+        return "\n".join(lines) + "\n"
+
+_END = object()
+
+def timed_stage(records: Iterable[T], stage: str) -> Iterator[T]:
+    """
+    Pass records through, charging the time spent producing them to
+    ``stage`` (less any stage nested inside it) and adding their number
+    to it in the run metrics once the iterator is done.
+    """
+    metrics = get_metrics()
+    clock = metrics._clock()
+    perf_counter = time.perf_counter
+    iterator = iter(records)
+    spent = 0.0
+    count = 0
+    try:
+        while True:
+            before = clock.nested
+            start = perf_counter()
+            record = next(iterator, _END)
+            elapsed = perf_counter() - start
+            spent += elapsed - (clock.nested - before)
+            clock.nested = before + elapsed
+            if record is _END:
+                return
+            count += 1
+            yield record
+    finally:
+        metrics.add_time(stage, spent)
+        metrics.add_records(stage, count)
+
+def _rate(amount: float, seconds: float) -> Optional[float]:
+    if not amount or seconds <= 0:
+        return None
+    return round(amount / seconds, 1)
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+_metrics = Metrics()
+
+# Registry of the run in progress where several share the process (daemon
+# jobs); unset, get_metrics() falls back to the process-wide one.
+_run_metrics: "contextvars.ContextVar[Optional[Metrics]]" = contextvars.ContextVar("run_metrics", default=None)
+
+def get_metrics() -> Metrics:
+    metrics = _run_metrics.get()
+    return _metrics if metrics is None else metrics
+
+@contextlib.contextmanager
+def use_metrics(metrics: Metrics) -> Iterator[Metrics]:
+    """
+    Make get_metrics() return ``metrics`` inside the block on this thread,
+    and on worker threads running tasks wrapped with in_context() there.
+    """
+    token = _run_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _run_metrics.reset(token)
+
+def in_context(fn: Callable[..., T]) -> Callable[..., T]:
+    """
+    ``fn`` bound to a copy of the caller's context, for submitting to a
+    thread pool so the task records into the caller's run metrics.
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+def reset_metrics() -> Metrics:
+    """
+    Start a fresh registry, e.g. at the beginning of each run.
+    """
+    global _metrics
+    _metrics.stop_sampling()
+    _metrics = Metrics()
+    return _metrics
+
+def write_text_atomic(path: Path, text: str) -> None:
+    """
+    Write ``text`` to ``path`` via a temporary file and a rename, so readers
+    such as the Prometheus textfile collector never see a partial file.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
@@ -0,0 +1,295 @@
+from email.utils import parsedate_to_datetime
+from typing import Any, Deque, Dict, Optional
+from urllib.parse import urlsplit
+import collections
+import logging
+import random
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+# Status codes worth retrying; anything else in the 4xx range is permanent.
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+class HostRateLimiter:
+    """
+    Thread-safe per-host rate limiter.
+
+    Each host gets its own schedule of evenly spaced request slots so that
+    concurrent workers hitting the same backend never exceed
+    ``requests_per_second`` in aggregate. A rate of 0 (or less) disables
+    limiting entirely.
+    """
+
+    def __init__(self, requests_per_second: float = 0.0) -> None:
+        self.requests_per_second = float(requests_per_second or 0.0)
+        self._next_slot: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def interval(self) -> float:
+        if self.requests_per_second <= 0:
+            return 0.0
+        return 1.0 / self.requests_per_second
+
+    def acquire(self, url: str) -> float:
+        """
+        Block until a request to the host of ``url`` may be sent.
+
+        Returns the number of seconds spent waiting.
+        """
+        interval = self.interval
+        if interval <= 0:
+            return 0.0
+
+        host = _host_of(url)
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + interval
+
+        delay = slot - now
+        if delay > 0:
+            LOGGER.debug("Rate limiting %s for %.3fs", host, delay)
+            time.sleep(delay)
+        return delay
+
+class _Bucket:
+    __slots__ = ("rate", "tokens", "updated", "blocked_until", "last_cut", "sent")
+
+    def __init__(self, rate: Optional[float], burst: float, now: float) -> None:
+        self.rate = rate
+        self.tokens = burst
+        self.updated = now
+        self.blocked_until = 0.0
+        self.last_cut = float("-inf")
+        # Send times of recent requests, to estimate the real rate when a
+        # 429 arrives while unlimited.
+        self.sent: Deque[float] = collections.deque()
+
+class AdaptiveRateLimiter:
+    """
+    Thread-safe per-host token bucket that adapts to the backend.
+
+    Each host starts at ``requests_per_second`` (0 means unlimited) with
+    room for ``burst`` back-to-back requests. A throttling response halves
+    the host's rate (AIMD) and pauses every worker for its Retry-After;
+    each success then adds back about ``increase`` requests per second per
+    second, up to the configured rate, so throughput settles just under
+    the backend's real limit instead of oscillating around it.
+    """
+
+    DEFAULT_INCREASE = 0.5
+    SAMPLE_WINDOW = 5.0
+
+    def __init__(
+        self,
+        requests_per_second: float = 0.0,
+        burst: float = 1.0,
+        min_rate: float = 0.2,
+        increase: float = DEFAULT_INCREASE,
+    ) -> None:
+        self.max_rate = float(requests_per_second or 0.0)
+        self.burst = max(1.0, float(burst))
+        self.min_rate = max(0.01, float(min_rate))
+        self.increase = max(0.0, float(increase))
+        self._buckets: Dict[str, _Bucket] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host: str, now: float) -> _Bucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            rate = self.max_rate if self.max_rate > 0 else None
+            bucket = self._buckets[host] = _Bucket(rate, self.burst, now)
+        return bucket
+
+    def rate(self, url: str) -> Optional[float]:
+        """
+        Current request rate allowed for the host of ``url`` (None: unlimited).
+        """
+        with self._lock:
+            return self._bucket(_host_of(url), time.monotonic()).rate
+
+    def acquire(self, url: str) -> float:
+        """
+        Block until a request to the host of ``url`` may be sent.
+
+        Returns the number of seconds spent waiting.
+        """
+        host = _host_of(url)
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._bucket(host, now)
+            delay = max(0.0, bucket.blocked_until - now)
+            if bucket.rate is not None:
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * bucket.rate)
+                bucket.updated = now
+                # Taking a token we do not have yet reserves the next one.
+                bucket.tokens -= 1.0
+                if bucket.tokens < 0:
+                    delay = max(delay, -bucket.tokens / bucket.rate)
+            sent = bucket.sent
+            sent.append(now + delay)
+            while sent and sent[0] < now - self.SAMPLE_WINDOW:
+                sent.popleft()
+
+        if delay > 0:
+            LOGGER.debug("Rate limiting %s for %.3fs", host, delay)
+            time.sleep(delay)
+        return delay
+
+    def on_success(self, url: str) -> None:
+        if self.increase <= 0:
+            return
+        with self._lock:
+            bucket = self._bucket(_host_of(url), time.monotonic())
+            if bucket.rate is None:
+                return
+            # One full step per second's worth of successful requests.
+            rate = bucket.rate + self.increase / max(bucket.rate, 1.0)
+            bucket.rate = min(rate, self.max_rate) if self.max_rate > 0 else rate
+
+    def on_throttle(self, url: str, retry_after: Optional[float] = None) -> float:
+        """
+        Back off after a 429 from the host of ``url``: halve its rate and,
+        with a Retry-After, hold every request to it until then. Returns
+        the new rate.
+        """
+        host = _host_of(url)
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._bucket(host, now)
+            if retry_after:
+                bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+            # Requests already in flight when the rate was cut get throttled
+            # too; count that burst of 429s as one signal.
+            if now - bucket.last_cut < max(1.0, retry_after or 0.0):
+                return bucket.rate or self.min_rate
+            current = bucket.rate
+            if current is None:
+                window = [t for t in bucket.sent if t <= now]
+                span = now - window[0] if len(window) > 1 else 0.0
+                current = len(window) / span if span > 0 else self.min_rate * 2
+            bucket.rate = max(self.min_rate, current / 2)
+            bucket.tokens = min(bucket.tokens, 0.0)
+            bucket.updated = now
+            bucket.last_cut = now
+            LOGGER.warning(
+                "Throttled by %s; lowering request rate to %.2f/s%s.",
+                host,
+                bucket.rate,
+                f" and pausing {retry_after:.1f}s" if retry_after else "",
+            )
+            return bucket.rate
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised instead of sending a request to an endpoint whose circuit is open.
+    """
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker.
+
+    After ``failure_threshold`` consecutive failures an endpoint's circuit
+    opens and requests to it fail fast for ``reset_timeout`` seconds. Then
+    a single trial request is let through (half-open): success closes the
+    circuit, failure opens it again. A trial that never reports back is
+    given up on after another ``reset_timeout``, so a lost result cannot
+    keep the circuit open for good. A threshold of 0 disables breaking.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = max(0, int(failure_threshold))
+        self.reset_timeout = max(0.0, float(reset_timeout))
+        self._failures: Dict[str, int] = {}
+        self._opened_at: Dict[str, float] = {}
+        # When the pending half-open trial of an endpoint was let through.
+        self._trial: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key: str) -> bool:
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            opened_at = self._opened_at.get(key)
+            if opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - opened_at < self.reset_timeout:
+                return False
+            trial = self._trial.get(key)
+            if trial is not None and now - trial < self.reset_timeout:
+                return False
+            self._trial[key] = now
+            LOGGER.info("Circuit for %s half-open; sending a trial request.", key)
+            return True
+
+    def record_success(self, key: str) -> None:
+        with self._lock:
+            if self._opened_at.pop(key, None) is not None:
+                LOGGER.info("Circuit for %s closed again.", key)
+            self._failures.pop(key, None)
+            self._trial.pop(key, None)
+
+    def record_failure(self, key: str) -> None:
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            failures = self._failures.get(key, 0) + 1
+            self._failures[key] = failures
+            trial = self._trial.pop(key, None) is not None
+            if trial or (failures >= self.failure_threshold and key not in self._opened_at):
+                self._opened_at[key] = time.monotonic()
+                LOGGER.warning(
+                    "Circuit for %s opened after %d consecutive failures; "
+                    "failing fast for %.0fs.",
+                    key,
+                    failures,
+                    self.reset_timeout,
+                )
+
+    def state(self, key: str) -> str:
+        with self._lock:
+            if key not in self._opened_at:
+                return "closed"
+            return "half-open" if key in self._trial else "open"
+
+def _host_of(url: Optional[str]) -> str:
+    return (urlsplit(url or "").netloc or "").lower()
+
+def endpoint_of(url: str) -> str:
+    """
+    Circuit breaker key for ``url``: its host and path, without the query.
+    """
+    parts = urlsplit(url or "")
+    return f"{parts.netloc.lower()}{parts.path or '/'}"
+
+def parse_retry_after(value: Any) -> Optional[float]:
+    """
+    Seconds to wait according to a Retry-After header, which is either a
+    number of seconds or an HTTP date. Returns None if absent or invalid.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """
+    Exponential backoff with full jitter: a random delay between 0 and
+    ``min(cap, base * 2 ** attempt)`` seconds, so retrying clients spread
+    out instead of hammering the server in lockstep.
+    """
+    return random.uniform(0.0, min(cap, base * (2 ** max(0, attempt))))
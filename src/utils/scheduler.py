@@ -0,0 +1,240 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+@dataclass
+class ScheduledJob:
+    """
+    A recurring job: run ``payload`` every ``interval`` seconds.
+
+    Lower ``priority`` values run first when more jobs are due than there
+    are free slots. Each run is delayed by a random ``jitter`` fraction of
+    the interval so jobs with the same interval do not fire in lockstep.
+    """
+
+    name: str
+    interval: float
+    payload: Any = None
+    priority: int = 0
+    jitter: float = 0.1
+
+@dataclass
+class JobStatus:
+    state: str = "waiting"
+    next_run: Optional[float] = None
+    runs: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    last_started: Optional[float] = None
+    last_finished: Optional[float] = None
+    last_duration: Optional[float] = None
+    last_status: Optional[int] = None
+    last_error: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "next_run": _round(self.next_run),
+            "runs": self.runs,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_started": _round(self.last_started),
+            "last_finished": _round(self.last_finished),
+            "last_duration": _round(self.last_duration),
+            "last_status": self.last_status,
+            "last_error": self.last_error,
+        }
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 3)
+
+class JobScheduler:
+    """
+    Run recurring jobs on a bounded thread pool.
+
+    Jobs wait in a heap ordered by their next run time; once due they move
+    to a ready heap ordered by priority and are started while fewer than
+    ``max_concurrent`` jobs are running. A job is rescheduled when its run
+    finishes, one interval after it was due (or immediately if it overran),
+    so the same job never overlaps with itself. ``run_job(job)`` returns an
+    exit status; non-zero or an exception counts as a failure.
+    ``on_change(scheduler)`` is called after every start and finish, e.g.
+    to publish status.
+    """
+
+    def __init__(
+        self,
+        jobs: List[ScheduledJob],
+        run_job: Callable[[ScheduledJob], int],
+        max_concurrent: int = 2,
+        on_change: Optional[Callable[["JobScheduler"], None]] = None,
+        max_runs: Optional[int] = None,
+        initial_splay: Optional[float] = None,
+    ) -> None:
+        names = [job.name for job in jobs]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate job names: {duplicates}")
+        self.jobs = {job.name: job for job in jobs}
+        self.run_job = run_job
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.on_change = on_change
+        # Stop after every job ran this many times (None: run until stopped).
+        self.max_runs = max_runs
+        self.status: Dict[str, JobStatus] = {job.name: JobStatus() for job in jobs}
+        self.started_at = time.time()
+
+        self._seq = itertools.count()
+        self._waiting: List[Tuple[float, int, str]] = []
+        self._ready: List[Tuple[int, float, int, str]] = []
+        self._running = 0
+        self._cond = threading.Condition()
+        self._stopping = False
+        # First runs are spread over each job's jitter window, or over at
+        # most ``initial_splay`` seconds, so a restart does not fire every
+        # job at once.
+        for job in jobs:
+            delay = self._jitter(job)
+            if initial_splay is not None:
+                delay = min(delay, random.uniform(0.0, max(0.0, initial_splay)))
+            self._schedule(job, time.time() + delay)
+
+    def _jitter(self, job: ScheduledJob) -> float:
+        return random.uniform(0.0, max(0.0, job.jitter) * job.interval)
+
+    def _schedule(self, job: ScheduledJob, when: float) -> None:
+        status = self.status[job.name]
+        status.state = "waiting"
+        status.next_run = when
+        heapq.heappush(self._waiting, (when, next(self._seq), job.name))
+
+    def _done(self) -> bool:
+        if self.max_runs is None:
+            return False
+        return all(status.runs >= self.max_runs for status in self.status.values())
+
+    def stop(self) -> None:
+        """
+        Stop starting new runs; run() returns once running jobs finish.
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+    def run(self) -> None:
+        LOGGER.info(
+            "Scheduler started with %d job(s), up to %d at a time.",
+            len(self.jobs),
+            self.max_concurrent,
+        )
+        pool = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="job")
+        try:
+            with self._cond:
+                while not self._stopping and not self._done():
+                    now = time.time()
+                    while self._waiting and self._waiting[0][0] <= now:
+                        when, seq, name = heapq.heappop(self._waiting)
+                        self.status[name].state = "ready"
+                        heapq.heappush(self._ready, (self.jobs[name].priority, when, seq, name))
+
+                    started = False
+                    while self._ready and self._running < self.max_concurrent:
+                        _, due, _, name = heapq.heappop(self._ready)
+                        self._start(pool, self.jobs[name], due)
+                        started = True
+                    if started:
+                        self._notify()
+                        continue
+
+                    # Wake at least once a second so stop() from a signal
+                    # handler is noticed promptly.
+                    timeout = 1.0
+                    if self._waiting and self._running < self.max_concurrent:
+                        timeout = min(timeout, max(0.0, self._waiting[0][0] - time.time()))
+                    self._cond.wait(timeout)
+
+                while self._running:
+                    self._cond.wait(1.0)
+        finally:
+            pool.shutdown(wait=True)
+        LOGGER.info("Scheduler stopped.")
+
+    def _start(self, pool: ThreadPoolExecutor, job: ScheduledJob, due: float) -> None:
+        status = self.status[job.name]
+        status.state = "running"
+        status.next_run = None
+        status.last_started = time.time()
+        self._running += 1
+        LOGGER.info("Starting job %s (%.1fs late).", job.name, max(0.0, status.last_started - due))
+        future = pool.submit(self.run_job, job)
+        future.add_done_callback(lambda f, job=job, due=due: self._finish(job, due, f))
+
+    def _finish(self, job: ScheduledJob, due: float, future: "Future[int]") -> None:
+        with self._cond:
+            status = self.status[job.name]
+            now = time.time()
+            status.runs += 1
+            status.last_finished = now
+            status.last_duration = now - (status.last_started or now)
+            error = future.exception()
+            status.last_status = 1 if error is not None else future.result()
+            status.last_error = f"{type(error).__name__}: {error}" if error is not None else None
+            if status.last_status:
+                status.failures += 1
+                status.consecutive_failures += 1
+            else:
+                status.consecutive_failures = 0
+            level = logging.INFO if not status.last_status else logging.WARNING
+            LOGGER.log(
+                level,
+                "Job %s %s in %.2fs.",
+                job.name,
+                "failed" if status.last_status else "finished",
+                status.last_duration,
+            )
+            if error is not None:
+                LOGGER.error("Job %s raised: %s", job.name, error, exc_info=error)
+
+            self._running -= 1
+            if self.max_runs is not None and status.runs >= self.max_runs:
+                status.state = "done"
+            else:
+                self._schedule(job, max(now, due + job.interval) + self._jitter(job))
+            self._cond.notify_all()
+        self._notify()
+
+    def _notify(self) -> None:
+        if self.on_change is None:
+            return
+        try:
+            self.on_change(self)
+        except Exception as err:
+            LOGGER.warning("Scheduler status callback failed: %s", err)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        JSON-serializable status of the scheduler and every job.
+        """
+        with self._cond:
+            jobs = {}
+            for name, job in self.jobs.items():
+                jobs[name] = dict(
+                    self.status[name].as_dict(),
+                    interval=job.interval,
+                    priority=job.priority,
+                )
+            return {
+                "started_at": round(self.started_at, 3),
+                "updated_at": round(time.time(), 3),
+                "running": self._running,
+                "max_concurrent": self.max_concurrent,
+                "jobs": jobs,
+            }
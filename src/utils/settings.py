@@ -0,0 +1,127 @@
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import hashlib
+import logging
+import os
+
+import utils.validators
+from utils.helpers import json_dumps, json_loads, load_json_file
+from utils.metrics import write_text_atomic
+from utils.validators import validate_settings
+
+LOGGER = logging.getLogger(__name__)
+
+def config_file(config_path: Optional[str], project_root: Path) -> Path:
+    if config_path is None:
+        return project_root / "src" / "config" / "settings.example.json"
+    return Path(config_path)
+
+def settings_cache_dir() -> Path:
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "fb-ads-library-scraper" / "settings"
+
+def read_raw_settings(config_path: Optional[str], project_root: Path) -> Dict[str, Any]:
+    config_path = config_file(config_path, project_root)
+    try:
+        raw = load_json_file(config_path)
+        LOGGER.info("Loaded settings from %s", config_path)
+    except FileNotFoundError:
+        LOGGER.warning(
+            "Settings file %s not found; falling back to internal defaults.", config_path
+        )
+        raw = {}
+    return raw
+
+def finalize_settings(raw: Dict[str, Any], project_root: Path) -> Dict[str, Any]:
+    """
+    Validate raw settings and resolve their paths against the project root.
+    """
+    settings = validate_settings(raw)
+
+    # Resolve file system paths relative to project root
+    def resolve_path(p: str) -> str:
+        path = Path(p)
+        if not path.is_absolute():
+            path = project_root / path
+        return str(path)
+
+    settings["output_path"] = resolve_path(settings["output_path"])
+    settings["offline_input_path"] = resolve_path(settings["offline_input_path"])
+    settings["media_download_dir"] = resolve_path(settings["media_download_dir"])
+    settings["http_cache_dir"] = resolve_path(settings["http_cache_dir"])
+    settings["state_path"] = resolve_path(settings["state_path"])
+    settings["field_mapping_path"] = resolve_path(settings["field_mapping_path"])
+    settings["queue_path"] = resolve_path(settings["queue_path"])
+    settings["archive_path"] = resolve_path(settings["archive_path"])
+    for key in ("metrics_report", "prometheus_textfile", "checkpoint_path", "dedup_path"):
+        if settings[key]:
+            settings[key] = resolve_path(settings[key])
+
+    return settings
+
+class _WarningCounter(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__(logging.WARNING)
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.count += 1
+
+def _cache_key(path: Path, project_root: Path) -> Optional[List[Any]]:
+    """
+    What cached settings for ``path`` depend on: the file itself, the
+    project root paths are resolved against and the validation code. None
+    if the file does not exist.
+    """
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    code = [Path(source).stat().st_mtime_ns for source in (utils.validators.__file__, __file__)]
+    return [str(path.resolve()), stat.st_size, stat.st_mtime_ns, str(project_root), code]
+
+def load_settings(
+    config_path: Optional[str],
+    project_root: Path,
+    use_cache: bool = False,
+) -> Dict[str, Any]:
+    """
+    Read, validate and resolve the settings in ``config_path``. With
+    ``use_cache`` the result is kept in the user's cache directory and
+    reused until the file (or the validation code) changes, so many short
+    runs over one config validate it once. Settings that log warnings when
+    validated are never cached, so the warnings are not lost.
+    """
+    path = config_file(config_path, project_root)
+    key = _cache_key(path, project_root) if use_cache else None
+    if key is None:
+        return finalize_settings(read_raw_settings(config_path, project_root), project_root)
+
+    cache_path = settings_cache_dir() / f"{hashlib.sha1(key[0].encode('utf-8')).hexdigest()}.json"
+    try:
+        cached = json_loads(cache_path.read_bytes())
+        if cached["key"] == key:
+            LOGGER.info("Loaded settings from %s (validated copy %s)", path, cache_path)
+            return cached["settings"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    counter = _WarningCounter()
+    utils.validators.LOGGER.addHandler(counter)
+    try:
+        settings = finalize_settings(read_raw_settings(config_path, project_root), project_root)
+    finally:
+        utils.validators.LOGGER.removeHandler(counter)
+    if not counter.count:
+        try:
+            write_text_atomic(cache_path, json_dumps({"key": key, "settings": settings}).decode("utf-8"))
+        except OSError as err:
+            LOGGER.debug("Could not cache settings in %s: %s", cache_path, err)
+    return settings
+
+def job_path(path: str, name: str) -> str:
+    # data/output.json -> data/output.<job>.json; directories get a suffix.
+    path_obj = Path(path)
+    if not path_obj.suffix:
+        return str(path_obj.with_name(f"{path_obj.name}.{name}"))
+    return str(path_obj.with_name(f"{path_obj.stem}.{name}{path_obj.suffix}"))
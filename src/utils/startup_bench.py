@@ -0,0 +1,101 @@
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import logging
+import subprocess
+import sys
+import time
+
+from utils.settings import load_settings
+
+LOGGER = logging.getLogger(__name__)
+
+class ImportTiming(NamedTuple):
+    module: str
+    depth: int
+    self_us: int
+    cumulative_us: int
+
+def parse_importtime(stderr: str) -> List[ImportTiming]:
+    """
+    Parse the ``import time: self | cumulative | module`` lines that
+    ``python -X importtime`` writes to stderr, skipping anything else (such
+    as log output) and the header line.
+    """
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        module = name.lstrip(" ")
+        depth = (len(name) - len(module) - 1) // 2
+        timings.append(ImportTiming(module, depth, int(fields[0]), int(fields[1])))
+    return timings
+
+def _run_importtime(args: List[str]) -> Tuple[float, "subprocess.CompletedProcess[str]"]:
+    started = time.perf_counter()
+    child = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    return time.perf_counter() - started, child
+
+def _settings_seconds(config_path: Optional[str], project_root: Path, use_cache: bool, runs: int = 20) -> float:
+    # Keep the "Loaded settings" line of every run out of the report.
+    logging.disable(logging.INFO)
+    try:
+        started = time.perf_counter()
+        for _ in range(runs):
+            load_settings(config_path, project_root, use_cache=use_cache)
+        return (time.perf_counter() - started) / runs
+    finally:
+        logging.disable(logging.NOTSET)
+
+def bench_startup(
+    script: Path,
+    argv: List[str],
+    project_root: Path,
+    config_path: Optional[str] = None,
+    top: int = 25,
+) -> int:
+    """
+    Run ``script`` with ``argv`` in a child interpreter under ``-X
+    importtime`` and log how long it took next to a bare interpreter, how
+    much went to the imports of the run itself, the modules with the most
+    cumulative import time, and how long loading the settings takes with
+    and without the validated-settings cache. Returns the child's status.
+    """
+    baseline, bare = _run_importtime(["-c", "pass"])
+    interpreter = {timing.module for timing in parse_importtime(bare.stderr)}
+    wall, child = _run_importtime([str(script), *argv])
+    if child.returncode:
+        LOGGER.error("%s exited with status %d:\n%s", script.name, child.returncode, child.stderr[-2000:])
+
+    timings = [t for t in parse_importtime(child.stderr) if t.module not in interpreter]
+    own = sum(t.cumulative_us for t in timings if t.depth == 0)
+    first_seen: Dict[str, ImportTiming] = {}
+    for timing in timings:
+        first_seen.setdefault(timing.module, timing)
+    rows = sorted(first_seen.values(), key=lambda t: t.cumulative_us, reverse=True)[:top]
+
+    validated = _settings_seconds(config_path, project_root, use_cache=False)
+    cached = _settings_seconds(config_path, project_root, use_cache=True)
+    lines = [
+        f"{wall * 1000:8.1f} ms for {' '.join([script.name, *argv])} "
+        f"(bare interpreter: {baseline * 1000:.1f} ms; both under -X importtime)",
+        f"{own / 1000:8.1f} ms importing {len(timings)} modules beyond the interpreter's own",
+        f"{validated * 1000:8.2f} ms loading settings ({cached * 1000:.2f} ms from the validated cache)",
+        "",
+        " cumulative ms    self ms  module",
+    ]
+    for timing in rows:
+        lines.append(
+            f"{timing.cumulative_us / 1000:14.1f} {timing.self_us / 1000:10.1f}  "
+            f"{'  ' * timing.depth}{timing.module}"
+        )
+    LOGGER.info("Startup report:\n%s", "\n".join(lines))
+    return child.returncode
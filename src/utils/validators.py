@@ -1,4 +1,5 @@
-thonfrom typing import Any, Dict, List
+from typing import Any, Dict, List
+import datetime
 import logging
 
 LOGGER = logging.getLogger(__name__)
@@ -10,6 +11,52 @@ def _ensure_list_of_strings(value: Any, default: List[str]) -> List[str]:
         return [str(v) for v in value]
     return [str(value)]
 
+OUTPUT_FORMATS = ("json", "ndjson", "parquet", "arrow")
+PARTITION_KEYS = ("country", "search_term", "date")
+DEDUP_INDEXES = ("off", "memory", "disk", "bloom")
+
+def infer_output_format(path: str) -> str:
+    """
+    Pick the output format from the file extension: ``ndjson`` for
+    .ndjson/.jsonl, ``parquet`` for .parquet, ``arrow`` for .arrow/.arrows
+    and ``json`` for anything else.
+    """
+    suffix = str(path).lower()
+    if suffix.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    if suffix.endswith(".parquet"):
+        return "parquet"
+    if suffix.endswith((".arrow", ".arrows")):
+        return "arrow"
+    return "json"
+
+def _positive_int(value: Any, default: int, name: str) -> int:
+    if value is None:
+        return default
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        LOGGER.warning("Invalid %s in settings; falling back to %d.", name, default)
+        return default
+
+def _non_negative_float(value: Any, default: float, name: str) -> float:
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        LOGGER.warning("Invalid %s in settings; falling back to %s.", name, default)
+        return default
+
+def _iso_date(value: Any, name: str) -> str:
+    if not value:
+        return ""
+    try:
+        return datetime.date.fromisoformat(str(value)).isoformat()
+    except ValueError:
+        LOGGER.warning("Invalid %s %r in settings (expected YYYY-MM-DD); ignoring it.", name, value)
+        return ""
+
 def validate_settings(raw: Dict[str, Any]) -> Dict[str, Any]:
     """
     Validate and normalize settings loaded from JSON.
@@ -37,6 +84,92 @@ def validate_settings(raw: Dict[str, Any]) -> Dict[str, Any]:
     output_path = raw.get("output_path") or raw.get("output") or "data/output.sample.json"
     settings["output_path"] = str(output_path)
 
+    output_format = str(raw.get("output_format") or infer_output_format(settings["output_path"]))
+    if output_format not in OUTPUT_FORMATS:
+        LOGGER.warning("Unknown output_format %r; falling back to json.", output_format)
+        output_format = "json"
+    settings["output_format"] = output_format
+
+    # Hold batch-mode ads as compact AdRecords instead of nested dicts
+    settings["compact_records"] = bool(raw.get("compact_records", True))
+
+    # JSON codec: "auto" picks orjson, then msgspec, then stdlib json
+    json_backend = str(raw.get("json_backend") or "auto")
+    if json_backend not in ("auto", "orjson", "msgspec", "json"):
+        LOGGER.warning("Unknown json_backend %r; falling back to auto.", json_backend)
+        json_backend = "auto"
+    settings["json_backend"] = json_backend
+    # Write the json output format without indentation
+    settings["compact_output"] = bool(raw.get("compact_output", False))
+
+    # Columnar (Parquet/Arrow) output: row group size and optional partitioning
+    settings["row_group_size"] = _positive_int(
+        raw.get("row_group_size"), default=50000, name="row_group_size"
+    )
+    settings["columnar_compression"] = str(raw.get("columnar_compression") or "zstd")
+    partition_by = _ensure_list_of_strings(raw.get("partition_by"), default=[])
+    unknown = [key for key in partition_by if key not in PARTITION_KEYS]
+    if unknown:
+        LOGGER.warning("Ignoring unknown partition_by keys %s; expected any of %s.", unknown, PARTITION_KEYS)
+    settings["partition_by"] = [key for key in partition_by if key in PARTITION_KEYS]
+
+    # Streaming mode writes records as they are normalized
+    settings["stream"] = bool(raw.get("stream", False))
+    settings["flush_every"] = _positive_int(
+        raw.get("flush_every"), default=500, name="flush_every"
+    )
+
+    # Declarative field mapping compiled into per-backend fast paths
+    settings["field_mapping"] = bool(raw.get("field_mapping", True))
+    settings["field_mapping_path"] = str(
+        raw.get("field_mapping_path", "src/config/field_mapping.json")
+    )
+
+    # Parallel normalization in a process pool (1 keeps it in-process)
+    settings["normalize_workers"] = _positive_int(
+        raw.get("normalize_workers"), default=1, name="normalize_workers"
+    )
+    settings["normalize_chunk_size"] = _positive_int(
+        raw.get("normalize_chunk_size"), default=1000, name="normalize_chunk_size"
+    )
+
+    # Incremental mode: emit only the delta against a local state store
+    settings["incremental"] = bool(raw.get("incremental", False))
+    settings["state_path"] = str(raw.get("state_path", "data/state.sqlite3"))
+
+    # Checkpoints for resuming interrupted streaming runs (empty path: next
+    # to the output; interval 0 disables them)
+    settings["checkpoint_interval"] = _non_negative_float(
+        raw.get("checkpoint_interval"), default=5.0, name="checkpoint_interval"
+    )
+    settings["checkpoint_path"] = str(raw.get("checkpoint_path") or "")
+    settings["resume"] = bool(raw.get("resume", False))
+
+    # Drop repeated copies of an ad (by ad_archive_id) before normalization:
+    # an exact in-memory set, a scratch SQLite file (empty path: next to the
+    # output) or a Bloom filter sized for dedup_capacity ids
+    dedup = str(raw.get("dedup") or "memory")
+    if dedup not in DEDUP_INDEXES:
+        LOGGER.warning("Unknown dedup index %r; falling back to memory.", dedup)
+        dedup = "memory"
+    settings["dedup"] = dedup
+    settings["dedup_path"] = str(raw.get("dedup_path") or "")
+    settings["dedup_capacity"] = _positive_int(
+        raw.get("dedup_capacity"), default=10_000_000, name="dedup_capacity"
+    )
+    dedup_error_rate = _non_negative_float(
+        raw.get("dedup_error_rate"), default=1e-7, name="dedup_error_rate"
+    )
+    if not 0 < dedup_error_rate < 1:
+        LOGGER.warning("dedup_error_rate must be between 0 and 1; falling back to 1e-07.")
+        dedup_error_rate = 1e-7
+    settings["dedup_error_rate"] = dedup_error_rate
+
+    # Searchable SQLite archive every run's ads are added to (see the query
+    # subcommand)
+    settings["archive"] = bool(raw.get("archive", False))
+    settings["archive_path"] = str(raw.get("archive_path", "data/archive.sqlite3"))
+
     # Offline input file with raw data
     offline_input_path = raw.get("offline_input_path") or raw.get("input") or "data/input.sample.json"
     settings["offline_input_path"] = str(offline_input_path)
@@ -47,6 +180,37 @@ def validate_settings(raw: Dict[str, Any]) -> Dict[str, Any]:
         raw.get("media_download_dir", "data/media")
     )
 
+    settings["media_workers"] = _positive_int(
+        raw.get("media_workers"), default=8, name="media_workers"
+    )
+    settings["media_requests_per_second"] = _non_negative_float(
+        raw.get("media_requests_per_second"), default=0.0, name="media_requests_per_second"
+    )
+    settings["media_revalidate_after"] = _non_negative_float(
+        raw.get("media_revalidate_after"), default=0.0, name="media_revalidate_after"
+    )
+    try:
+        settings["media_retries"] = max(0, int(raw.get("media_retries", 3)))
+    except (TypeError, ValueError):
+        LOGGER.warning("Invalid media_retries in settings; falling back to 3.")
+        settings["media_retries"] = 3
+
+    # Perceptual hashing of downloaded images into clusters of near-identical
+    # creatives (needs Pillow). Images whose 64-bit dHashes differ in at most
+    # creative_hash_distance bits share a cluster; creative_hash_workers
+    # processes decode them (0 = one per CPU).
+    settings["cluster_creatives"] = bool(raw.get("cluster_creatives", False))
+    try:
+        settings["creative_hash_distance"] = min(16, max(0, int(raw.get("creative_hash_distance", 4))))
+    except (TypeError, ValueError):
+        LOGGER.warning("Invalid creative_hash_distance in settings; falling back to 4.")
+        settings["creative_hash_distance"] = 4
+    try:
+        settings["creative_hash_workers"] = max(0, int(raw.get("creative_hash_workers", 0)))
+    except (TypeError, ValueError):
+        LOGGER.warning("Invalid creative_hash_workers in settings; falling back to 0.")
+        settings["creative_hash_workers"] = 0
+
     # Live scraping mode
     settings["live_mode"] = bool(raw.get("live_mode", False))
 
@@ -58,5 +222,168 @@ def validate_settings(raw: Dict[str, Any]) -> Dict[str, Any]:
             "Live scraping will fail until api_url is set."
         )
 
+    # Live fan-out: concurrent queries and per-host request rate
+    settings["max_concurrency"] = _positive_int(
+        raw.get("max_concurrency"), default=8, name="max_concurrency"
+    )
+    settings["requests_per_second"] = _non_negative_float(
+        raw.get("requests_per_second"), default=5.0, name="requests_per_second"
+    )
+    settings["page_size"] = _positive_int(
+        raw.get("page_size"), default=100, name="page_size"
+    )
+    settings["http_timeout"] = _positive_int(
+        raw.get("http_timeout"), default=15, name="http_timeout"
+    )
+
+    # Optional delivery date range (YYYY-MM-DD) sent with live queries
+    settings["date_min"] = _iso_date(raw.get("date_min"), name="date_min")
+    settings["date_max"] = _iso_date(raw.get("date_max"), name="date_max")
+    if settings["date_min"] and settings["date_max"] and settings["date_min"] > settings["date_max"]:
+        LOGGER.warning("date_min is after date_max; ignoring the date range.")
+        settings["date_min"] = settings["date_max"] = ""
+
+    # Adaptive date windows: split a query whose window returns
+    # window_result_cap results (0 = max_items) into shorter windows, down to
+    # min_window_days, then into split_countries if it covered all countries
+    settings["adaptive_windows"] = bool(raw.get("adaptive_windows", False))
+    try:
+        settings["window_result_cap"] = max(0, int(raw.get("window_result_cap", 0)))
+    except (TypeError, ValueError):
+        LOGGER.warning("Invalid window_result_cap in settings; falling back to 0.")
+        settings["window_result_cap"] = 0
+    settings["min_window_days"] = _positive_int(
+        raw.get("min_window_days"), default=1, name="min_window_days"
+    )
+    settings["split_countries"] = _ensure_list_of_strings(raw.get("split_countries"), default=[])
+    if settings["adaptive_windows"] and not settings["date_min"]:
+        LOGGER.warning("adaptive_windows needs date_min to split windows; queries will not be split.")
+
+    # Distributed mode: shard queue shared by coordinator and workers
+    settings["queue_path"] = str(raw.get("queue_path", "data/queue.sqlite3"))
+    try:
+        settings["shard_window_days"] = max(0, int(raw.get("shard_window_days", 0)))
+    except (TypeError, ValueError):
+        LOGGER.warning("Invalid shard_window_days in settings; falling back to 0.")
+        settings["shard_window_days"] = 0
+    settings["lease_seconds"] = _positive_int(
+        raw.get("lease_seconds"), default=300, name="lease_seconds"
+    )
+    settings["shard_max_attempts"] = _positive_int(
+        raw.get("shard_max_attempts"), default=3, name="shard_max_attempts"
+    )
+
+    # Retries with backoff, adaptive rate limiting and circuit breaking
+    try:
+        settings["http_retries"] = max(0, int(raw.get("http_retries", 3)))
+    except (TypeError, ValueError):
+        LOGGER.warning("Invalid http_retries in settings; falling back to 3.")
+        settings["http_retries"] = 3
+    settings["retry_backoff_base"] = _non_negative_float(
+        raw.get("retry_backoff_base"), default=0.5, name="retry_backoff_base"
+    )
+    settings["retry_backoff_cap"] = _non_negative_float(
+        raw.get("retry_backoff_cap"), default=30.0, name="retry_backoff_cap"
+    )
+    settings["adaptive_rate_limit"] = bool(raw.get("adaptive_rate_limit", True))
+    settings["rate_limit_burst"] = _non_negative_float(
+        raw.get("rate_limit_burst"), default=1.0, name="rate_limit_burst"
+    )
+    try:
+        settings["circuit_breaker_threshold"] = max(0, int(raw.get("circuit_breaker_threshold", 5)))
+    except (TypeError, ValueError):
+        LOGGER.warning("Invalid circuit_breaker_threshold in settings; falling back to 5.")
+        settings["circuit_breaker_threshold"] = 5
+    settings["circuit_breaker_reset"] = _non_negative_float(
+        raw.get("circuit_breaker_reset"), default=30.0, name="circuit_breaker_reset"
+    )
+
+    # On-disk cache of live API responses (relative dir resolved in main.py)
+    settings["http_cache"] = bool(raw.get("http_cache", False))
+    settings["http_cache_dir"] = str(raw.get("http_cache_dir", ".cache/http"))
+    settings["http_cache_ttl"] = _non_negative_float(
+        raw.get("http_cache_ttl"), default=3600.0, name="http_cache_ttl"
+    )
+    settings["http_cache_max_mb"] = _non_negative_float(
+        raw.get("http_cache_max_mb"), default=256.0, name="http_cache_max_mb"
+    )
+
+    # Run instrumentation: JSON run report and Prometheus textfile (empty disables)
+    settings["metrics_report"] = str(raw.get("metrics_report") or "")
+    settings["prometheus_textfile"] = str(raw.get("prometheus_textfile") or "")
+    # Per-stage time sampling is a profiling aid with a cost of its own (a
+    # signal every interval); 0 leaves it off.
+    settings["metrics_sample_interval"] = _non_negative_float(
+        raw.get("metrics_sample_interval"), default=0.0, name="metrics_sample_interval"
+    )
+
     LOGGER.debug("Validated settings: %s", settings)
-    return settings
\ No newline at end of file
+    return settings
+
+# Keys of a daemon job entry that configure scheduling rather than settings.
+JOB_SCHEDULE_KEYS = ("name", "interval_seconds", "priority", "jitter", "search_term", "country")
+
+def validate_jobs(raw: Any) -> Dict[str, Any]:
+    """
+    Validate a daemon jobs file.
+
+    The file is an object with a ``jobs`` list and optional ``defaults``
+    (settings overrides shared by every job), ``max_concurrent_jobs`` and
+    ``status_path``. Each job needs a unique ``name`` and may set
+    ``interval_seconds``, ``priority``, ``jitter``, a ``search_term`` /
+    ``country`` shorthand and any settings key to override. Invalid jobs
+    are dropped with a warning.
+    """
+    if isinstance(raw, list):
+        raw = {"jobs": raw}
+    if not isinstance(raw, dict) or not isinstance(raw.get("jobs"), list):
+        raise ValueError("Jobs file must be a list of jobs or an object with a 'jobs' list.")
+
+    defaults = raw.get("defaults") or {}
+    if not isinstance(defaults, dict):
+        LOGGER.warning("Ignoring non-object 'defaults' in jobs file.")
+        defaults = {}
+
+    jobs: List[Dict[str, Any]] = []
+    seen = set()
+    for index, entry in enumerate(raw["jobs"]):
+        if not isinstance(entry, dict):
+            LOGGER.warning("Ignoring job #%d: expected an object.", index)
+            continue
+        name = str(entry.get("name") or "").strip()
+        if not name or name in seen:
+            LOGGER.warning("Ignoring job #%d: missing or duplicate name %r.", index, name)
+            continue
+        seen.add(name)
+
+        overrides = {k: v for k, v in entry.items() if k not in JOB_SCHEDULE_KEYS}
+        if entry.get("search_term") is not None:
+            overrides["search_terms"] = [str(entry["search_term"])]
+        if entry.get("country") is not None:
+            overrides["countries"] = [str(entry["country"])]
+        try:
+            priority = int(entry.get("priority", 0))
+        except (TypeError, ValueError):
+            LOGGER.warning("Invalid priority for job %s; falling back to 0.", name)
+            priority = 0
+        interval = _non_negative_float(
+            entry.get("interval_seconds"), default=3600.0, name=f"interval_seconds of job {name}"
+        )
+        jitter = _non_negative_float(entry.get("jitter"), default=0.1, name=f"jitter of job {name}")
+        jobs.append(
+            {
+                "name": name,
+                "interval_seconds": max(1.0, interval),
+                "priority": priority,
+                "jitter": min(1.0, jitter),
+                "settings": dict(defaults, **overrides),
+            }
+        )
+
+    return {
+        "jobs": jobs,
+        "max_concurrent_jobs": _positive_int(
+            raw.get("max_concurrent_jobs"), default=2, name="max_concurrent_jobs"
+        ),
+        "status_path": str(raw.get("status_path") or "data/daemon_status.json"),
+    }
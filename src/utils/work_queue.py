@@ -0,0 +1,262 @@
+from pathlib import Path
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    shard_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    enqueued_at REAL NOT NULL,
+    finished_at REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS shards_state ON shards (state, lease_expires);
+"""
+
+STATES = ("pending", "leased", "done", "failed")
+
+class Shard(NamedTuple):
+    """
+    One leased unit of work: its queue id, unique key and JSON payload.
+    ``attempts`` counts this lease.
+    """
+
+    shard_id: int
+    key: str
+    payload: Dict[str, Any]
+    attempts: int
+
+class WorkQueue:
+    """
+    Durable SQLite queue of shards shared by any number of worker processes.
+
+    Workers lease() a shard for ``lease_seconds``, extend() the lease while
+    they work on it and complete() or fail() it when done. A worker that
+    crashes simply stops extending its lease; once the lease expires the
+    shard is handed to the next worker. Leasing is a short write
+    transaction, so workers on one machine (or on a shared filesystem with
+    working locks) scale out without a separate queue service. Completion
+    is at-least-once: a shard whose lease expired mid-run may be run again
+    by another worker, so shard outputs should be idempotent.
+    """
+
+    def __init__(self, path: Path, max_attempts: int = 3) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max(1, int(max_attempts))
+        self._local = threading.local()
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, shards: Iterable[Dict[str, Any]]) -> int:
+        """
+        Add shards, each a dict with a unique ``key`` and a JSON-serializable
+        ``payload``. Keys already in the queue are skipped, so planning the
+        same query space twice is harmless. Returns the number added.
+        """
+        conn = self._connect()
+        now = time.time()
+        added = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for shard in shards:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO shards (key, payload, enqueued_at) VALUES (?, ?, ?)",
+                    (str(shard["key"]), json.dumps(shard["payload"], sort_keys=True), now),
+                )
+                added += cursor.rowcount
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def lease(self, owner: str, lease_seconds: float = 300.0) -> Optional[Shard]:
+        """
+        Take the oldest pending shard, or one whose lease has expired, for
+        ``lease_seconds``. An expired shard that already had ``max_attempts``
+        leases is marked failed instead, so a shard that keeps killing its
+        workers is given up on. Returns None when nothing is available right
+        now.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                row = conn.execute(
+                    "SELECT shard_id, key, payload, attempts, state FROM shards "
+                    "WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) "
+                    "ORDER BY shard_id LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None or row[4] == "pending" or row[3] < self.max_attempts:
+                    break
+                LOGGER.error("Lease on shard %s expired %d times; giving up.", row[1], row[3])
+                conn.execute(
+                    "UPDATE shards SET state = 'failed', lease_owner = NULL, lease_expires = NULL, "
+                    "finished_at = ?, error = ? WHERE shard_id = ?",
+                    (now, f"lease expired after {row[3]} attempts", row[0]),
+                )
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            shard_id, key, payload, attempts, state = row
+            if state == "leased":
+                LOGGER.warning("Lease on shard %s expired; re-leasing it.", key)
+            conn.execute(
+                "UPDATE shards SET state = 'leased', attempts = attempts + 1, "
+                "lease_owner = ?, lease_expires = ? WHERE shard_id = ?",
+                (owner, now + lease_seconds, shard_id),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return Shard(shard_id, key, json.loads(payload), attempts + 1)
+
+    def _update_owned(self, shard: Shard, owner: str, sql: str, params: tuple) -> bool:
+        cursor = self._connect().execute(
+            sql + " WHERE shard_id = ? AND state = 'leased' AND lease_owner = ?",
+            params + (shard.shard_id, owner),
+        )
+        return cursor.rowcount == 1
+
+    def extend(self, shard: Shard, owner: str, lease_seconds: float = 300.0) -> bool:
+        """
+        Renew ``owner``'s lease on ``shard``. Returns False if the lease was
+        lost (it expired and another worker took the shard).
+        """
+        return self._update_owned(
+            shard, owner, "UPDATE shards SET lease_expires = ?", (time.time() + lease_seconds,)
+        )
+
+    def hold(self, shard: Shard, owner: str, lease_seconds: float = 300.0) -> "LeaseKeeper":
+        """
+        Context manager that keeps extending the lease on ``shard`` in the
+        background until the block exits.
+        """
+        return LeaseKeeper(self, shard, owner, lease_seconds)
+
+    def complete(self, shard: Shard, owner: str, result: Optional[Dict[str, Any]] = None) -> bool:
+        done = self._update_owned(
+            shard,
+            owner,
+            "UPDATE shards SET state = 'done', lease_owner = NULL, lease_expires = NULL, "
+            "finished_at = ?, result = ?, error = NULL",
+            (time.time(), json.dumps(result or {}, sort_keys=True)),
+        )
+        if not done:
+            LOGGER.warning("Lost the lease on shard %s before completing it.", shard.key)
+        return done
+
+    def fail(self, shard: Shard, owner: str, error: str) -> bool:
+        """
+        Release a shard that failed: back to pending for another attempt,
+        or ``failed`` for good after ``max_attempts`` leases.
+        """
+        state = "failed" if shard.attempts >= self.max_attempts else "pending"
+        released = self._update_owned(
+            shard,
+            owner,
+            "UPDATE shards SET state = ?, lease_owner = NULL, lease_expires = NULL, "
+            "finished_at = ?, error = ?",
+            (state, time.time() if state == "failed" else None, error),
+        )
+        if released and state == "failed":
+            LOGGER.error("Shard %s failed %d times; giving up: %s", shard.key, shard.attempts, error)
+        return released
+
+    def retry_failed(self) -> int:
+        """
+        Put every failed shard back to pending with a fresh attempt count.
+        """
+        cursor = self._connect().execute(
+            "UPDATE shards SET state = 'pending', attempts = 0, finished_at = NULL "
+            "WHERE state = 'failed'"
+        )
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        counts = dict.fromkeys(STATES, 0)
+        rows = self._connect().execute("SELECT state, COUNT(*) FROM shards GROUP BY state")
+        for state, count in rows:
+            counts[state] = count
+        return counts
+
+    def outstanding(self) -> int:
+        """
+        Shards not finished yet, whether pending or leased by someone.
+        """
+        counts = self.counts()
+        return counts["pending"] + counts["leased"]
+
+    def summary(self) -> str:
+        counts = self.counts()
+        return ", ".join(f"{counts[state]} {state}" for state in STATES)
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+class LeaseKeeper:
+    """
+    Renew a shard lease every third of ``lease_seconds`` on a background
+    thread, so a long-running shard keeps its lease while a crashed worker
+    loses it within one lease period. ``lost`` is set if renewal failed.
+    """
+
+    def __init__(self, queue: WorkQueue, shard: Shard, owner: str, lease_seconds: float) -> None:
+        self.queue = queue
+        self.shard = shard
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-keeper", daemon=True)
+
+    def _run(self) -> None:
+        try:
+            while not self._stop.wait(self.lease_seconds / 3):
+                try:
+                    renewed = self.queue.extend(self.shard, self.owner, self.lease_seconds)
+                except sqlite3.Error as err:
+                    LOGGER.warning("Could not renew lease on shard %s: %s", self.shard.key, err)
+                    continue
+                if not renewed:
+                    LOGGER.warning("Lease on shard %s was taken over by another worker.", self.shard.key)
+                    self.lost = True
+                    return
+        finally:
+            # Connections are per thread; drop this thread's.
+            self.queue.close()
+
+    def __enter__(self) -> "LeaseKeeper":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._stop.set()
+        self._thread.join()
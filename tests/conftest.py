@@ -0,0 +1,8 @@
+from pathlib import Path
+import sys
+
+# Modules import each other as ``utils.*`` / ``extractors.*``, the way
+# ``python src/main.py`` sees them.
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
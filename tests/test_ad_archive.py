@@ -0,0 +1,22 @@
+import collections
+
+import pytest
+
+from extractors.ad_archive import AdArchive, ArchiveQuery
+from main import parse_args
+
+ADS = [{"ad_archive_id": str(n), "start_date": f"2024-01-0{n + 1}"} for n in range(4)]
+
+def test_offset_applies_without_a_limit(tmp_path):
+    archive = AdArchive(tmp_path / "archive.sqlite3")
+    try:
+        collections.deque(archive.ingest(ADS), maxlen=0)
+        ids = [ad["ad_archive_id"] for ad in archive.search(ArchiveQuery(), limit=None, offset=1)]
+    finally:
+        archive.close()
+    assert ids == ["2", "1", "0"]
+
+def test_query_rejects_malformed_dates():
+    assert parse_args(["query", "--start-after", "2024-01-05"]).start_after == "2024-01-05"
+    with pytest.raises(SystemExit):
+        parse_args(["query", "--end-before", "2024-13-01"])
@@ -0,0 +1,90 @@
+from datetime import datetime, timezone
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+from extractors.ad_columns import ad_columns, epoch_seconds, filter_ads, summarize, value_counts
+from extractors.ad_parser import normalize_ad_record
+from extractors.ad_record import compact_ad
+from utils.columnar import to_row
+
+RAW_ADS = [
+    {
+        "ad_archive_id": "1",
+        "page_id": "p1",
+        "page_name": "Salon",
+        "publisher_platform": ["facebook", "instagram"],
+        "page_like_count": 120,
+        "start_date": 1730246400,
+        "end_date": "2024-11-05T10:00:00+0000",
+        "categories": ["UNKNOWN"],
+    },
+    {
+        "id": "2",
+        "page": {"id": "p2", "name": "Barber", "like_count": 7},
+        "publisher_platforms": "instagram",
+        "ad_delivery_start_time": "2024-11-02",
+        "ad_delivery_stop_time": 1731024000000,
+    },
+    {
+        "ad_archive_id": "3",
+        "page_id": "p1",
+        "page_name": "Salon",
+        "placement": {"platforms": ["messenger"]},
+        "page_like_count": "n/a",
+        "start_date": "2024-11-10T00:00:00Z",
+        "categories": "POLITICAL",
+    },
+]
+
+def test_epoch_seconds_accepts_every_timestamp_form():
+    day = int(datetime(2024, 10, 30, tzinfo=timezone.utc).timestamp())
+    assert epoch_seconds(day) == day
+    assert epoch_seconds(day * 1000) == day
+    assert epoch_seconds(str(day)) == day
+    assert epoch_seconds("2024-10-30") == day
+    assert epoch_seconds("2024-10-30T00:00:00Z") == day
+    assert epoch_seconds("2024-10-30T02:00:00+0200") == day
+    assert epoch_seconds("soon") is None
+    assert epoch_seconds(None) is None
+
+@pytest.mark.parametrize(
+    "prepare",
+    [lambda raw: raw, normalize_ad_record, lambda raw: compact_ad(normalize_ad_record(raw))],
+    ids=["raw", "normalized", "compact"],
+)
+def test_columns_match_normalized_ads(prepare):
+    table = ad_columns([prepare(dict(raw)) for raw in RAW_ADS], chunk_size=2)
+    rows = table.to_pylist()
+    for raw, row in zip(RAW_ADS, rows):
+        ad = normalize_ad_record(raw)
+        assert row["ad_archive_id"] == ad["ad_archive_id"]
+        assert row["page_id"] == ad["page_id"]
+        assert row["page_name"] == ad["page_name"]
+        assert row["publisher_platform"] == ad["publisher_platform"]
+        assert row["categories"] == ad["categories"]
+        expected_start = epoch_seconds(ad["start_date"])
+        assert int(row["start_date"].timestamp()) == expected_start
+    assert [row["page_like_count"] for row in rows] == [120, 7, None]
+    assert rows[2]["end_date"] is None
+
+def test_filters_and_aggregates():
+    table = ad_columns(RAW_ADS)
+    assert filter_ads(table, platform="Instagram")["ad_archive_id"].to_pylist() == ["1", "2"]
+    assert filter_ads(table, start_after="2024-11-02")["ad_archive_id"].to_pylist() == ["2", "3"]
+    assert filter_ads(table, start_before="2024-11-02")["ad_archive_id"].to_pylist() == ["1", "2"]
+    assert filter_ads(table, end_before="2024-11-07")["ad_archive_id"].to_pylist() == ["1"]
+    assert filter_ads(table, category="POLITICAL").num_rows == 1
+
+    assert value_counts(table, "publisher_platform") == {"INSTAGRAM": 2, "FACEBOOK": 1, "MESSENGER": 1}
+    summary = summarize(table, top=1)
+    assert summary["ads"] == 3
+    assert summary["pages"] == 2
+    assert summary["page_likes"]["sum"] == 127
+    assert summary["top_pages"] == [{"page_id": "p1", "page_name": "Salon", "ads": 2}]
+
+def test_counts_outside_int64_are_null():
+    ads = [dict(RAW_ADS[0], page_like_count=count) for count in ("99999999999999999999", float("inf"), -(1 << 63))]
+    assert ad_columns(ads)["page_like_count"].to_pylist() == [None, None, -(1 << 63)]
+    assert [to_row(ad)["page_like_count"] for ad in ads] == [None, None, -(1 << 63)]
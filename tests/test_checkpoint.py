@@ -0,0 +1,100 @@
+import json
+
+import extractors.pipeline
+from extractors.pipeline import run_pipeline
+from utils.metrics import reset_metrics
+from utils.settings import finalize_settings
+
+class PagedBackend:
+    """
+    In-memory ads endpoint with ``per_query`` ads per country, paged with
+    ``after`` cursors like the live API.
+    """
+
+    def __init__(self, per_query):
+        self.per_query = per_query
+        self.requests = []
+
+    def get_json(self, url, params=None):
+        after = int(params.get("after", 0))
+        self.requests.append((params["country"], after))
+        rows = [
+            {"ad_archive_id": f"{params['country']}-{n}", "page_name": f"Page {n}"}
+            for n in range(after, min(after + params["limit"], self.per_query))
+        ]
+        page = {"data": rows}
+        if after + params["limit"] < self.per_query:
+            page["paging"] = {"cursors": {"after": str(after + params["limit"])}}
+        return page
+
+def _crash_after(monkeypatch, count):
+    passthrough = extractors.pipeline._with_media
+
+    def crashing(ads, downloader):
+        for n, ad in enumerate(passthrough(ads, downloader)):
+            if n == count:
+                raise RuntimeError("killed")
+            yield ad
+
+    monkeypatch.setattr(extractors.pipeline, "_with_media", crashing)
+
+def _settings(tmp_path, resume=False, **overrides):
+    return finalize_settings(
+        dict(
+            {
+                "output_path": "out.ndjson",
+                "output_format": "ndjson",
+                "stream": True,
+                "checkpoint_interval": 1e-6,
+                "resume": resume,
+                "download_media": False,
+                "http_cache": False,
+                "field_mapping": False,
+            },
+            **overrides,
+        ),
+        tmp_path,
+    )
+
+def _written_ids(tmp_path):
+    return [json.loads(line)["ad_archive_id"] for line in (tmp_path / "out.ndjson").read_text().splitlines()]
+
+def test_resumed_offline_run_continues_after_the_last_checkpoint(tmp_path, monkeypatch):
+    ads = [{"ad_archive_id": str(n), "page_name": f"Page {n}"} for n in range(20)]
+    (tmp_path / "in.ndjson").write_text("".join(json.dumps(ad) + "\n" for ad in ads))
+    settings = {"offline_input_path": "in.ndjson"}
+
+    with monkeypatch.context() as patch:
+        _crash_after(patch, 7)
+        assert run_pipeline(_settings(tmp_path, **settings)) == 1
+    assert _written_ids(tmp_path) == [str(n) for n in range(7)]
+    with (tmp_path / "out.ndjson").open("a") as output:
+        # A torn write longer than everything the resumed run writes.
+        output.write('{"ad_archive_id": "torn", "page_name": "' + "x" * 4096)
+
+    metrics = reset_metrics()
+    assert run_pipeline(_settings(tmp_path, resume=True, **settings)) == 0
+    assert _written_ids(tmp_path) == [str(n) for n in range(20)]
+    assert metrics.report()["stages"]["fetch"]["records"] == 13
+    assert not (tmp_path / "out.ndjson.checkpoint.sqlite3").exists()
+
+def test_resumed_live_run_skips_pages_already_written(tmp_path, monkeypatch):
+    settings = {
+        "live_mode": True,
+        "api_url": "http://backend.test/ads",
+        "search_terms": ["salon"],
+        "countries": ["US", "GB"],
+        "page_size": 10,
+        "max_items": 100,
+        "max_concurrency": 1,
+    }
+    first = PagedBackend(per_query=25)
+    with monkeypatch.context() as patch:
+        _crash_after(patch, 23)
+        assert run_pipeline(_settings(tmp_path, **settings), client=first) == 1
+
+    second = PagedBackend(per_query=25)
+    assert run_pipeline(_settings(tmp_path, resume=True, **settings), client=second) == 0
+    ids = _written_ids(tmp_path)
+    assert len(ids) == len(set(ids)) == 50
+    assert len(second.requests) < 6
@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+import utils.http_client
+from utils.http_client import ApiClient
+from utils.rate_limit import CircuitBreaker, CircuitOpenError
+
+URL = "http://ads.test/ads"
+
+def _half_open(reset_timeout=0.05):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=reset_timeout)
+    breaker.record_failure("ads.test/ads")
+    time.sleep(reset_timeout)
+    return breaker
+
+def test_failed_trial_reopens_and_successful_trial_closes():
+    breaker = _half_open()
+    assert breaker.allow("ads.test/ads")
+    assert breaker.state("ads.test/ads") == "half-open"
+    assert not breaker.allow("ads.test/ads")
+    breaker.record_failure("ads.test/ads")
+    assert breaker.state("ads.test/ads") == "open"
+
+    time.sleep(0.05)
+    assert breaker.allow("ads.test/ads")
+    breaker.record_success("ads.test/ads")
+    assert breaker.state("ads.test/ads") == "closed"
+
+def test_trial_that_never_reports_back_is_given_up_on():
+    breaker = _half_open()
+    assert breaker.allow("ads.test/ads")
+    assert not breaker.allow("ads.test/ads")
+    time.sleep(0.05)
+    assert breaker.allow("ads.test/ads")
+
+def test_client_releases_trial_on_non_http_errors(monkeypatch):
+    replies = [ValueError("not JSON"), {"data": []}]
+
+    def fake_get_json(url, params=None, timeout=None, session=None):
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    monkeypatch.setattr(utils.http_client, "http_get_json", fake_get_json)
+    breaker = _half_open(reset_timeout=0.2)
+    client = ApiClient(circuit_breaker=breaker)
+    with pytest.raises(ValueError):
+        client.get_json(URL)
+    assert breaker.state("ads.test/ads") == "open"
+    with pytest.raises(CircuitOpenError):
+        client.get_json(URL)
+
+    time.sleep(0.2)
+    assert client.get_json(URL) == {"data": []}
+    assert breaker.state("ads.test/ads") == "closed"
+    client.close()
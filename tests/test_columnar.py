@@ -0,0 +1,77 @@
+from datetime import datetime, timezone
+import json
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.ipc
+import pyarrow.parquet
+
+from extractors.pipeline import run_pipeline
+from utils.columnar import DEFAULT_PARTITION, ColumnarWriter
+from utils.settings import finalize_settings
+
+ADS = [
+    {
+        "ad_archive_id": str(n),
+        "page_name": f"Page {n % 3}",
+        "publisher_platform": ["FACEBOOK", "INSTAGRAM"][: n % 3],
+        "snapshot": {"body": {"text": "hi"}, "cta_text": ["Shop", "Book", None][n % 3], "images": []}
+        if n % 4
+        else None,
+        "start_date": [1730246400, "2024-11-02", "2024-11-05T10:00:00+0000", None, "soon"][n % 5],
+        "end_date": 1731024000000,
+        "categories": [f"C{n}"],
+    }
+    for n in range(11)
+]
+
+def _write(path, fmt):
+    with ColumnarWriter(path, fmt=fmt, row_group_size=3) as writer:
+        for ad in ADS:
+            writer.write(ad)
+
+def test_arrow_output_is_an_ipc_file_with_growing_dictionaries(tmp_path):
+    _write(tmp_path / "ads.arrow", "arrow")
+    _write(tmp_path / "ads.parquet", "parquet")
+    reader = pyarrow.ipc.open_file(tmp_path / "ads.arrow")
+    assert reader.num_record_batches == 4
+    table = reader.read_all()
+    assert table.to_pylist() == pyarrow.parquet.read_table(tmp_path / "ads.parquet").to_pylist()
+    assert table.column("categories").to_pylist() == [[f"C{n}"] for n in range(11)]
+    assert table.column("snapshot").to_pylist()[1]["cta_text"] == "Book"
+
+def test_dates_are_utc_timestamps(tmp_path):
+    _write(tmp_path / "ads.arrow", "arrow")
+    table = pyarrow.ipc.open_file(tmp_path / "ads.arrow").read_all()
+    assert table.schema.field("start_date").type == pa.timestamp("s", tz="UTC")
+    utc = timezone.utc
+    assert table.column("start_date").to_pylist()[:5] == [
+        datetime(2024, 10, 30, tzinfo=utc),
+        datetime(2024, 11, 2, tzinfo=utc),
+        datetime(2024, 11, 5, 10, tzinfo=utc),
+        None,
+        None,
+    ]
+    assert table.column("end_date").to_pylist()[0] == datetime(2024, 11, 8, tzinfo=utc)
+
+def test_offline_ads_are_not_partitioned_under_a_configured_country(tmp_path):
+    ads = [{"ad_archive_id": str(n), "page_name": f"Page {n}", "start_date": "2024-11-02"} for n in range(3)]
+    (tmp_path / "in.ndjson").write_text("".join(json.dumps(ad) + "\n" for ad in ads))
+    settings = finalize_settings(
+        {
+            "offline_input_path": "in.ndjson",
+            "output_path": "out",
+            "output_format": "parquet",
+            "countries": ["US"],
+            "search_terms": ["salon"],
+            "partition_by": ["country", "search_term", "date"],
+            "download_media": False,
+            "http_cache": False,
+        },
+        tmp_path,
+    )
+    assert run_pipeline(settings) == 0
+    (part,) = (tmp_path / "out").rglob("*.parquet")
+    partition = part.parent.relative_to(tmp_path / "out").parts
+    assert partition == (f"country={DEFAULT_PARTITION}", f"search_term={DEFAULT_PARTITION}", "date=2024-11-02")
@@ -0,0 +1,75 @@
+import random
+
+import pytest
+
+from extractors.creative_hash import CreativeClusterer, HammingIndex, cluster_blobs, cluster_id, hamming
+from extractors.media_store import MediaStore
+
+def _flip(value: int, bits) -> int:
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+def test_hamming_index_matches_brute_force():
+    rng = random.Random(7)
+    hashes = [rng.getrandbits(64) for _ in range(2000)]
+    index = HammingIndex(radius=4)
+    for i, value in enumerate(hashes):
+        index.add(value, str(i))
+
+    for _ in range(200):
+        base = rng.choice(hashes)
+        query = _flip(base, rng.sample(range(64), rng.randint(0, 6)))
+        expected = min((hamming(query, h) for h in hashes), default=None)
+        found = index.nearest(query)
+        if expected is None or expected > 4:
+            assert found is None
+        else:
+            assert found is not None and found[0] == expected
+
+def test_clusterer_groups_near_duplicates_and_keeps_ids_stable():
+    clusterer = CreativeClusterer(max_distance=4)
+    first = clusterer.assign(0xF0F0F0F0F0F0F0F0)
+    assert first == cluster_id(0xF0F0F0F0F0F0F0F0)
+    assert clusterer.assign(_flip(0xF0F0F0F0F0F0F0F0, [1, 9, 40])) == first
+    other = clusterer.assign(0x0F0F0F0F0F0F0F0F)
+    assert other != first
+
+    later = CreativeClusterer(max_distance=4)
+    later.add_known(0xF0F0F0F0F0F0F0F0, first)
+    assert later.assign(_flip(0xF0F0F0F0F0F0F0F0, [63])) == first
+
+def test_media_store_keeps_clusters_across_runs(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    ImageDraw = pytest.importorskip("PIL.ImageDraw")
+
+    def add_image(store, name, size, shade):
+        img = Image.new("RGB", (320, 240), (shade, 80, 160))
+        ImageDraw.Draw(img).rectangle([40, 40, 200, 120], fill=(250, 250, 0))
+        path = store.new_temp_file()
+        img.resize(size).save(path, "JPEG")
+        url = f"http://cdn.test/{name}.jpg"
+        store.add_file(url, path, name * 8, path.stat().st_size, ".jpg")
+        return url
+
+    store = MediaStore(tmp_path / "media")
+    try:
+        store.link("ad-1", add_image(store, "aa", (320, 240), 10), "aa" * 8)
+        store.link("ad-2", add_image(store, "bb", (160, 120), 10), "bb" * 8)
+        results = cluster_blobs(store.creative_hashes(), store.unclustered_blobs([".jpg"]), workers=1)
+        store.save_creatives(results)
+        clusters = store.creative_clusters(["ad-1", "ad-2"])
+        assert clusters["ad-1"] == clusters["ad-2"]
+        assert store.unclustered_blobs([".jpg"]) == []
+    finally:
+        store.close()
+
+    store = MediaStore(tmp_path / "media")
+    try:
+        store.link("ad-3", add_image(store, "cc", (240, 180), 12), "cc" * 8)
+        results = cluster_blobs(store.creative_hashes(), store.unclustered_blobs([".jpg"]), workers=1)
+        assert [sha256 for sha256, _, _ in results] == ["cc" * 8]
+        store.save_creatives(results)
+        assert store.creative_clusters(["ad-3"])["ad-3"] == clusters["ad-1"]
+    finally:
+        store.close()
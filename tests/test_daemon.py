@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
+
+import commands.daemon
+from main import parse_args
+from utils.metrics import get_metrics, in_context
+
+def test_each_job_run_has_its_own_metrics(tmp_path, monkeypatch):
+    both_running = threading.Barrier(2, timeout=5)
+
+    def run_pipeline(settings, client):
+        both_running.wait()
+        get_metrics().count("runs")
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pool.submit(in_context(get_metrics().count), "pages", len(settings["countries"][0])).result()
+        return 0
+
+    monkeypatch.setattr(commands.daemon, "run_pipeline", run_pipeline)
+    config = tmp_path / "settings.json"
+    config.write_text(json.dumps({"prometheus_textfile": "scraper.prom", "http_cache": False}))
+    jobs = tmp_path / "jobs.json"
+    jobs.write_text(
+        json.dumps(
+            {
+                "max_concurrent_jobs": 2,
+                "jobs": [
+                    {"name": "salon-pk", "search_term": "salon", "country": "PK"},
+                    {"name": "salon-usa", "search_term": "salon", "country": "USA"},
+                ],
+            }
+        )
+    )
+    args = parse_args(
+        ["--config", str(config), "serve", "--jobs", str(jobs), "--once", "--status-file", str(tmp_path / "status.json")]
+    )
+    assert commands.daemon.serve(args, tmp_path) == 0
+
+    for name, pages in (("salon-pk", 2), ("salon-usa", 3)):
+        lines = (tmp_path / f"scraper.{name}.prom").read_text().splitlines()
+        assert f'fb_ads_scraper_events{{job="{name}",event="runs"}} 1' in lines
+        assert f'fb_ads_scraper_events{{job="{name}",event="pages"}} {pages}' in lines
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+import extractors.pipeline
+from extractors.dedup import MATCHED_QUERIES_FIELD, AdDeduplicator
+from extractors.pipeline import run_pipeline
+from utils.columnar import SOURCE_FIELD
+from utils.settings import finalize_settings
+
+MODES = ["memory", "disk", "bloom"]
+
+def _dedup(tmp_path, mode, stream=False):
+    settings = finalize_settings(
+        {"dedup": mode, "output_path": "out.json", "stream": stream, "dedup_capacity": 1000},
+        tmp_path,
+    )
+    return AdDeduplicator.from_settings(settings, SOURCE_FIELD)
+
+def _ad(ad_id, term="salon", country="US"):
+    return {"ad_archive_id": ad_id, SOURCE_FIELD: {"search_term": term, "country": country}}
+
+@pytest.mark.parametrize("mode", MODES)
+def test_repeated_copies_are_dropped(tmp_path, mode):
+    dedup = _dedup(tmp_path, mode)
+    ads = [_ad("1"), _ad("2"), _ad("1", country="GB"), {"page_name": "no id"}, _ad("2"), _ad("3")]
+    kept = list(dedup.filter(ads))
+    assert [ad.get("ad_archive_id") for ad in kept] == ["1", "2", None, "3"]
+    assert dedup.duplicates == 2
+    assert len(dedup.index) == 3
+    dedup.close()
+    assert not (tmp_path / "out.json.dedup.sqlite3").exists()
+
+def test_batch_runs_merge_the_queries_of_every_copy(tmp_path):
+    dedup = _dedup(tmp_path, "memory")
+    ads = [_ad("1"), _ad("1", country="GB"), _ad("1", term="spa"), _ad("1", country="GB")]
+    (kept,) = list(dedup.filter(ads))
+    assert kept[MATCHED_QUERIES_FIELD] == [
+        {"search_term": "salon", "country": "US"},
+        {"search_term": "salon", "country": "GB"},
+        {"search_term": "spa", "country": "US"},
+    ]
+    dedup.close()
+
+@pytest.mark.parametrize("mode, stream", [("memory", True), ("disk", False), ("bloom", False)])
+def test_memory_bounded_runs_keep_the_first_query(tmp_path, mode, stream):
+    dedup = _dedup(tmp_path, mode, stream=stream)
+    (kept,) = list(dedup.filter([_ad("1"), _ad("1", country="GB")]))
+    assert kept[MATCHED_QUERIES_FIELD] == [{"search_term": "salon", "country": "US"}]
+    dedup.close()
+
+@pytest.mark.parametrize("mode", MODES)
+def test_seeded_ads_are_dropped(tmp_path, mode):
+    dedup = _dedup(tmp_path, mode)
+    assert dedup.seed([_ad("1"), _ad("2"), _ad("1"), "not an ad"]) == 2
+    assert [ad["ad_archive_id"] for ad in dedup.filter([_ad("2"), _ad("3"), _ad("1")])] == ["3"]
+    dedup.close()
+
+@pytest.mark.parametrize("mode", MODES)
+def test_resumed_run_drops_copies_of_ads_written_before_the_crash(tmp_path, monkeypatch, mode):
+    ids = [str(n) for n in range(10)] + ["2", "3"] + [str(n) for n in range(10, 15)]
+    (tmp_path / "in.ndjson").write_text(
+        "".join(json.dumps({"ad_archive_id": ad_id, "page_name": f"Page {ad_id}"}) + "\n" for ad_id in ids)
+    )
+
+    def settings(resume):
+        return finalize_settings(
+            {
+                "offline_input_path": "in.ndjson",
+                "output_path": "out.ndjson",
+                "output_format": "ndjson",
+                "stream": True,
+                "dedup": mode,
+                "checkpoint_interval": 1e-6,
+                "resume": resume,
+                "download_media": False,
+                "http_cache": False,
+                "field_mapping": False,
+            },
+            tmp_path,
+        )
+
+    passthrough = extractors.pipeline._with_media
+
+    def crashing(ads, downloader):
+        for n, ad in enumerate(passthrough(ads, downloader)):
+            if n == 7:
+                raise RuntimeError("killed")
+            yield ad
+
+    with monkeypatch.context() as patch:
+        patch.setattr(extractors.pipeline, "_with_media", crashing)
+        assert run_pipeline(settings(resume=False)) == 1
+    assert run_pipeline(settings(resume=True)) == 0
+    lines = (tmp_path / "out.ndjson").read_text().splitlines()
+    assert [json.loads(line)["ad_archive_id"] for line in lines] == [str(n) for n in range(15)]
@@ -0,0 +1,85 @@
+import copy
+import random
+
+import pytest
+
+from conftest import SRC_DIR
+from extractors.ad_parser import normalize_ad_record
+from extractors.field_schema import SchemaNormalizer, load_field_mapping
+
+ADS_LIBRARY = {
+    "ad_archive_id": "1",
+    "page_id": "p",
+    "page_name": "Salon",
+    "page_profile_uri": "https://facebook.com/salon",
+    "publisher_platform": ["facebook"],
+    "snapshot": {"body": {"text": "Book now"}, "cta_text": "Go", "images": [{"original_image_url": "i.jpg"}]},
+    "page_like_count": 3,
+    "start_date": 1700000000,
+    "end_date": None,
+    "categories": ["HOUSING"],
+}
+PROXY = {
+    "id": "2",
+    "page": {"id": "p", "name": "Salon", "url": "https://facebook.com/salon", "like_count": 4},
+    "placement": {"platforms": ["instagram"]},
+    "ad_delivery_start_time": 1700000000,
+    "ad_text": "Book now",
+    "cta": {"title": "Go"},
+    "creatives": [{"image_url": "i.jpg"}],
+    "categories": "HOUSING",
+}
+VALUES = [None, "", 0, 7, "str", [], ["a", 1], {}, {"text": "x"}, {"title": "t"}, [{"url": "u"}], [{"image_url": "v"}, "junk"]]
+PATHS = [
+    "ad_archive_id", "id", "adid", "page_id", "page", "page.id", "page.name", "page.url", "page.like_count",
+    "publisher_platform", "publisher_platforms", "placement", "placement.platforms", "placement.publisher_platform",
+    "snapshot", "snapshot.body", "snapshot.body.text", "snapshot.body.message", "snapshot.cta_text", "snapshot.cta",
+    "snapshot.images", "cta", "cta.title", "ad_text", "message", "creatives", "categories", "ad_reached_countries",
+    "start_date", "end_date", "ad_delivery_start_time", "page_like_count",
+]
+
+def _detected(base):
+    normalizer = SchemaNormalizer(load_field_mapping(SRC_DIR / "config" / "field_mapping.json"))
+    for _ in range(normalizer.sample_size):
+        normalizer(copy.deepcopy(base))
+    assert normalizer.profile is not None
+    return normalizer
+
+def _put(raw, path, value):
+    keys = path.split(".")
+    for key in keys[:-1]:
+        if not isinstance(raw.get(key), dict):
+            raw[key] = {}
+        raw = raw[key]
+    raw[keys[-1]] = value
+
+def _outcome(normalize, raw):
+    try:
+        return normalize(copy.deepcopy(raw))
+    except Exception as err:
+        return type(err)
+
+@pytest.mark.parametrize("base, profile", [(ADS_LIBRARY, "ads_library"), (PROXY, "proxy_nested_page")])
+def test_detects_the_profile_of_the_input(base, profile):
+    assert _detected(base).profile.name == profile
+
+@pytest.mark.parametrize(
+    "path, value",
+    [("snapshot.body", "Book now"), ("publisher_platform", "facebook"), ("snapshot", "gone"), ("snapshot.cta", {"text": "Go"})],
+)
+def test_shape_mismatches_fall_back_to_the_generic_normalizer(path, value):
+    normalizer = _detected(ADS_LIBRARY)
+    raw = copy.deepcopy(ADS_LIBRARY)
+    _put(raw, path, value)
+    assert _outcome(normalizer, raw) == _outcome(normalize_ad_record, raw)
+
+@pytest.mark.parametrize("base", [ADS_LIBRARY, PROXY])
+def test_fast_path_matches_generic_normalizer_on_mutated_records(base):
+    normalizer = _detected(base)
+    rng = random.Random(7)
+    for _ in range(3000):
+        raw = copy.deepcopy(base)
+        for _ in range(rng.randrange(1, 4)):
+            _put(raw, rng.choice(PATHS), copy.deepcopy(rng.choice(VALUES)))
+        assert _outcome(normalizer, raw) == _outcome(normalize_ad_record, raw), raw
+    assert normalizer.fallbacks < 3000
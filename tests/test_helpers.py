@@ -0,0 +1,43 @@
+import json
+import math
+
+import pytest
+
+from utils.helpers import JSON_BACKENDS, json_loads, set_json_backend
+
+DOCUMENTS = [
+    b'{"id": "123", "spend": {"lower_bound": 100, "upper_bound": 199}, "ratio": 0.25}',
+    b'[9223372036854775807, -9223372036854775808, 18446744073709551615, 1.5e300, -0.0]',
+    '{"page_name": "Café ☕", "languages": ["fr", "en"], "active": true, "end": null}'.encode("utf-8"),
+    '["Caf\\u00e9", "\\ud83d\\ude00"]',
+    b'[1e400, -1e400]',
+    b'{"impressions": NaN, "reach": Infinity}',
+]
+
+@pytest.fixture(params=JSON_BACKENDS)
+def backend(request):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    elif request.param == "msgspec":
+        pytest.importorskip("msgspec")
+    assert set_json_backend(request.param) == request.param
+    yield request.param
+    set_json_backend("auto")
+
+@pytest.mark.parametrize("data", DOCUMENTS)
+def test_backends_decode_the_same_values(backend, data):
+    decoded = json_loads(data)
+    expected = json.loads(data)
+    assert json.dumps(decoded) == json.dumps(expected)
+    if isinstance(expected, dict) and "impressions" in expected:
+        assert math.isnan(decoded["impressions"])
+
+@pytest.mark.parametrize("data", [b'{"id": 1', b"", "[1, 2,]", b'{"body": "\xff"}'])
+def test_malformed_input_raises_value_error(backend, data):
+    with pytest.raises(ValueError):
+        json_loads(data)
+
+def test_integers_wider_than_64_bits_are_exact_without_orjson(backend):
+    if backend == "orjson":
+        pytest.skip("orjson decodes them as floats, as documented")
+    assert json_loads(b"[18446744073709551616, -9223372036854775809]") == [2**64, -(2**63) - 1]
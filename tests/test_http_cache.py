@@ -0,0 +1,46 @@
+import sqlite3
+import threading
+
+from utils.http_cache import ResponseCache
+from utils.metrics import reset_metrics
+
+def test_hits_and_misses_are_counted_in_run_metrics(tmp_path):
+    metrics = reset_metrics()
+    cache = ResponseCache(tmp_path)
+    assert cache.get("http://api.test/ads", {"q": "a"}) is None
+    cache.set("http://api.test/ads", {"q": "a"}, {"data": [1]})
+    assert cache.get("http://api.test/ads", {"q": "a"}) == {"data": [1]}
+    cache.close()
+    assert metrics.counters["http_cache_hits"] == 1
+    assert metrics.counters["http_cache_misses"] == 1
+    assert metrics.counters["http_cache_stores"] == 1
+
+def test_close_closes_the_connection_of_every_thread(tmp_path):
+    cache = ResponseCache(tmp_path)
+    used, closed = threading.Barrier(4), threading.Event()
+    still_open = []
+
+    def worker():
+        cache.get("http://api.test/ads")
+        conn = cache._local.conn
+        used.wait()
+        closed.wait()
+        try:
+            conn.execute("SELECT 1")
+            still_open.append(conn)
+        except sqlite3.ProgrammingError:
+            pass
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    used.wait()
+    cache.close()
+    closed.set()
+    for thread in threads:
+        thread.join()
+
+    assert still_open == []
+    # A closed cache reconnects if it is used again.
+    assert cache.get("http://api.test/ads") is None
+    cache.close()
@@ -0,0 +1,56 @@
+import gzip
+import json
+
+import pytest
+
+from utils.json_stream import iter_json_records
+
+RECORDS = [{"id": n, "body": f"ad {n}"} for n in range(3)]
+BIG = {"id": "big", "body": "x" * (1 << 17), "data": {"nested": [1, 2]}}
+
+def _ndjson(records):
+    return "".join(json.dumps(record) + "\n" for record in records)
+
+def _write(path, text):
+    if path.suffix == ".gz":
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        path.write_text(text, encoding="utf-8")
+    return path
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        json.dumps(RECORDS),
+        json.dumps({"paging": {"after": "x"}, "data": RECORDS, "extra": 1}),
+        _ndjson(RECORDS),
+    ],
+    ids=["array", "data-object", "ndjson"],
+)
+@pytest.mark.parametrize("name", ["in.json", "in.json.gz", "in.txt"])
+def test_layouts_are_detected_from_the_content(tmp_path, text, name):
+    path = _write(tmp_path / name, text)
+    assert list(iter_json_records(path, chunk_size=1024)) == RECORDS
+
+@pytest.mark.parametrize("name", ["in.ndjson", "in.jsonl.gz", "in.json"])
+def test_ndjson_records(tmp_path, name):
+    path = _write(tmp_path / name, "\n" + _ndjson(RECORDS) + "\n")
+    assert list(iter_json_records(path)) == RECORDS
+    raw = list(iter_json_records(path, decode=False))
+    assert [json.loads(r) if isinstance(r, str) else r for r in raw] == RECORDS
+
+@pytest.mark.parametrize("text", [json.dumps(RECORDS[0]), json.dumps(RECORDS[0]) + "\n"], ids=["bare", "newline"])
+def test_single_record_without_an_ndjson_extension(tmp_path, text):
+    path = _write(tmp_path / "in.json", text)
+    assert list(iter_json_records(path)) == RECORDS[:1]
+
+@pytest.mark.parametrize("name", ["in.json", "in.json.gz", "in.ndjson"])
+def test_first_record_larger_than_a_read_chunk(tmp_path, name):
+    path = _write(tmp_path / name, _ndjson([BIG] + RECORDS))
+    assert list(iter_json_records(path, chunk_size=1024)) == [BIG] + RECORDS
+
+def test_invalid_ndjson_line_is_reported(tmp_path):
+    path = _write(tmp_path / "in.json", _ndjson(RECORDS[:2]) + "{oops\n")
+    with pytest.raises(ValueError, match="line 3"):
+        list(iter_json_records(path))
@@ -0,0 +1,69 @@
+import json
+
+import requests
+
+import extractors.pipeline
+from extractors.live_fetcher import iter_queries_concurrently
+from extractors.pipeline import EXIT_PARTIAL, run_pipeline
+from utils.metrics import get_metrics, reset_metrics
+from utils.settings import finalize_settings
+
+class FlakyBackend:
+    """
+    In-memory ads endpoint that serves one page per country and fails every
+    request for the countries in ``down``.
+    """
+
+    def __init__(self, down=()):
+        self.down = set(down)
+
+    def get_json(self, url, params=None):
+        if params["country"] in self.down:
+            raise requests.ConnectionError(f"{params['country']} is down")
+        return {"data": [{"id": f"{params['country']}-{n}"} for n in range(3)]}
+
+def _fetch(backend, queries, failed=None):
+    records = iter_queries_concurrently(
+        backend,
+        "http://backend.test/ads",
+        queries,
+        params_for=lambda query: {"country": query[1]},
+        max_items=10,
+        page_size=10,
+        max_workers=2,
+        failed=failed,
+    )
+    return sorted(record["id"] for record in records)
+
+def test_failed_queries_are_collected_and_counted():
+    reset_metrics()
+    failed = []
+    queries = [("a", "US"), ("a", "GB"), ("a", "PK")]
+    assert _fetch(FlakyBackend(down={"GB"}), queries, failed) == ["PK-0", "PK-1", "PK-2", "US-0", "US-1", "US-2"]
+    assert failed == [("a", "GB")]
+    counters = get_metrics().report()["counters"]
+    assert counters["live_queries"] == 3
+    assert counters["live_queries_failed"] == 1
+
+def test_pipeline_exits_non_zero_when_live_queries_failed(tmp_path, monkeypatch):
+    def fake_fetch_ads_live(settings, client=None, checkpoint=None, failed=None):
+        failed.append(("salon", "GB"))
+        yield {"ad_archive_id": "1", "page_name": "Page 1"}
+
+    monkeypatch.setattr(extractors.pipeline, "fetch_ads_live", fake_fetch_ads_live)
+    output = tmp_path / "out.ndjson"
+    settings = finalize_settings(
+        {
+            "live_mode": True,
+            "api_url": "http://backend.test/ads",
+            "output_path": str(output),
+            "output_format": "ndjson",
+            "stream": True,
+            "download_media": False,
+            "http_cache": False,
+            "field_mapping": False,
+        },
+        tmp_path,
+    )
+    assert run_pipeline(settings) == EXIT_PARTIAL
+    assert [json.loads(line)["ad_archive_id"] for line in output.read_text().splitlines()] == ["1"]
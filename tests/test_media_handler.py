@@ -0,0 +1,17 @@
+import sqlite3
+
+from extractors.media_handler import MediaDownloader
+
+def test_task_errors_outside_the_download_are_counted_as_failed(tmp_path, monkeypatch, caplog):
+    downloader = MediaDownloader(tmp_path / "media", workers=2, retries=0)
+
+    def broken_lookup(url):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(downloader.store, "lookup", broken_lookup)
+    downloader.submit_ad(
+        {"ad_archive_id": "1", "snapshot": {"images": [{"original_image_url": "http://img.test/a.jpg"}]}}
+    )
+    stats = downloader.close()
+    assert stats.failed == 1
+    assert "database is locked" in caplog.text
@@ -0,0 +1,40 @@
+import json
+
+from extractors.media_store import MANIFEST_FILENAME, MediaStore
+
+def _store_blob(store, url, sha256):
+    tmp = store.new_temp_file()
+    tmp.write_bytes(sha256.encode())
+    store.add_file(url, tmp, sha256, len(sha256), ".jpg")
+
+def test_links_are_batched_and_flushed_before_reads(tmp_path):
+    store = MediaStore(tmp_path)
+    _store_blob(store, "http://img.test/a.jpg", "aa" * 32)
+    for n in range(MediaStore.LINK_BATCH + 5):
+        store.link(str(n), "http://img.test/a.jpg?oh=sig", "aa" * 32)
+    assert len(store._pending_links) == 5
+    assert len(store.manifest()) == MediaStore.LINK_BATCH + 5
+    store.link("late", "http://img.test/a.jpg", "aa" * 32)
+    store.close()
+
+    reopened = MediaStore(tmp_path)
+    assert "late" in reopened.manifest()
+    reopened.close()
+
+def test_exported_manifest_holds_only_this_runs_ads(tmp_path):
+    first = MediaStore(tmp_path)
+    _store_blob(first, "http://img.test/a.jpg", "aa" * 32)
+    first.link("1", "http://img.test/a.jpg", "aa" * 32)
+    first.export_manifest()
+    first.close()
+
+    second = MediaStore(tmp_path)
+    _store_blob(second, "http://img.test/b.jpg", "bb" * 32)
+    second.link("2", "http://img.test/b.jpg", "bb" * 32)
+    second.link("2", "http://img.test/a.jpg", "aa" * 32)
+    second.export_manifest()
+    assert json.loads((tmp_path / MANIFEST_FILENAME).read_text()) == {
+        "2": [f"blobs/aa/{'aa' * 32}.jpg", f"blobs/bb/{'bb' * 32}.jpg"]
+    }
+    assert set(second.manifest()) == {"1", "2"}
+    second.close()
@@ -0,0 +1,48 @@
+import json
+import threading
+import time
+
+from extractors.pipeline import run_pipeline
+from utils.metrics import reset_metrics, timed_stage
+from utils.settings import finalize_settings
+
+def _slow(records, seconds):
+    for record in records:
+        time.sleep(seconds)
+        yield record
+
+def test_nested_stages_are_charged_their_own_time():
+    metrics = reset_metrics()
+    fetched = timed_stage(_slow(range(5), 0.01), "fetch")
+    list(timed_stage(_slow(fetched, 0.02), "normalize"))
+    stages = metrics.report()["stages"]
+    assert 0.05 <= stages["fetch"]["wall_seconds"] < 0.09
+    assert 0.1 <= stages["normalize"]["wall_seconds"] < 0.14
+    assert stages["normalize"]["records"] == 5
+
+def test_stages_are_timed_by_default_on_any_thread(tmp_path):
+    ads = [{"ad_archive_id": str(n), "page_name": f"Page {n}"} for n in range(50)]
+    (tmp_path / "in.ndjson").write_text("".join(json.dumps(ad) + "\n" for ad in ads))
+    settings = finalize_settings(
+        {
+            "offline_input_path": "in.ndjson",
+            "output_path": "out.ndjson",
+            "output_format": "ndjson",
+            "stream": True,
+            "download_media": False,
+            "http_cache": False,
+        },
+        tmp_path,
+    )
+    metrics = reset_metrics()
+    statuses = []
+    worker = threading.Thread(target=lambda: statuses.append(run_pipeline(settings)))
+    worker.start()
+    worker.join()
+
+    assert statuses == [0]
+    stages = metrics.report()["stages"]
+    for name in ("fetch", "normalize", "write"):
+        assert stages[name]["wall_seconds"] > 0
+        assert stages[name]["records"] == 50
+        assert stages[name]["samples"] == 0
@@ -0,0 +1,64 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import SRC_DIR
+from utils.settings import load_settings, settings_cache_dir
+from utils.startup_bench import parse_importtime
+
+def test_offline_run_does_not_import_http_media_or_arrow(tmp_path):
+    (tmp_path / "in.json").write_text(json.dumps([{"ad_archive_id": "1", "page_name": "Salon"}]))
+    script = (
+        "import sys, runpy\n"
+        f"sys.path.insert(0, {str(SRC_DIR)!r})\n"
+        f"sys.argv = ['main.py', '--no-settings-cache', '--offline-input', {str(tmp_path / 'in.json')!r},"
+        f" '--output', {str(tmp_path / 'out.ndjson')!r}]\n"
+        "try:\n"
+        f"    runpy.run_path({str(SRC_DIR / 'main.py')!r}, run_name='__main__')\n"
+        "except SystemExit as exit:\n"
+        "    assert not exit.code, exit.code\n"
+        "print(' '.join(sorted(m for m in ('requests', 'pyarrow', 'PIL', 'multiprocessing', 'msgspec')"
+        " if m in sys.modules)))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
+    assert (tmp_path / "out.ndjson").read_text().count("\n") == 1
+
+def test_settings_cache_is_reused_until_the_file_changes(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    config = tmp_path / "settings.json"
+    config.write_text(json.dumps({"max_items": 7, "output_path": "out.json"}))
+
+    fresh = load_settings(str(config), tmp_path, use_cache=True)
+    assert fresh == load_settings(str(config), tmp_path)
+    assert fresh["output_path"] == str(tmp_path / "out.json")
+    [cached] = settings_cache_dir().iterdir()
+    assert load_settings(str(config), tmp_path, use_cache=True) == fresh
+
+    config.write_text(json.dumps({"max_items": 8}))
+    os.utime(config, ns=(0, 0))
+    assert load_settings(str(config), tmp_path, use_cache=True)["max_items"] == 8
+    assert json.loads(cached.read_text())["settings"]["max_items"] == 8
+
+def test_settings_that_log_warnings_are_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    config = tmp_path / "settings.json"
+    config.write_text(json.dumps({"json_backend": "yaml"}))
+    assert load_settings(str(config), tmp_path, use_cache=True)["json_backend"] == "auto"
+    assert not settings_cache_dir().exists()
+
+def test_parse_importtime_reads_depth_and_times():
+    stderr = "\n".join(
+        [
+            "import time: self [us] | cumulative | imported package",
+            "import time:       120 |        120 |   utils.metrics",
+            "2024-01-01 00:00:00 [INFO] main: a log line",
+            "import time:       900 |       1020 | utils.helpers",
+        ]
+    )
+    timings = parse_importtime(stderr)
+    assert [(t.module, t.depth, t.self_us, t.cumulative_us) for t in timings] == [
+        ("utils.metrics", 1, 120, 120),
+        ("utils.helpers", 0, 900, 1020),
+    ]
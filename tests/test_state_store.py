@@ -0,0 +1,67 @@
+import json
+
+from extractors.pipeline import run_pipeline
+from extractors.state_store import SeenAdsStore, iter_delta_ads, scope_key
+from utils.settings import finalize_settings
+
+ADS = [{"ad_archive_id": str(n), "page_name": f"Page {n}"} for n in range(3)]
+
+def _deltas(path, ads, commit=True, scope="scope"):
+    store = SeenAdsStore(path)
+    try:
+        out = [(ad["ad_archive_id"], ad["_delta"]) for ad in iter_delta_ads(ads, store, scope)]
+        if commit:
+            store.commit_run()
+    finally:
+        store.close()
+    return out
+
+def test_committed_run_reports_only_changes_next_time(tmp_path):
+    path = tmp_path / "state.sqlite3"
+    assert _deltas(path, ADS) == [("0", "new"), ("1", "new"), ("2", "new")]
+    changed = [ADS[0], dict(ADS[1], page_name="Renamed")]
+    assert _deltas(path, changed) == [("1", "changed"), ("2", "ended")]
+    assert _deltas(path, changed) == []
+
+def test_uncommitted_or_abandoned_run_is_rolled_back(tmp_path):
+    path = tmp_path / "state.sqlite3"
+    assert _deltas(path, ADS, commit=False) == [("0", "new"), ("1", "new"), ("2", "new")]
+
+    store = SeenAdsStore(path)
+    deltas = iter_delta_ads(ADS, store, "scope")
+    next(deltas)
+    deltas.close()
+    store.close()
+
+    assert _deltas(path, ADS) == [("0", "new"), ("1", "new"), ("2", "new")]
+
+def _incremental_settings(tmp_path, output_path, stream=True):
+    (tmp_path / "in.json").write_text(json.dumps(ADS))
+    return finalize_settings(
+        {
+            "offline_input_path": "in.json",
+            "output_path": str(output_path),
+            "output_format": "ndjson" if stream else "json",
+            "stream": stream,
+            "incremental": True,
+            "state_path": "state.sqlite3",
+            "download_media": False,
+            "http_cache": False,
+            "field_mapping": False,
+        },
+        tmp_path,
+    )
+
+def test_pipeline_commits_state_only_after_the_output_is_written(tmp_path):
+    unwritable = tmp_path / "taken"
+    unwritable.mkdir()
+    # A batch run reads every delta before it fails to write any of them.
+    settings = _incremental_settings(tmp_path, unwritable, stream=False)
+    state, scope = tmp_path / "state.sqlite3", scope_key(settings)
+    assert run_pipeline(settings) == 1
+    assert _deltas(state, ADS, commit=False, scope=scope) == [("0", "new"), ("1", "new"), ("2", "new")]
+
+    output = tmp_path / "out.ndjson"
+    assert run_pipeline(_incremental_settings(tmp_path, output)) == 0
+    assert output.read_text().count("\n") == 3
+    assert _deltas(state, ADS, commit=False, scope=scope) == []
@@ -0,0 +1,102 @@
+import datetime
+
+from extractors.live_fetcher import WindowPlanner, WindowQuery, iter_queries_concurrently, window_days
+
+class CappedBackend:
+    """
+    In-memory ads endpoint returning at most ``cap`` ads per query, like the
+    Ads Library, with the ``after`` cursor paging of the live fetcher.
+    """
+
+    def __init__(self, ads_per_day, cap, countries=("US", "GB")):
+        self.cap = cap
+        self.requests = 0
+        start = datetime.date(2024, 1, 1)
+        self.ads = [
+            {"id": f"{day}-{n}", "day": (start + datetime.timedelta(days=day)).isoformat(), "country": countries[n % len(countries)]}
+            for day, count in enumerate(ads_per_day)
+            for n in range(count)
+        ]
+
+    def get_json(self, url, params=None):
+        self.requests += 1
+        rows = [
+            ad
+            for ad in self.ads
+            if params.get("date_min", "0") <= ad["day"] <= params.get("date_max", "9")
+            and params["country"] in ("ALL", ad["country"])
+        ][: self.cap]
+        after = int(params.get("after", 0))
+        page = {"data": rows[after : after + params["limit"]]}
+        if after + params["limit"] < len(rows):
+            page["paging"] = {"cursors": {"after": str(after + params["limit"])}}
+        return page
+
+def _run(backend, planner, queries, max_items):
+    def params_for(query):
+        return {"country": query[1], "date_min": query[2], "date_max": query[3]}
+
+    records = iter_queries_concurrently(
+        backend,
+        "http://backend.test/ads",
+        queries,
+        params_for=params_for,
+        max_items=max_items,
+        page_size=10,
+        max_workers=4,
+        split=planner.split,
+    )
+    return [record["id"] for record in records]
+
+def test_unsaturated_window_is_not_split():
+    planner = WindowPlanner(result_cap=50)
+    assert planner.split(WindowQuery("a", "US", "2024-01-01", "2024-01-31"), 49) == []
+    assert planner.splits == 0
+
+def test_saturated_window_splits_into_covering_windows():
+    planner = WindowPlanner(result_cap=50)
+    parent = WindowQuery("a", "US", "2024-01-01", "2024-01-31")
+    children = planner.split(parent, 50)
+    assert len(children) >= 2
+    assert children[0].date_min == parent.date_min and children[-1].date_max == parent.date_max
+    assert sum(window_days((c.date_min, c.date_max)) for c in children) == 31
+
+def test_windows_are_sized_from_learned_density():
+    planner = WindowPlanner(result_cap=100, fill=0.5)
+    # Sibling windows showed about 10 ads a day, so 5-day windows fit half the cap.
+    planner.split(WindowQuery("a", "US", "2024-01-01", "2024-01-10"), 100 - 1)
+    children = planner.split(WindowQuery("a", "US", "2024-02-01", "2024-02-29"), 100)
+    assert {window_days((c.date_min, c.date_max)) for c in children[:-1]} == {5}
+
+def test_single_day_splits_per_country_then_reports_truncation():
+    planner = WindowPlanner(result_cap=10, split_countries=["US", "GB"])
+    day = WindowQuery("a", "ALL", "2024-01-01", "2024-01-01")
+    assert [c.country for c in planner.split(day, 10)] == ["US", "GB"]
+    assert planner.split(day._replace(country="US"), 10) == []
+    assert planner.truncated == 1
+
+def test_adaptive_fetch_collects_every_ad_past_the_cap():
+    ads_per_day = [2] * 20 + [30] * 5 + [4] * 20
+    backend = CappedBackend(ads_per_day, cap=40)
+    planner = WindowPlanner(result_cap=40, split_countries=["US", "GB"])
+    queries = planner.plan([("a", "ALL")], "2024-01-01", "2024-02-14")
+    ids = _run(backend, planner, queries, max_items=1000)
+    assert len(ids) == len(set(ids))
+    assert set(ids) == {ad["id"] for ad in backend.ads}
+    assert planner.truncated == 0
+    # 35 pages for the windows kept, plus 4 for each of the 5 split ones.
+    assert backend.requests <= 55
+
+def test_without_planner_results_stop_at_the_cap():
+    backend = CappedBackend([30] * 5, cap=40)
+    ids = list(
+        iter_queries_concurrently(
+            backend,
+            "http://backend.test/ads",
+            [("a", "ALL")],
+            params_for=lambda query: {"country": query[1]},
+            max_items=1000,
+            page_size=10,
+        )
+    )
+    assert len(ids) == 40
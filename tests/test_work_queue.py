@@ -0,0 +1,130 @@
+import argparse
+import time
+
+import commands.sharding
+from utils.metrics import get_metrics
+from utils.settings import finalize_settings
+from utils.work_queue import WorkQueue
+
+def _shards(*keys):
+    payloads = ({"search_term": key, "country": "US", "date_min": "", "date_max": ""} for key in keys)
+    return [{"key": key, "payload": payload} for key, payload in zip(keys, payloads)]
+
+def _queue(tmp_path, max_attempts=3):
+    # One instance per worker, as if each were its own process.
+    return WorkQueue(tmp_path / "queue.sqlite3", max_attempts=max_attempts)
+
+def test_enqueue_skips_shards_already_queued(tmp_path):
+    queue = _queue(tmp_path)
+    assert queue.enqueue(_shards("a", "b")) == 2
+    assert queue.enqueue([{"key": "b", "payload": {"search_term": "changed"}}] + _shards("c")) == 1
+    assert queue.counts()["pending"] == 3
+    assert [queue.lease("w").payload["search_term"] for _ in range(3)] == ["a", "b", "c"]
+    queue.close()
+
+def test_expired_lease_is_leased_again(tmp_path):
+    first, second = _queue(tmp_path), _queue(tmp_path)
+    first.enqueue(_shards("a"))
+    assert first.lease("first", lease_seconds=0.05) is not None
+    assert second.lease("second") is None
+
+    time.sleep(0.06)
+    taken = second.lease("second")
+    assert (taken.key, taken.attempts) == ("a", 2)
+    first.close()
+    second.close()
+
+def test_worker_that_lost_its_lease_cannot_finish_the_shard(tmp_path):
+    first, second = _queue(tmp_path), _queue(tmp_path)
+    first.enqueue(_shards("a"))
+    lost = first.lease("first", lease_seconds=0.05)
+    time.sleep(0.06)
+    taken = second.lease("second")
+
+    assert not first.extend(lost, "first")
+    assert not first.complete(lost, "first")
+    assert not first.fail(lost, "first", "too late")
+    assert second.complete(taken, "second")
+    assert second.counts()["done"] == 1
+    first.close()
+    second.close()
+
+def test_fail_gives_up_after_max_attempts_until_retried(tmp_path):
+    queue = _queue(tmp_path, max_attempts=2)
+    queue.enqueue(_shards("a"))
+    assert queue.fail(queue.lease("w"), "w", "boom")
+    assert queue.counts()["pending"] == 1
+    assert queue.fail(queue.lease("w"), "w", "boom")
+    assert queue.counts()["failed"] == 1
+    assert queue.lease("w") is None
+
+    assert queue.retry_failed() == 1
+    assert queue.lease("w").attempts == 1
+    queue.close()
+
+def test_shard_whose_leases_keep_expiring_is_failed(tmp_path):
+    queue = _queue(tmp_path, max_attempts=2)
+    queue.enqueue(_shards("a"))
+    for _ in range(2):
+        assert queue.lease("crashing", lease_seconds=0.01) is not None
+        time.sleep(0.02)
+    assert queue.lease("w") is None
+    assert queue.counts()["failed"] == 1
+    queue.close()
+
+def test_lease_keeper_renews_the_lease_while_held(tmp_path):
+    first, second = _queue(tmp_path), _queue(tmp_path)
+    first.enqueue(_shards("a", "b"))
+    shard = first.lease("first", lease_seconds=0.1)
+    with first.hold(shard, "first", lease_seconds=0.1) as keeper:
+        time.sleep(0.3)
+        assert second.lease("second").key == "b"
+    assert not keeper.lost
+    assert first.complete(shard, "first")
+    first.close()
+    second.close()
+
+def test_lease_keeper_notices_a_lost_lease(tmp_path):
+    first, second = _queue(tmp_path), _queue(tmp_path)
+    first.enqueue(_shards("a"))
+    shard = first.lease("first", lease_seconds=0.05)
+    time.sleep(0.06)
+    assert second.lease("second") is not None
+    with first.hold(shard, "first", lease_seconds=0.06) as keeper:
+        time.sleep(0.1)
+    assert keeper.lost
+    first.close()
+    second.close()
+
+def test_worker_completes_and_fails_shards(tmp_path, monkeypatch):
+    class Client:
+        def close(self):
+            pass
+
+    def run_pipeline(settings, client, offline_fallback):
+        get_metrics().count("runs")
+        return 1 if settings["search_terms"] == ["fail"] else 0
+
+    reports = []
+    monkeypatch.setattr(commands.sharding.ApiClient, "from_settings", lambda settings: Client())
+    monkeypatch.setattr(commands.sharding, "run_pipeline", run_pipeline)
+    monkeypatch.setattr(
+        commands.sharding, "write_metrics", lambda settings, metrics, status: reports.append(metrics.report())
+    )
+    settings = finalize_settings(
+        {
+            "live_mode": True,
+            "api_url": "http://backend.test/ads",
+            "queue_path": "queue.sqlite3",
+            "shard_max_attempts": 1,
+            "http_cache": False,
+        },
+        tmp_path,
+    )
+    queue = _queue(tmp_path)
+    queue.enqueue(_shards("ok", "fail"))
+    args = argparse.Namespace(queue=None, worker_id="w", max_shards=None, wait=False, poll_interval=0.1)
+    assert commands.sharding.work(args, settings) == 1
+    assert queue.counts() == {"pending": 0, "leased": 0, "done": 1, "failed": 1}
+    assert [report["counters"] for report in reports] == [{"runs": 1}, {"runs": 1}]
+    queue.close()